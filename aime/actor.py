@@ -1,8 +1,185 @@
+import asyncio
+import inspect
+import json
 import re
-from typing import Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
 from langfuse import observe
 from aime.config import config
+from aime.context_budget import ContextBudgetManager
+from aime.knowledge_index import KnowledgeIndex
 from aime.llm_client import llm_client
+from aime.metrics import metrics
+from aime.tool_schema import function_schema
+
+# 行動の後にモデルが架空の観察を書き始めたら生成を止める
+REACT_STOP_SEQUENCES = ["\n観察:"]
+
+# 複数行の行動のうち、2行目以降の `ツール名[引数]` 1行分
+_ACTION_LINE = re.compile(r"^(\w+)\[(.*)\]$")
+
+# ツールが例外を送出せず、エラーを観察結果の文字列として返した場合の書き出し
+TOOL_ERROR_PATTERN = re.compile(r"^(エラー[:：]|.{0,40}エラー(が発生しました|（リトライ不可）))")
+
+# 観察結果を知識インデックスに登録しないツール（外部から情報を得ないツールと、インデックス自体の検索）
+_UNINDEXED_TOOLS = {"finish", "reflect", "update_progress", "search_knowledge"}
+
+_tool_executor = None
+_tool_executor_lock = threading.Lock()
+
+
+def _get_tool_executor() -> ThreadPoolExecutor:
+    """1ターン内の複数ツールを同時実行するための、全Actorで共有するスレッドプールを返す（初回呼び出し時に生成）"""
+    global _tool_executor
+    with _tool_executor_lock:
+        if _tool_executor is None:
+            _tool_executor = ThreadPoolExecutor(max_workers=config.actor_tool_workers, thread_name_prefix="actor-tool")
+        return _tool_executor
+
+
+class _TurnLengthEstimator:
+    """
+    打ち切らずに最後まで生成されたActorのターンの長さ（トークン数）の平均を、全Actorで共有して保持する
+    （早期停止で生成させずに済んだトークン数の推定に使う。計測値がない間はconfigの目安を使う）
+    """
+
+    def __init__(self):
+        self._total = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, tokens: int):
+        with self._lock:
+            self._total += tokens
+            self._count += 1
+
+    def estimate(self) -> int:
+        with self._lock:
+            if self._count:
+                return round(self._total / self._count)
+        return config.actor_typical_turn_tokens
+
+
+_turn_lengths = _TurnLengthEstimator()
+
+
+@dataclass
+class ToolAction:
+    """1ターン内の1つのツール呼び出し"""
+
+    name: Optional[str]
+    arg: Any
+    call: Optional[Dict[str, str]] = None  # Function Callingの場合の履歴用の呼び出し情報（id, name, arguments）
+
+
+# Function Callingモードでツールを呼び出さずにテキストだけを返した場合の観察
+NO_TOOL_CALL_OBSERVATION = (
+    "エラー: ツールが呼び出されませんでした。調査を続ける場合は必要なツールを、"
+    "タスクが完了した場合は finish ツールを呼び出して報告してください。"
+)
+
+# Function Callingモードでのfinishツールの定義（報告の形式をスキーマで強制する）
+FINISH_TOOL_SCHEMA = {
+    "type": "function",
+    "function": {
+        "name": "finish",
+        "description": "全ての作業が完了した、またはタスクの遂行が不可能だと判断した際に呼び出す最終報告ツール。これを呼び出すとタスクが完了する。",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "status": {"type": "string", "enum": ["success", "failure"], "description": "タスクの成否"},
+                "message": {"type": "string", "description": "成功時は成果物、失敗時は失敗理由"},
+            },
+            "required": ["status", "message"],
+        },
+    },
+}
+
+
+class ReActStreamParser:
+    """
+    ストリーミング中のLLM出力を逐次解析し、「行動:」行が完結した時点を検出する。
+    `ツール名[引数]` の括弧（JSON文字列内の括弧は除く）が閉じて改行が来た時点、
+    または括弧のない行動が改行で終わった時点で完結とみなす。
+    multi_action=Trueの場合は、続く行が `ツール名[` で始まる限り次の行動として読み進め、
+    行動でない行が始まった時点（その行の先頭）で完結とみなす。
+    """
+
+    def __init__(self, multi_action: bool = False):
+        self.multi_action = multi_action
+        self.text = ""
+        self._pos = 0
+        self._action_start = None
+        self._has_tool_name = False
+        self._depth = 0
+        self._opened = False
+        self._closed = False
+        self._in_string = False
+        self._escaped = False
+        self._line_start = None  # 2つ目以降の行動かどうかを判定中の行の先頭位置
+        self.complete_at = None  # 行動が完結したテキスト上の位置
+
+    def tail(self) -> str:
+        """行動の完結より後に生成されたテキスト（ReActループでは使われずに捨てられる部分）を返す"""
+        return self.text[self.complete_at :] if self.complete_at is not None else ""
+
+    def feed(self, delta: str) -> bool:
+        """差分テキストを追加し、行動が完結していればTrueを返す"""
+        self.text += delta
+        if self._action_start is None:
+            # 「行動:」がチャンクの境界で分割されている場合に備えて少し手前から探す
+            index = self.text.find("行動:", max(0, self._pos - 2))
+            if index < 0:
+                self._pos = len(self.text)
+                return False
+            self._action_start = self._pos = index + len("行動:")
+
+        if self.complete_at is not None:
+            return True
+        for ch in self.text[self._pos :]:
+            self._pos += 1
+            if self._closed:
+                if ch == "\n":
+                    if not self.multi_action:
+                        self.complete_at = self._pos
+                        return True
+                    # 次の行が別の行動かどうかを判定する
+                    self._line_start = self._pos
+                    self._opened = self._closed = self._has_tool_name = False
+            elif self._line_start is not None and not self._opened:
+                if ch == "[" and self._has_tool_name:
+                    self._opened, self._depth = True, 1
+                elif ch.isalnum() or ch == "_":
+                    self._has_tool_name = True
+                else:
+                    self.complete_at = self._line_start
+                    return True
+            elif not self._opened:
+                if ch == "[":
+                    self._opened, self._depth = True, 1
+                elif ch == "\n" and self._has_tool_name:
+                    self.complete_at = self._pos
+                    return True
+                elif not ch.isspace():
+                    self._has_tool_name = True
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "[":
+                self._depth += 1
+            elif ch == "]":
+                self._depth -= 1
+                self._closed = self._depth == 0
+        return False
 
 
 class DynamicActor:
@@ -11,7 +188,15 @@ class DynamicActor:
     ReActフレームワークに基づいて動作する。
     """
 
-    def __init__(self, subtask: Dict[str, Any], persona: str, knowledge: str, tools: Dict[str, Any], progress_manager):
+    def __init__(
+        self,
+        subtask: Dict[str, Any],
+        persona: str,
+        knowledge: str,
+        tools: Dict[str, Any],
+        progress_manager,
+        knowledge_index: Optional[KnowledgeIndex] = None,
+    ):
         """
         Dynamic Actorを初期化
 
@@ -21,16 +206,37 @@ class DynamicActor:
             knowledge: 知識ベース
             tools: 利用可能なツール
             progress_manager: 進捗管理モジュール
+            knowledge_index: 観察結果を登録する、この実行の知識インデックス（Noneの場合は登録しない）
         """
         self.subtask = subtask
         self.persona = persona
         self.knowledge = knowledge
         self.progress_manager = progress_manager
+        self.knowledge_index = knowledge_index
         self.history = []
         self.max_turns = config.actor_max_turns
+        self.turns_used = 0
+
+        # マルチターン形式用: 固定のシステムプロンプトと、追記のみで更新する履歴メッセージ
+        self._system_prompt = None
+        self._history_messages: List[Dict[str, str]] = []
 
-        # ツールをフラット化
-        self.available_tools = tools
+        # 履歴のトークン予算管理（予算超過時に古い観察を圧縮する）
+        self.context_budget = ContextBudgetManager(subtask["description"])
+
+        # ストリーミングモードの計測値
+        self.stream_ttfts: List[float] = []
+        self.stream_early_stops = 0
+        self.wasted_tokens = 0  # 行動行より後に生成され、捨てられたトークン数
+        self.avoided_tokens = 0  # 行動行で受信を打ち切ったことで生成させずに済んだトークン数（推定）
+
+        # Function Callingモードで、ツール呼び出しがなくテキスト解析にフォールバックしたターン数
+        self.text_fallback_turns = 0
+        self._tool_schemas = None
+        self._tool_descriptions_text = None
+
+        # ツールをフラット化（update_progress は全Actor共通で、進捗管理モジュールへの中間報告に使う）
+        self.available_tools = {**tools, "update_progress": self._update_progress}
 
     def _update_progress(self, message: str) -> str:
         """
@@ -40,21 +246,83 @@ class DynamicActor:
         self.progress_manager.add_task_log(self.subtask["id"], message)
         return "進捗が正常に報告されました。"
 
-    def _build_prompt(self, current_turn: int):
-        """LLMに送るプロンプトを構築する"""
+    def _tool_descriptions(self) -> str:
+        """プロンプトに埋め込むツール説明を構築する（Actorごとに1回だけ生成する）"""
+        if self._tool_descriptions_text is not None:
+            return self._tool_descriptions_text
         finish_desc = """finish(report: str): 全ての作業が完了した際に呼び出す最終報告ツール。引数には必ず {"status": "success" or "failure", "message": "成果物 or 失敗理由"} という形式のJSON文字列を指定してください。"""
 
         tool_descriptions = "\n".join(
             [f"- {name}: {func.__doc__.strip()}" for name, func in self.available_tools.items() if name != "finish"]
         )
-        tool_descriptions += f"\n- finish: {finish_desc}"
+        self._tool_descriptions_text = tool_descriptions + f"\n- finish: {finish_desc}"
+        return self._tool_descriptions_text
+
+    def warm_up(self):
+        """
+        前提知識以外のプロンプトの固定部分（ツールの説明、Function Calling用のスキーマ）を先に構築しておく
+        （依存タスクの完了前にActorを用意しておく場合に使う。前提知識は set_knowledge() で後から渡す）
+        """
+        self._tool_descriptions()
+        if self.use_function_calling:
+            self._get_tool_schemas()
+
+    def set_knowledge(self, knowledge: str):
+        """前提知識を差し替える（実行開始前にのみ呼び出す）"""
+        self.knowledge = knowledge
+        self._system_prompt = None
+
+    @property
+    def use_function_calling(self) -> bool:
+        return config.actor_tool_mode == "function"
+
+    @property
+    def max_tools_per_turn(self) -> int:
+        return max(1, config.actor_max_tools_per_turn)
+
+    def _action_rule(self) -> str:
+        """行動原則のうち、ツールの呼び出し方を指示する1文を返す"""
+        if self.use_function_calling:
+            if self.max_tools_per_turn == 1:
+                return "思考を記述した後、実行するツールを一つだけ関数呼び出し（function call）で呼び出してください。"
+            return (
+                "思考を記述した後、実行するツールを関数呼び出し（function call）で呼び出してください。"
+                f"互いに依存しない調査（複数の検索など）は、最大{self.max_tools_per_turn}個まで同時に呼び出すと並行して実行されます。"
+            )
+        if self.max_tools_per_turn == 1:
+            return "`ツール名[引数]` の形式で、実行するツールを一つだけ記述してください。"
+        return (
+            "`ツール名[引数]` の形式で、実行するツールを記述してください。"
+            f"互いに依存しない調査（複数の検索など）は、1行に1つずつ最大{self.max_tools_per_turn}行まで並べると並行して実行されます"
+            "（finishは単独で呼び出してください）。"
+        )
+
+    def _knowledge_rule(self) -> str:
+        """行動原則のうち、知識インデックスの検索を促す1項目を返す（ツールがない場合は空）"""
+        if "search_knowledge" not in self.available_tools:
+            return ""
+        return "5.  **既存の情報の確認:** Web検索の前に、他のタスクが既に調べた情報がないか`search_knowledge`ツールで確認してください。\n"
+
+    def _get_tool_schemas(self) -> List[Dict[str, Any]]:
+        """利用可能なツールのFunction Calling用の定義を返す（Actorごとに1回だけ生成する）"""
+        if self._tool_schemas is None:
+            self._tool_schemas = [
+                FINISH_TOOL_SCHEMA if name == "finish" else function_schema(name, func)
+                for name, func in self.available_tools.items()
+            ]
+        return self._tool_schemas
+
+    def _build_prompt(self, current_turn: int):
+        """LLMに送るプロンプトを構築する（履歴を含む単一メッセージ形式）"""
+        tool_descriptions = self._tool_descriptions()
 
-        history_str = ""
         if not self.history:
             history_str = "まだ行動していません。最初の思考と行動を始めてください。\n"
         else:
-            for turn in self.history:
-                history_str += f"思考: {turn['thought']}\n行動: {turn['action_str']}\n観察: {turn['observation']}\n\n"
+            history_str = "".join(
+                f"思考: {turn['thought']}\n行動: {turn['action_str']}\n観察: {turn['observation']}\n\n"
+                for turn in self.history
+            )
 
         prompt = f"""あなたは、**{self.persona}** という役割を持つ、非常に有能な専門家AIです。
 
@@ -76,10 +344,10 @@ class DynamicActor:
 **重要: 現在 {current_turn} / {self.max_turns} ターン目です。残りターン数が少ない場合（目安として半分以上経過した場合）は、新たな調査よりも、これまでの情報で結論をまとめて `finish` ツールで報告することを最優先してください。考えすぎるのは禁物です。**
 
 1.  **思考:** 現在のタスクと履歴を分析し、次に何をすべきかを日本語で具体的に記述してください。
-2.  **行動:** `ツール名[引数]` の形式で、実行するツールを一つだけ記述してください。
+2.  **行動:** {self._action_rule()}
 3.  **内省:** **具体的な行動の前に計画を立てたり、状況を整理したりする必要がある場合は、`reflect`ツールを使ってください。** これは思考を次のステップに進めるための重要なプロセスです。
 4.  **進捗報告:** タスクの実行中に重要な中間結果や問題を発見した場合は、`update_progress`ツールを使って状況を報告してください。
-
+{self._knowledge_rule()}
 **最重要指示:**
 タスクを達成するために必要な情報がすべて集まった、あるいはタスクの遂行が不可能だと判断したら、**必ず `finish` ツールをJSON形式の引数で呼び出してください。**
 例 (成功): `finish[{{"status": "success", "message": "# 調査結果..."}}]`
@@ -90,8 +358,80 @@ class DynamicActor:
 思考:"""
         return prompt.strip()
 
+    def _build_system_prompt(self) -> str:
+        """
+        マルチターン形式のシステムプロンプトを構築する。
+        ターンごとに変わる情報を含まないため、全ターンで同一のプレフィックスとなりプロンプトキャッシュが効く。
+        """
+        if self._system_prompt is not None:
+            return self._system_prompt
+
+        if self.use_function_calling:
+            # ツールの定義はスキーマとして別途渡すため、プロンプトには含めない
+            tools_section = ""
+            history_note = "これまでの思考とツール呼び出しはあなた自身の発言として、ツールの実行結果はツールの応答として会話に含まれます。"
+            finish_rule = """**必ず `finish` ツールを呼び出してください。**
+成功時は status に "success"、message に成果物を、失敗時は status に "failure"、message に失敗理由を指定します。"""
+        else:
+            tools_section = f"""
+# 利用可能なツール
+{self._tool_descriptions()}
+"""
+            history_note = "これまでの思考と行動はあなた自身の発言として、ツールの実行結果は「観察:」で始まるメッセージとして会話に含まれます。"
+            finish_rule = """**必ず `finish` ツールをJSON形式の引数で呼び出してください。**
+例 (成功): `finish[{"status": "success", "message": "# 調査結果..."}]`
+例 (失敗): `finish[{"status": "failure", "message": "情報が見つかりませんでした。"}]`"""
+
+        self._system_prompt = f"""あなたは、**{self.persona}** という役割を持つ、非常に有能な専門家AIです。
+
+# タスク
+「{self.subtask["description"]}」
+
+# 前提知識
+{self.knowledge if self.knowledge else "利用可能な前提知識はありません。"}
+{tools_section}
+---
+**あなたの行動原則:**
+あなたの目的は、上記タスクを効率的に達成することです。以下の思考プロセスに従い、行動してください。
+{history_note}
+
+**重要: 各ターンの最後に現在のターン数が示されます。残りターン数が少ない場合（目安として半分以上経過した場合）は、新たな調査よりも、これまでの情報で結論をまとめて `finish` ツールで報告することを最優先してください。考えすぎるのは禁物です。**
+
+1.  **思考:** 現在のタスクと履歴を分析し、次に何をすべきかを日本語で具体的に記述してください。
+2.  **行動:** {self._action_rule()}
+3.  **内省:** **具体的な行動の前に計画を立てたり、状況を整理したりする必要がある場合は、`reflect`ツールを使ってください。** これは思考を次のステップに進めるための重要なプロセスです。
+4.  **進捗報告:** タスクの実行中に重要な中間結果や問題を発見した場合は、`update_progress`ツールを使って状況を報告してください。
+{self._knowledge_rule()}
+**最重要指示:**
+タスクを達成するために必要な情報がすべて集まった、あるいはタスクの遂行が不可能だと判断したら、{finish_rule}"""
+        return self._system_prompt
+
+    def _build_turn_trailer(self, current_turn: int) -> str:
+        """マルチターン形式で毎ターン末尾に付ける短い指示を構築する"""
+        opening = "" if self.history else "まだ行動していません。最初の思考と行動を始めてください。\n"
+        if self.use_function_calling:
+            return f"{opening}現在 {current_turn} / {self.max_turns} ターン目です。次に取るべきあなたの思考を簡潔に記述し、ツールを呼び出してください。"
+        return f"{opening}現在 {current_turn} / {self.max_turns} ターン目です。次に取るべきあなたの思考を記述してください。\n思考:"
+
+    def _build_messages(self, current_turn: int) -> List[Dict[str, str]]:
+        """
+        LLMに送るメッセージリストを構築する
+
+        multi_turnモードでは「固定のシステムプロンプト → 追記のみの履歴 → 短いターン指示」の順に並べ、
+        前ターンまでのメッセージがそのままプレフィックスとして再利用されるようにする。
+        Function Callingモードではツール呼び出しと応答をメッセージとして渡すため、常にこの形式を使う。
+        """
+        if config.actor_prompt_mode != "multi_turn" and not self.use_function_calling:
+            return [{"role": "user", "content": self._build_prompt(current_turn)}]
+
+        return [
+            {"role": "system", "content": self._build_system_prompt()},
+            *self._history_messages,
+            {"role": "user", "content": self._build_turn_trailer(current_turn)},
+        ]
+
     def _parse_llm_output(self, response_text: str):
-        """LLMの出力から思考と行動を抽出する"""
+        """LLMの出力から思考と行動（複数行の場合は行動のリスト）を抽出する"""
         thought_match = re.search(r"思考:(.*?)行動:", response_text, re.DOTALL)
         action_match = re.search(r"行動:(.*)", response_text, re.DOTALL)
 
@@ -105,75 +445,369 @@ class DynamicActor:
         action_str = action_match.group(1).strip() if action_match else ""
 
         if not action_str:
-            return thought, None, None
+            return thought, [ToolAction(None, None)]
+
+        if self.max_tools_per_turn > 1:
+            # 先頭から連続する `ツール名[引数]` 行が2つ以上あれば、複数の行動として扱う
+            lines = []
+            for line in action_str.splitlines():
+                line_match = _ACTION_LINE.match(line.strip())
+                if not line_match:
+                    break
+                lines.append(ToolAction(line_match.group(1), line_match.group(2).strip()))
+            if len(lines) > 1:
+                return thought, lines
 
         tool_name_match = re.match(r"(\w+)", action_str)
         if not tool_name_match:
-            return thought, action_str, "無効な行動形式です。"
+            return thought, [ToolAction(action_str, "無効な行動形式です。")]
 
         tool_name = tool_name_match.group(1)
 
         arg_match = re.search(r"\[(.*)\]", action_str, re.DOTALL)
         arg = arg_match.group(1).strip() if arg_match else ""
 
-        return thought, tool_name, arg
+        return thought, [ToolAction(tool_name, arg)]
 
-    @observe(name="Actor-Execution")
-    def run(self) -> str:
+    @staticmethod
+    def _parse_tool_call(tool_call) -> ToolAction:
         """
-        ReActループを実行してサブタスクを遂行する
+        構造化されたツール呼び出しから、ツール名・引数・履歴用の呼び出し情報を取り出す
 
-        Returns:
-            タスク実行の結果
+        引数がJSONとして解釈できない場合は、生の文字列をそのまま単一の引数として渡す。
+        finishの引数は、Plannerが解析する {"status", "message"} 形式のJSON文字列に変換する。
         """
-        for i in range(self.max_turns):
-            prompt = self._build_prompt(current_turn=i + 1)
-
-            response = llm_client.completion(
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-            )
+        tool_name = tool_call.function.name
+        raw_arguments = tool_call.function.arguments or "{}"
+        try:
+            arg = json.loads(raw_arguments)
+        except json.JSONDecodeError:
+            arg = raw_arguments
+        if tool_name == "finish" and isinstance(arg, dict):
+            arg = json.dumps(arg, ensure_ascii=False)
+        call = {"id": tool_call.id, "name": tool_name, "arguments": raw_arguments}
+        return ToolAction(tool_name, arg, call)
+
+    @staticmethod
+    def _format_arg(arg) -> str:
+        """ログと履歴に表示するための引数の文字列表現"""
+        return json.dumps(arg, ensure_ascii=False) if isinstance(arg, dict) else str(arg)
+
+    def _format_actions(self, actions: List[ToolAction]) -> str:
+        """行動のリストを `ツール名[引数]` の行で表す"""
+        return "\n".join(f"{action.name}[{self._format_arg(action.arg)}]" for action in actions)
+
+    def _prepare_turn(self, turn: int, response_text: str, tool_calls: List[Any] = None):
+        """
+        LLMの応答を補完・解析し、ターンのログを表示する
 
-            response_text = response.choices[0].message.content
+        Returns:
+            (思考, 行動のリスト)
+        """
+        if tool_calls:
+            # 構造化されたツール呼び出しがあればそれを使う（本文は思考として扱う）
+            thought = (response_text or "").strip()
+            actions = [self._parse_tool_call(tool_call) for tool_call in tool_calls]
+        elif self.use_function_calling and "行動:" not in (response_text or ""):
+            # ツール呼び出しがない応答は完了とみなさず、次のターンでツールを呼び出すよう観察で伝える
+            thought = (response_text or "").strip()
+            actions = []
+        else:
+            response_text = response_text or ""
+            if self.use_function_calling:
+                self.text_fallback_turns += 1
             # LLMの出力形式を安定させるための補完
             if "行動:" not in response_text:
                 # 行動がない場合は、タスク完了とみなし、最後の思考を要約させる
                 response_text += f"\n行動: finish[{response_text.strip()}]"
 
-            thought, tool_name, arg = self._parse_llm_output(response_text)
+            thought, actions = self._parse_llm_output(response_text)
+
+        log_message = [
+            f"\n[Actor Turn {turn}/{self.max_turns}] - Task ID: {self.subtask['id']}",
+            f"  🤔 思考: {thought}",
+            *(f"  ⚡ 行動: {action.name}[{self._format_arg(action.arg)}]" for action in actions),
+        ]
+        if not actions:
+            log_message.append("  ⚡ 行動: （ツール呼び出しなし）")
+        print("\n".join(log_message))
+        return thought, actions
+
+    def _is_finish(self, actions: List[ToolAction]) -> bool:
+        """行動がタスク完了（finish）かどうかを判定する（finishは単独で呼び出された場合のみ有効）"""
+        if len(actions) == 1 and actions[0].name == "finish" and "finish" in self.available_tools:
+            print("  [TOOL] finish: タスク完了。最終成果物を返します。")
+            return True
+        return False
+
+    def _skip_reason(self, index: int, action: ToolAction) -> Optional[str]:
+        """複数の行動のうち実行しないものについて、その理由を観察として返す"""
+        if index >= self.max_tools_per_turn:
+            return f"1ターンで実行できるツールは最大{self.max_tools_per_turn}個のため、この行動は実行されませんでした。"
+        if action.name == "finish":
+            return "finishは他のツールと同時には実行できません。他のツールの結果を確認してから、finishを単独で呼び出してください。"
+        return None
+
+    def _call_tool(self, tool_name: str, arg) -> str:
+        """ツールを実行して観察結果を返す（引数が辞書の場合はキーワード引数として渡す）"""
+        if tool_name not in self.available_tools:
+            print(f"  [ERROR] '{tool_name}' というツールは存在しません。")
+            metrics.inc("aime_tool_calls_total", tool="(unknown)", outcome="error")
+            return f"エラー: '{tool_name}' というツールは存在しません。利用可能なツールリストを確認してください。"
+
+        started = time.perf_counter()
+        try:
+            tool_function = self.available_tools[tool_name]
+            observation = tool_function(**arg) if isinstance(arg, dict) else tool_function(arg)
+        except Exception as e:
+            observation = f"ツール実行中にエラーが発生しました: {e}"
+        self._record_tool_metrics(tool_name, started, observation)
+        print(f"  👀 観察: {str(observation)[:300]}...")
+        return observation
+
+    async def _acall_tool(self, tool_name: str, arg) -> str:
+        """ツールを非同期に実行して観察結果を返す（同期ツールはスレッドで実行する）"""
+        if tool_name not in self.available_tools:
+            return self._call_tool(tool_name, arg)
+
+        tool_function = self.available_tools[tool_name]
+        args, kwargs = ((), arg) if isinstance(arg, dict) else ((arg,), {})
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(tool_function):
+                observation = await tool_function(*args, **kwargs)
+            else:
+                observation = await asyncio.to_thread(tool_function, *args, **kwargs)
+        except Exception as e:
+            observation = f"ツール実行中にエラーが発生しました: {e}"
+        self._record_tool_metrics(tool_name, started, observation)
+        print(f"  👀 観察: {str(observation)[:300]}...")
+        return observation
+
+    @staticmethod
+    def _record_tool_metrics(tool_name: str, started: float, observation):
+        """ツール呼び出しの所要時間と成否を記録する（エラーを文字列で返すツールもエラーとして数える）"""
+        outcome = "error" if TOOL_ERROR_PATTERN.match(str(observation)) else "success"
+        metrics.inc("aime_tool_calls_total", tool=tool_name, outcome=outcome)
+        metrics.observe("aime_tool_duration_seconds", time.perf_counter() - started, tool=tool_name)
+
+    def _run_actions(self, actions: List[ToolAction]) -> List[str]:
+        """
+        1ターン分の行動を実行し、行動ごとの観察結果を返す
+
+        行動が複数ある場合は共有スレッドプールで同時に実行する。
+        """
+        if not actions:
+            return [NO_TOOL_CALL_OBSERVATION]
+        if len(actions) == 1:
+            return [self._call_tool(actions[0].name, actions[0].arg)]
+
+        executor = _get_tool_executor()
+        pending = [
+            reason if (reason := self._skip_reason(i, action)) is not None
+            else executor.submit(self._call_tool, action.name, action.arg)
+            for i, action in enumerate(actions)
+        ]
+        return [item.result() if not isinstance(item, str) else item for item in pending]
+
+    async def _arun_actions(self, actions: List[ToolAction]) -> List[str]:
+        """_run_actionsの非同期版（複数の行動はイベントループ上で同時に実行する）"""
+        if not actions:
+            return [NO_TOOL_CALL_OBSERVATION]
+        if len(actions) == 1:
+            return [await self._acall_tool(actions[0].name, actions[0].arg)]
+
+        async def run_action(index: int, action: ToolAction) -> str:
+            if (reason := self._skip_reason(index, action)) is not None:
+                return reason
+            return await self._acall_tool(action.name, action.arg)
+
+        return list(await asyncio.gather(*(run_action(i, action) for i, action in enumerate(actions))))
+
+    def _combine_observations(self, actions: List[ToolAction], observations: List[str]) -> str:
+        """行動ごとの観察結果を、履歴に記録する1つの観察にまとめる"""
+        if len(observations) == 1:
+            return observations[0]
+        return "\n\n".join(
+            f"[{i}] {action.name}[{self._format_arg(action.arg)}]\n{observation}"
+            for i, (action, observation) in enumerate(zip(actions, observations), start=1)
+        )
 
-            log_message = [
-                f"\n[Actor Turn {i + 1}/{self.max_turns}] - Task ID: {self.subtask['id']}",
-                f"  🤔 思考: {thought}",
-                f"  ⚡ 行動: {tool_name}[{arg}]",
+    def _record_turn(self, thought: str, actions: List[ToolAction], observations: List[str]):
+        """1ターン分の思考・行動・観察を履歴に追加する"""
+        turn = {
+            "thought": thought,
+            "action_str": self._format_actions(actions) or "（ツール呼び出しなし）",
+            "observation": self._combine_observations(actions, observations),
+        }
+        if actions and all(action.call is not None for action in actions):
+            turn["tool_calls"] = [action.call for action in actions]
+            turn["tool_observations"] = [str(observation) for observation in observations]
+        self.history.append(turn)
+        self._history_messages.extend(self._turn_messages(turn))
+        self._index_observations(actions, observations)
+
+    def _index_observations(self, actions: List[ToolAction], observations: List[str]):
+        """外部から得た観察結果を知識インデックスに登録し、他のタスクが search_knowledge で検索できるようにする"""
+        if self.knowledge_index is None:
+            return
+        for action, observation in zip(actions, observations):
+            observation = str(observation)
+            if action.name in _UNINDEXED_TOOLS or action.name not in self.available_tools or TOOL_ERROR_PATTERN.match(observation):
+                continue
+            self.knowledge_index.add(f"タスク{self.subtask['id']} {action.name}[{self._format_arg(action.arg)}]", observation)
+
+    @staticmethod
+    def _turn_messages(turn: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """マルチターン形式で1ターン分を表すメッセージを返す"""
+        if tool_calls := turn.get("tool_calls"):
+            # 構造化されたツール呼び出しは、assistantのtool_callsとtoolロールの応答の組で表す
+            if turn.get("compacted"):
+                # 圧縮後はまとめた観察を最初の応答に載せる（全ての呼び出しに応答が必要なため残りは短い注記にする）
+                contents = [str(turn["observation"])] + ["（観察結果は最初の応答にまとめて記載しています）"] * (len(tool_calls) - 1)
+            else:
+                contents = turn["tool_observations"]
+            return [
+                {
+                    "role": "assistant",
+                    "content": turn["thought"] or None,
+                    "tool_calls": [
+                        {
+                            "id": call["id"],
+                            "type": "function",
+                            "function": {"name": call["name"], "arguments": call["arguments"]},
+                        }
+                        for call in tool_calls
+                    ],
+                },
+                *(
+                    {"role": "tool", "tool_call_id": call["id"], "content": content}
+                    for call, content in zip(tool_calls, contents)
+                ),
             ]
-            print("\n".join(log_message))
-
-            if tool_name in self.available_tools:
-                if tool_name == "finish":
-                    print("  [TOOL] finish: タスク完了。最終成果物を返します。")
-                    # 引数（arg）が最終成果物そのものになる
-                    return arg if arg else "成果物が生成されませんでした。"
+        return [
+            {"role": "assistant", "content": f"思考: {turn['thought']}\n行動: {turn['action_str']}"},
+            {"role": "user", "content": f"観察: {turn['observation']}"},
+        ]
+
+    def _compact_history(self):
+        """履歴がトークン予算を超えていれば古い観察を圧縮する"""
+        if self.context_budget.compact(self.history):
+            # 圧縮したターン以降のメッセージだけが変わる（プレフィックスの再利用は圧縮時点まで）
+            self._history_messages = [message for turn in self.history for message in self._turn_messages(turn)]
+
+    def _complete_turn(self, current_turn: int) -> tuple:
+        """1ターン分のLLM呼び出しを行い、(応答テキスト, 構造化されたツール呼び出しのリスト) を返す"""
+        messages = self._build_messages(current_turn=current_turn)
+        if self.use_function_calling:
+            response = llm_client.completion(
+                messages=messages,
+                temperature=0.1,
+                tools=self._get_tool_schemas(),
+                tool_choice="auto",
+                call_site="actor_turn",
+            )
+            message = response.choices[0].message
+            return message.content, message.tool_calls or []
 
-                tool_function = self.available_tools[tool_name]
-                try:
-                    observation = tool_function(arg)
-                except Exception as e:
-                    observation = f"ツール実行中にエラーが発生しました: {e}"
+        parser = ReActStreamParser(multi_action=self.max_tools_per_turn > 1)
+        if not config.actor_streaming:
+            response = llm_client.completion(messages=messages, temperature=0.1, call_site="actor_turn")
+            response_text = response.choices[0].message.content
+            parser.feed(response_text)
+            self._record_tail(parser)
+            return response_text, []
+
+        # 行動行が完結した時点で受信を打ち切り、すぐにツール実行へ進む
+        result = llm_client.stream_completion(
+            messages=messages,
+            temperature=0.1,
+            stop=REACT_STOP_SEQUENCES,
+            stop_when=parser.feed,
+            call_site="actor_turn",
+        )
+        self._record_stream(result, parser)
+        return result.text, []
+
+    async def _acomplete_turn(self, current_turn: int) -> tuple:
+        """_complete_turnの非同期版"""
+        messages = self._build_messages(current_turn=current_turn)
+        if self.use_function_calling:
+            response = await llm_client.acompletion(
+                messages=messages,
+                temperature=0.1,
+                tools=self._get_tool_schemas(),
+                tool_choice="auto",
+                call_site="actor_turn",
+            )
+            message = response.choices[0].message
+            return message.content, message.tool_calls or []
 
-                print(f"  👀 観察: {str(observation)[:300]}...")
+        parser = ReActStreamParser(multi_action=self.max_tools_per_turn > 1)
+        if not config.actor_streaming:
+            response = await llm_client.acompletion(messages=messages, temperature=0.1, call_site="actor_turn")
+            response_text = response.choices[0].message.content
+            parser.feed(response_text)
+            self._record_tail(parser)
+            return response_text, []
+
+        result = await llm_client.astream_completion(
+            messages=messages,
+            temperature=0.1,
+            stop=REACT_STOP_SEQUENCES,
+            stop_when=parser.feed,
+            call_site="actor_turn",
+        )
+        self._record_stream(result, parser)
+        return result.text, []
 
-                self.history.append({"thought": thought, "action_str": f"{tool_name}[{arg}]", "observation": observation})
-            else:
-                print(f"  [ERROR] '{tool_name}' というツールは存在しません。")
-                self.history.append(
-                    {
-                        "thought": thought,
-                        "action_str": f"{tool_name}[{arg}]",
-                        "observation": f"エラー: '{tool_name}' というツールは存在しません。利用可能なツールリストを確認してください。",
-                    }
-                )
+    def _record_tail(self, parser: ReActStreamParser):
+        """
+        最後まで生成された応答について、ターンの長さを記録し、行動行より後に生成された（使われない）トークン数を数える
+        """
+        _turn_lengths.record(self.context_budget.count_tokens(parser.text))
+        if tail := parser.tail().strip():
+            tokens = self.context_budget.count_tokens(tail)
+            self.wasted_tokens += tokens
+            metrics.inc("aime_actor_generation_tokens_total", tokens, kind="wasted")
+
+    def _record_stream(self, result, parser: ReActStreamParser):
+        if result.ttft is not None:
+            self.stream_ttfts.append(result.ttft)
+        if not result.early_stopped:
+            self._record_tail(parser)
+            return
+        # 打ち切った場合は、最後まで生成したときのターンの長さの目安から、受信した分を引いた量を回避できたとみなす
+        self.stream_early_stops += 1
+        avoided = max(0, _turn_lengths.estimate() - self.context_budget.count_tokens(result.text))
+        self.avoided_tokens += avoided
+        metrics.inc("aime_actor_generation_tokens_total", avoided, kind="avoided")
+
+    def _report_run_stats(self):
+        """Actor終了時に、履歴圧縮とストリーミングの計測値を表示し、ターン数をメトリクスに記録する"""
+        metrics.observe("aime_actor_turns", self.turns_used)
+        if self.stream_ttfts:
+            print(
+                f"  [Actor] タスクID {self.subtask['id']}: 平均TTFT {sum(self.stream_ttfts) / len(self.stream_ttfts):.2f}秒, "
+                f"行動行での早期停止 {self.stream_early_stops}/{len(self.stream_ttfts)}ターン"
+            )
+        if self.avoided_tokens:
+            print(f"  [Actor] タスクID {self.subtask['id']}: 早期停止で生成させずに済んだトークン（推定） {self.avoided_tokens}")
+        if self.wasted_tokens:
+            print(f"  [Actor] タスクID {self.subtask['id']}: 行動行より後に生成された不要なトークン {self.wasted_tokens}")
+        if self.text_fallback_turns:
+            print(
+                f"  [Actor] タスクID {self.subtask['id']}: ツール呼び出しがなくテキスト解析にフォールバックしたターン "
+                f"{self.text_fallback_turns}"
+            )
+        if self.context_budget.tokens_saved:
+            print(
+                f"  [Actor] タスクID {self.subtask['id']}: 履歴の圧縮で {self.context_budget.tokens_saved} トークンを削減しました "
+                f"(圧縮した観察: {self.context_budget.compacted_observations}件)"
+            )
 
+    def _max_turns_summary(self) -> str:
+        """最大ターン数に達した場合の実行履歴の要約を作成する"""
         print(f">>> Dynamic Actor: 最大ターン数に達しました。タスクID {self.subtask['id']} を終了します。 <<<")
         final_summary = "最大ターン数に達したため、タスクを完了できませんでした。以下は実行履歴の要約です。\n"
         for turn in self.history:
@@ -181,3 +815,53 @@ class DynamicActor:
                 f"- 思考: {turn['thought']}\n- 行動: {turn['action_str']}\n- 観察: {str(turn['observation'])[:100]}...\n"
             )
         return final_summary
+
+    @observe(name="Actor-Execution")
+    def run(self) -> str:
+        """
+        ReActループを実行してサブタスクを遂行する
+
+        Returns:
+            タスク実行の結果
+        """
+        try:
+            for i in range(self.max_turns):
+                self.turns_used = i + 1
+                response_text, tool_calls = self._complete_turn(current_turn=i + 1)
+                thought, actions = self._prepare_turn(i + 1, response_text, tool_calls)
+                if self._is_finish(actions):
+                    # 引数（arg）が最終成果物そのものになる
+                    return actions[0].arg if actions[0].arg else "成果物が生成されませんでした。"
+
+                observations = self._run_actions(actions)
+                self._record_turn(thought, actions, observations)
+                self._compact_history()
+
+            return self._max_turns_summary()
+        finally:
+            self._report_run_stats()
+
+    @observe(name="Actor-Execution")
+    async def arun(self) -> str:
+        """
+        ReActループを非同期に実行してサブタスクを遂行する（イベントループ上で多数のActorを並行実行する用途）
+
+        Returns:
+            タスク実行の結果
+        """
+        try:
+            for i in range(self.max_turns):
+                self.turns_used = i + 1
+                response_text, tool_calls = await self._acomplete_turn(current_turn=i + 1)
+                thought, actions = self._prepare_turn(i + 1, response_text, tool_calls)
+                if self._is_finish(actions):
+                    return actions[0].arg if actions[0].arg else "成果物が生成されませんでした。"
+
+                observations = await self._arun_actions(actions)
+                self._record_turn(thought, actions, observations)
+                # 要約はLLM呼び出しを伴うため、イベントループを止めないようスレッドで実行する
+                await asyncio.to_thread(self._compact_history)
+
+            return self._max_turns_summary()
+        finally:
+            self._report_run_stats()
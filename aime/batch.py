@@ -0,0 +1,233 @@
+"""
+複数のゴールのバッチ実行
+JSONLファイルのゴールを同時に実行する。各実行の状態と出力ファイルは実行ごとのディレクトリに分け、
+Actorのスレッドプール（asyncioモードでは同時実行数の上限）・ワーカー・LLMクライアント・レート制限・キャッシュは全実行で共有する
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+from aime.config import config
+from aime.metrics import metrics
+from aime.planner import DynamicPlanner
+from aime.run_journal import new_run_id
+from aime.worker_backend import WorkerBackend, create_worker_backend
+
+SUMMARY_FILENAME = "summary.jsonl"
+
+
+@dataclass
+class BatchGoal:
+    goal_id: str  # 出力ディレクトリ名にも使う
+    goal: str
+
+
+@dataclass
+class RunSummary:
+    goal_id: str
+    goal: str
+    run_id: Optional[str]
+    output_dir: str
+    status: str  # "completed": 全タスク完了 / "partial": 失敗したタスクを含む / "error": 計画の作成失敗または例外
+    tasks_total: int
+    tasks_completed: int
+    tasks_failed: int
+    replans: int
+    elapsed_seconds: float
+    final_report: Optional[str]  # 最終報告書のパス（作成されなかった場合はNone）
+    error: Optional[str] = None
+
+
+def load_goals(path: str) -> List[BatchGoal]:
+    """
+    JSONLファイルからゴールを読み込む
+
+    各行は {"id": "...", "goal": "..."} のオブジェクト（idは省略可能で、省略時は行番号）またはゴールの文字列。
+    空行は無視する。
+
+    Raises:
+        ValueError: 行が解析できない、ゴールが空、またはIDが重複している場合
+    """
+    goals: List[BatchGoal] = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: JSONとして解析できません: {e}") from e
+            if isinstance(item, str):
+                item = {"goal": item}
+            if not isinstance(item, dict) or not str(item.get("goal", "")).strip():
+                raise ValueError(f"{path}:{line_number}: ゴール（\"goal\"）が指定されていません。")
+            # IDはディレクトリ名に使うため、英数字・ハイフン・ピリオド以外を置き換える
+            goal_id = re.sub(r"[^\w.-]", "_", str(item.get("id", line_number)))
+            if goal_id in seen:
+                raise ValueError(f"{path}:{line_number}: ID '{goal_id}' が重複しています。")
+            seen.add(goal_id)
+            goals.append(BatchGoal(goal_id, str(item["goal"]).strip()))
+    return goals
+
+
+class BatchRunner:
+    """
+    複数のゴールを同時に実行する。
+
+    同時に実行するゴールの数を max_runs で、全実行を合わせたActorの同時実行数を max_workers で制限する
+    （各実行のActorの同時実行数は、さらに config.max_parallel_actors / max_async_actors で制限される）。
+    """
+
+    def __init__(self, output_dir: str = None, max_workers: int = None, max_runs: int = None):
+        """
+        Args:
+            output_dir: 出力先（<output_dir>/<ゴールID>/ に実行ごとの進捗・タスク結果・最終報告書を出力する）
+            max_workers: 全実行で共有するActorの同時実行数の上限（Noneの場合はconfig値を使用）
+            max_runs: 同時に実行するゴール数（Noneの場合はconfig値を使用）
+        """
+        self.output_dir = output_dir or config.batch_output_dir
+        self.max_workers = max_workers or config.batch_max_workers
+        self.max_runs = max_runs or config.batch_max_runs
+        self.batch_id = new_run_id()
+        self.worker_backend: Optional[WorkerBackend] = None
+
+    def _create_planner(self, goal: BatchGoal, **shared) -> DynamicPlanner:
+        return DynamicPlanner(
+            run_id=f"{self.batch_id}-{goal.goal_id}",
+            output_dir=os.path.join(self.output_dir, goal.goal_id),
+            export_metrics=False,
+            worker_backend=self.worker_backend,
+            **shared,
+        )
+
+    def _summarize(self, goal: BatchGoal, planner: DynamicPlanner, started: float, error: str = None) -> RunSummary:
+        tasks = planner.progress_manager.tasks
+        completed = sum(task["status"] == "completed" for task in tasks)
+        failed = sum(task["status"] == "failed" for task in tasks)
+        report_written = os.path.exists(planner.final_report_path)
+        if error is None and not tasks:
+            error = "タスクの分解に失敗しました。"
+        if error is not None:
+            status = "error"
+        else:
+            status = "completed" if completed == len(tasks) and report_written else "partial"
+        return RunSummary(
+            goal_id=goal.goal_id,
+            goal=goal.goal,
+            run_id=planner.run_id,
+            output_dir=planner.output_dir,
+            status=status,
+            tasks_total=len(tasks),
+            tasks_completed=completed,
+            tasks_failed=failed,
+            replans=len(planner.progress_manager.replan_history),
+            elapsed_seconds=time.perf_counter() - started,
+            final_report=planner.final_report_path if report_written else None,
+            error=error,
+        )
+
+    def _run_goal(self, goal: BatchGoal, executor: ThreadPoolExecutor) -> RunSummary:
+        started = time.perf_counter()
+        planner = self._create_planner(goal, executor=executor)
+        error = None
+        try:
+            planner.run(goal.goal)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] ゴール {goal.goal_id} の実行中に予期せぬエラーが発生しました: {error}")
+        finally:
+            planner.factory.shutdown()
+        return self._summarize(goal, planner, started, error)
+
+    async def _arun_goal(self, goal: BatchGoal, run_slots: asyncio.Semaphore, actor_slots: asyncio.Semaphore) -> RunSummary:
+        async with run_slots:
+            started = time.perf_counter()
+            planner = self._create_planner(goal, actor_semaphore=actor_slots)
+            error = None
+            try:
+                await planner.arun(goal.goal)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                print(f"[ERROR] ゴール {goal.goal_id} の実行中に予期せぬエラーが発生しました: {error}")
+            finally:
+                planner.factory.shutdown()
+            return self._summarize(goal, planner, started, error)
+
+    def run(self, goals: List[BatchGoal]) -> List[RunSummary]:
+        """スレッドモードで全ゴールを実行し、ゴールの順に実行ごとの要約を返す"""
+        self._begin(goals)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch-actor") as actor_executor:
+                with ThreadPoolExecutor(max_workers=self.max_runs, thread_name_prefix="batch-run") as run_executor:
+                    summaries = list(run_executor.map(lambda goal: self._run_goal(goal, actor_executor), goals))
+        finally:
+            self._stop_worker_backend()
+        self._finish(summaries)
+        return summaries
+
+    async def arun(self, goals: List[BatchGoal]) -> List[RunSummary]:
+        """runの非同期版（全ゴールのActorを1つのイベントループ上で実行する）"""
+        self._begin(goals)
+        run_slots, actor_slots = asyncio.Semaphore(self.max_runs), asyncio.Semaphore(self.max_workers)
+        try:
+            summaries = list(await asyncio.gather(*(self._arun_goal(goal, run_slots, actor_slots) for goal in goals)))
+        finally:
+            self._stop_worker_backend()
+        self._finish(summaries)
+        return summaries
+
+    def _stop_worker_backend(self):
+        if self.worker_backend is not None:
+            self.worker_backend.shutdown()
+            self.worker_backend = None
+
+    def _begin(self, goals: List[BatchGoal]):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Actorをワーカーで実行する設定の場合は、ワーカーを全ゴールで共有する
+        self.worker_backend = create_worker_backend()
+        print(
+            f"=== バッチ実行開始: {len(goals)}件のゴール (バッチID: {self.batch_id}, "
+            f"同時実行ゴール数: {self.max_runs}, 共有Actorワーカー数: {self.max_workers}) ==="
+        )
+
+    def _finish(self, summaries: List[RunSummary]):
+        """実行ごとの要約とバッチ全体のメトリクスを出力する"""
+        summary_path = os.path.join(self.output_dir, SUMMARY_FILENAME)
+        with open(summary_path, "w", encoding="utf-8") as f:
+            for summary in summaries:
+                f.write(json.dumps(asdict(summary), ensure_ascii=False) + "\n")
+
+        print(f"\n=== バッチ実行完了: 実行ごとの要約を {summary_path} に出力しました ===")
+        print(format_summaries(summaries))
+
+        if config.metrics_enabled:
+            extension = "prom" if config.metrics_format == "prometheus" else "json"
+            path = config.metrics_file or os.path.join(self.output_dir, f"metrics.{extension}")
+            try:
+                metrics.export(path, config.metrics_format)
+                print(f"--- バッチ全体のメトリクスを {path} に出力しました ---")
+            except (OSError, ValueError) as e:
+                print(f"メトリクスの出力に失敗しました: {e}")
+            if summary := metrics.format_summary():
+                print(summary)
+
+
+def format_summaries(summaries: List[RunSummary]) -> str:
+    """実行ごとの要約を、コンソール表示用の表にまとめる"""
+    lines = [f"{'ID':<16}{'状態':<10}{'完了/失敗/全体':>16}{'再計画':>8}{'時間':>10}  出力先"]
+    for summary in summaries:
+        counts = f"{summary.tasks_completed}/{summary.tasks_failed}/{summary.tasks_total}"
+        lines.append(
+            f"{summary.goal_id:<16}{summary.status:<10}{counts:>16}{summary.replans:>8}"
+            f"{summary.elapsed_seconds:>9.1f}s  {summary.final_report or summary.output_dir}"
+        )
+        if summary.error:
+            lines.append(f"  エラー: {summary.error}")
+    return "\n".join(lines)
@@ -4,8 +4,8 @@ OpenAI API、Langfuse設定を統一管理
 """
 
 import os
-from typing import Optional
-from dataclasses import dataclass
+from typing import Dict, Optional
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -22,21 +22,123 @@ class AimeConfig:
     langfuse_public_key: Optional[str] = None
     langfuse_host: str = "https://cloud.langfuse.com"
 
+    # LLMのレート制限設定（プロセス全体でモデルごとに共有する）
+    llm_requests_per_minute: Optional[float] = None  # 全モデル共通のRPMの上限（Noneで制限しない）
+    llm_tokens_per_minute: Optional[float] = None  # 全モデル共通のTPMの上限（Noneで制限しない）
+    llm_model_rate_limits: Dict[str, Dict[str, float]] = field(default_factory=dict)  # モデルごとの上限 例: {"openai/gpt-4o": {"rpm": 500, "tpm": 30000}}
+    llm_rate_limits_from_headers: bool = True  # 上限を設定していないモデルは、レスポンスヘッダー（x-ratelimit-limit-*）の上限を使う
+    llm_rate_limit_burst_seconds: float = 5.0  # RPM・TPMのバケットに貯められる量（何秒分の上限か。大きいと開始直後に一斉に送信してサーバー側の制限を受けやすい）
+    llm_expected_completion_tokens: int = 500  # max_tokens未指定時に、TPMの見積もりに加える生成トークン数
+    llm_retry_base_delay: float = 2.0  # レート制限時の再試行の基準待機秒数（ジッター付きの指数バックオフ。Retry-Afterがあればそれに従う）
+    llm_retry_max_delay: float = 60.0
+    llm_adaptive_concurrency: bool = True  # レート制限を受けたらActorの同時実行数を自動で下げ、成功が続いたら戻す（AIMD）
+
     # Google API設定
     google_api_key: Optional[str] = None
     google_cse_id: Optional[str] = None
+    google_search_requests_per_minute: float = 60  # 全Actor合計の検索リクエスト上限
 
     # システム設定
     max_parallel_actors: int = 4
+    execution_mode: str = "thread"  # "thread": スレッドプールで実行 / "async": asyncioのイベントループで実行
+    max_async_actors: int = 100  # asyncioモードでの同時実行Actor数の上限
     max_retries: int = 3
     default_temperature: float = 0.3
     actor_max_turns: int = 5
+    actor_prompt_mode: str = "single"  # "single": 履歴込みの単一メッセージ / "multi_turn": 固定プレフィックス+追記型の履歴
+    actor_streaming: bool = False  # Trueでストリーミング受信し、行動行が完結した時点で生成を打ち切る
+    actor_typical_turn_tokens: int = 250  # 打ち切らずに生成した場合の1ターンの長さの目安（計測値がない間の、早期停止で回避したトークン数の推定に使う）
+    actor_tool_mode: str = "react"  # "react": `ツール名[引数]` のテキスト解析 / "function": ネイティブのFunction Calling（ストリーミングは使わない）
+    actor_max_tools_per_turn: int = 4  # 1ターンで同時に呼び出せるツール数の上限（1で従来どおり1つずつ）
+    actor_tool_workers: int = 8  # 1ターン内の複数ツールを同時実行する共有スレッドプールのワーカー数（全Actor合計）
+    actor_history_compaction: str = "summarize"  # 予算超過時の履歴圧縮方法: "summarize" / "truncate" / "off"
+    actor_history_token_budget: int = 8000  # Actorの履歴に使うトークン数の上限
+    actor_history_keep_recent_turns: int = 2  # 圧縮せずに原文のまま残す直近のターン数
+    actor_compacted_observation_chars: int = 400  # 圧縮後の観察結果の目安文字数
+    persona_batch_size: int = 20  # ペルソナを一括生成する際の1回あたりのタスク数
+    replan_scope: str = "subgraph"  # "subgraph": 失敗したタスクの下流だけを差分で修正 / "full": 計画全体を再生成
+    deadlock_max_replans: int = 3  # 実行可能なタスクがない状態で続けて再計画する回数の上限（超えたら残りのタスクを失敗にして終了する）
+    deadlock_backoff_seconds: float = 2.0  # デッドロック時の再計画の間隔（2回目以降、回数ごとに倍にする）
+    task_priority_policy: str = "critical_path"  # 実行可能なタスクが空きワーカーより多い場合の順序: "critical_path": 長い依存の鎖の起点を優先 / "fifo": 実行可能になった順
+
+    # 依存タスクの結果の受け渡し設定（完了時に1回だけ要約し、依存先には要約と関連する抜粋を渡す）
+    knowledge_token_budget: int = 2000  # 依存タスクの結果として渡すトークン数の上限（全依存タスクの合計）
+    result_summary_enabled: bool = True  # Falseで要約を作らず、結果の冒頭と関連する抜粋だけを渡す
+    result_summary_min_tokens: int = 300  # これ以下の短い結果は要約せず、原文のまま渡す
+    result_summary_max_tokens: int = 300  # 要約の最大トークン数
+    result_summary_max_wait_seconds: float = 5.0  # 依存タスクの要約が未完了の場合に待つ上限（超えたら冒頭と抜粋だけで開始する）
+    result_excerpt_chars: int = 400  # 抜粋の単位とする段落の最大文字数
+
+    # 知識インデックス設定（観察結果・進捗ログ・タスク結果を全文検索する search_knowledge ツール）
+    knowledge_index_max_documents: int = 20000  # 保持する段落数の上限（超えた場合は古い段落から削除する）
+    knowledge_index_path: Optional[str] = None  # 指定するとインデックスをJSONLファイルに永続化し、実行をまたいで検索できる
+    knowledge_chunk_chars: int = 400  # インデックスに登録する段落の最大文字数
+    knowledge_search_top_k: int = 5  # search_knowledge が返す段落数
+    knowledge_worker_hits: int = 20  # ワーカーで実行するタスクに、タスクの説明で検索して送る段落数（ワーカーの search_knowledge の検索対象になる）
+
+    # Actorの事前準備設定（実行中のタスクの完了だけを待っているタスクのActorを、依存タスクの完了前に用意しておく）
+    prewarm_enabled: bool = True
+    prewarm_max_tasks: int = 8  # 同時に用意しておくタスク数の上限
+    prewarm_search_enabled: bool = False  # Trueでタスクの説明をクエリとした検索も先に行う（検索の回数を消費する）
 
     # ディレクトリ設定
     results_dir: str = "task_results"
     progress_file: str = "progress.md"
     final_report_file: str = "final_report.md"
 
+    # LLMレスポンスキャッシュ設定（開発・回帰テストでの再実行向け）
+    llm_cache_enabled: bool = False
+    llm_cache_path: str = ".aime_cache/llm_responses.sqlite3"
+    llm_cache_ttl_seconds: Optional[int] = 7 * 24 * 60 * 60
+    llm_cache_max_entries: int = 10000
+    llm_cache_max_temperature: float = 0.2  # この温度以下の（決定的に近い）呼び出しのみキャッシュする
+
+    # 検索結果キャッシュ設定
+    search_cache_ttl_seconds: int = 60 * 60
+    search_cache_max_entries: int = 1000
+    search_cache_path: Optional[str] = None  # 指定するとキャッシュをJSONファイルに永続化する
+    search_cache_flush_interval_ms: int = 1000  # 永続化ファイルの最小書き込み間隔（間隔内の追加は1回の書き込みにまとめる）
+
+    # ページ取得ツール設定（fetch_page）
+    page_fetch_timeout: float = 10.0  # 1ページの取得にかける時間の上限（秒）
+    page_fetch_max_bytes: int = 2 * 1024 * 1024  # 1ページでダウンロードするバイト数の上限
+    page_fetch_max_chars: int = 3000  # 1ページから取り出す本文の最大文字数（達した時点でダウンロードを打ち切る）
+    page_fetch_max_urls: int = 5  # 1回の呼び出しで取得するURL数の上限
+    page_fetch_max_workers: int = 8  # 全Actor合計の同時取得数（複数のURLをまとめて取得する場合）
+    page_fetch_per_host: int = 2  # 同じホストへの同時接続数
+    page_cache_ttl_seconds: int = 60 * 60
+    page_cache_max_entries: int = 200
+
+    # 実行ジャーナル設定（中断した実行を DynamicPlanner.resume(run_id) で再開するため）
+    journal_enabled: bool = True
+    runs_dir: str = "runs"  # ジャーナルの保存先（runs/<run_id>/journal.jsonl）
+    journal_fsync: bool = False  # Trueでイベントごとにfsyncする（電源断にも耐えるが遅くなる）
+
+    # メトリクス設定（Langfuseとは独立に集計し、実行終了時にファイルへ出力する）
+    metrics_enabled: bool = True
+    metrics_format: str = "json"  # "json": 要約のJSON / "prometheus": Prometheusのテキスト形式
+    metrics_file: Optional[str] = None  # 出力先（Noneの場合は runs/<run_id>/ 、ジャーナル無効時はカレントディレクトリの metrics.json / metrics.prom）
+
+    # Actorの実行バックエンド設定（"process" / "socket" ではActorを別プロセス・別ノードのワーカーで実行する）
+    actor_backend: str = "thread"  # "thread": プランナーのスレッド / "process": ローカルのワーカープロセス / "socket": TCPで接続したワーカー
+    actor_worker_processes: int = 4  # process: 起動するワーカープロセス数 / socket: ローカルに起動するワーカー数（0で外部のワーカーの接続だけを待つ）
+    actor_worker_slots: int = 2  # ワーカー1つあたりの同時実行ジョブ数
+    worker_host: str = "127.0.0.1"  # socket: 待ち受けるアドレス（別ノードのワーカーを使う場合は "0.0.0.0" など）
+    worker_port: int = 0  # socket: 待ち受けるポート（0で空いているポート）
+    worker_auth_token: Optional[str] = None  # socket: ワーカーの認証トークン（環境変数 AIME_WORKER_TOKEN でも指定できる）
+    worker_heartbeat_interval: float = 2.0  # ワーカーが生存を通知する間隔（秒）
+    worker_timeout: float = 15.0  # この秒数応答のないワーカーを失われたとみなし、実行中のジョブを再投入する
+    worker_job_max_attempts: int = 3  # 1件のジョブを実行するワーカーの数の上限（超えるとタスクの失敗として扱う）
+
+    # バッチ実行設定（python -m aime.main --batch goals.jsonl）
+    batch_output_dir: str = "batch_runs"  # ゴールごとの出力先の親ディレクトリ（<batch_output_dir>/<ゴールID>/）
+    batch_max_runs: int = 4  # 同時に実行するゴール数
+    batch_max_workers: int = 8  # 全ゴールで共有するActorの同時実行数の上限
+
+    # 進捗ファイル出力設定
+    progress_file_enabled: bool = True  # Falseでprogress.mdを出力しない（バッチ実行向け）
+    progress_flush_interval_ms: int = 500  # 進捗ファイルの最小書き込み間隔
+
     def __post_init__(self):
         """環境変数から設定を読み込み"""
         self.openai_api_key = os.getenv("OPENAI_API_KEY", self.openai_api_key)
@@ -44,6 +146,7 @@ class AimeConfig:
         self.langfuse_public_key = os.getenv("LANGFUSE_PUBLIC_KEY", self.langfuse_public_key)
         self.google_api_key = os.getenv("GOOGLE_API_KEY", self.google_api_key)
         self.google_cse_id = os.getenv("GOOGLE_CSE_ID", self.google_cse_id)
+        self.worker_auth_token = os.getenv("AIME_WORKER_TOKEN", self.worker_auth_token)
         if host := os.getenv("LANGFUSE_HOST"):
             self.langfuse_host = host
 
@@ -0,0 +1,123 @@
+"""
+Actorの履歴コンテキストのトークン予算管理
+履歴が予算を超えた場合、直近のターンは原文のまま残し、古い観察から順に要約・切り詰めを行う
+"""
+
+from typing import Any, Dict, List
+
+import litellm
+
+from aime.config import config
+from aime.llm_client import llm_client
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """テキストのトークン数を数える（Noneの場合はconfigのモデルのトークナイザを使う）"""
+    try:
+        return litellm.token_counter(model=model or config.openai_model, text=text)
+    except Exception:
+        # トークナイザが使えない場合のおおよその見積もり
+        return len(text) // 2
+
+
+class ContextBudgetManager:
+    """
+    Actor1体分の履歴トークン予算を管理する。
+    圧縮は1つの観察につき1回だけ行い、圧縮で削減したトークン数を記録する。
+    """
+
+    def __init__(self, task_description: str, model: str = None):
+        """
+        Args:
+            task_description: 要約時に関連情報を残す基準とするタスク説明
+            model: トークン数の計算に使うモデル名（Noneの場合はconfig値を使用）
+        """
+        self.task_description = task_description
+        self.model = model or config.openai_model
+        self.budget = config.actor_history_token_budget
+        self.keep_recent_turns = config.actor_history_keep_recent_turns
+        self.mode = config.actor_history_compaction
+        self.tokens_saved = 0
+        self.compacted_observations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("summarize", "truncate") and self.budget > 0
+
+    def count_tokens(self, text: str) -> int:
+        """テキストのトークン数を数える"""
+        return count_tokens(text, self.model)
+
+    def _turn_tokens(self, turn: Dict[str, Any]) -> int:
+        if "tokens" not in turn:
+            turn["tokens"] = self.count_tokens(f"{turn['thought']}\n{turn['action_str']}\n{turn['observation']}")
+        return turn["tokens"]
+
+    def _truncate(self, observation: str) -> str:
+        limit = config.actor_compacted_observation_chars
+        return observation if len(observation) <= limit else f"{observation[:limit]}...（以下省略）"
+
+    def _summarize(self, observation: str) -> str:
+        """miniモデルで観察結果を要約する（失敗時は切り詰めにフォールバック）"""
+        limit = config.actor_compacted_observation_chars
+        prompt = f"""
+以下はタスク「{self.task_description}」の実行中に得られたツールの観察結果です。
+タスクの遂行に必要な事実（固有名詞、数値、URLなど）だけを残し、{limit}文字以内の日本語で要約してください。
+
+# 観察結果
+{observation}
+
+# 要約
+"""
+        try:
+            response = llm_client.completion_mini(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.0,
+                max_tokens=max(64, limit),
+                call_site="history_summary",
+            )
+            summary = response.choices[0].message.content.strip()
+            return f"（要約）{summary}" if summary else self._truncate(observation)
+        except Exception as e:
+            print(f"  [WARN] 観察結果の要約に失敗したため切り詰めます: {e}")
+            return self._truncate(observation)
+
+    def compact(self, history: List[Dict[str, Any]]) -> bool:
+        """
+        履歴が予算を超えていれば、古いターンの観察をその場で圧縮する
+
+        Args:
+            history: Actorの履歴（thought, action_str, observation を持つ辞書のリスト）
+
+        Returns:
+            履歴を書き換えた場合はTrue
+        """
+        if not self.enabled:
+            return False
+
+        total = sum(self._turn_tokens(turn) for turn in history)
+        if total <= self.budget:
+            return False
+
+        changed = False
+        for turn in history[: max(0, len(history) - self.keep_recent_turns)]:
+            if total <= self.budget:
+                break
+            if turn.get("compacted"):
+                continue
+
+            observation = str(turn["observation"])
+            compacted = self._summarize(observation) if self.mode == "summarize" else self._truncate(observation)
+            turn["compacted"] = True
+            if len(compacted) >= len(observation):
+                continue
+
+            before = turn["tokens"]
+            turn["observation"] = compacted
+            del turn["tokens"]
+            saved = max(0, before - self._turn_tokens(turn))
+            total -= saved
+            self.tokens_saved += saved
+            self.compacted_observations += 1
+            changed = True
+        return changed
@@ -1,32 +1,203 @@
-from aime.actor import DynamicActor
-from aime.tools import web_search, finish, reflect, google_search
+import asyncio
+import json
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from aime.actor import TOOL_ERROR_PATTERN, DynamicActor
+from aime.tools import (
+    finish,
+    reflect,
+    google_search,
+    fetch_page,
+    make_search_knowledge,
+    afinish,
+    areflect,
+    agoogle_search,
+    afetch_page,
+    make_asearch_knowledge,
+)
 from langfuse import observe
+from aime.config import config
+from aime.knowledge_index import KnowledgeIndex
 from aime.llm_client import llm_client
+from aime.metrics import metrics
+
+DEFAULT_PERSONA = "多才なアシスタント。"
+
+# 全Actorに与える基本ツール（別プロセスのワーカーもこの定義を使う）
+# search_knowledge は実行ごとの知識インデックスを検索するため、ActorFactory とワーカーがインデックスに束縛して追加する
+BASE_TOOLS = {
+    "finish": finish,
+    "web_search": google_search,
+    "fetch_page": fetch_page,
+    "reflect": reflect,
+}
+ASYNC_BASE_TOOLS = {
+    "finish": afinish,
+    "web_search": agoogle_search,
+    "fetch_page": afetch_page,
+    "reflect": areflect,
+}
+
+
+@dataclass
+class _PreparedActor:
+    description: str  # 用意した時点のタスク説明（再計画で説明が変わった場合は使わない）
+    future: Future  # 用意したActor（ワーカーで実行する場合はペルソナだけを用意するためNone）
+
+
+class PersonaItem(BaseModel):
+    index: int
+    persona: str
+
+
+class PersonaList(BaseModel):
+    personas: List[PersonaItem]
+
+
+def _persona_key(subtask_description: str) -> str:
+    """ペルソナのメモ化に使う、正規化したタスク説明を返す"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", subtask_description)).strip()
 
 
 class ActorFactory:
     """
     サブタスクの要件に基づいて、特化したDynamic Actorをインスタンス化する。
     ペルソナはLLMによって動的に生成される。
+    計画の作成・修正時に prepare_personas() で全タスク分を一括生成しておくことで、Actor起動時のLLM待ちをなくす。
+    依存タスクの完了を待っているタスクは、prewarm() でActorまで先に用意しておける。
     """
 
-    def __init__(self, progress_manager):
+    def __init__(self, progress_manager, knowledge_index: Optional[KnowledgeIndex] = None):
+        """
+        Args:
+            progress_manager: 進捗管理モジュール
+            knowledge_index: この実行の知識インデックス（Noneの場合、Actorは search_knowledge を使わず、観察結果も登録しない）
+        """
         self.progress_manager = progress_manager
-        self.base_tools = {"finish": finish, "web_search": google_search, "reflect": reflect}
+        self.knowledge_index = knowledge_index
+        self.base_tools = dict(BASE_TOOLS)
+        self.async_base_tools = dict(ASYNC_BASE_TOOLS)
+        if knowledge_index is not None:
+            self.base_tools["search_knowledge"] = make_search_knowledge(knowledge_index)
+            self.async_base_tools["search_knowledge"] = make_asearch_knowledge(knowledge_index)
 
-    @observe()
-    def _generate_persona(self, subtask_description: str) -> str:
+        # 正規化したタスク説明 -> ペルソナ のメモと、生成中のバッチ
+        self._personas: Dict[str, str] = {}
+        self._pending_personas: Dict[str, Future] = {}
+        self._persona_lock = threading.Lock()
+        self._persona_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="persona")
+
+        # タスクID -> 依存タスクの完了前に用意しておいたActor
+        self._prepared: Dict[int, _PreparedActor] = {}
+        self._prepared_lock = threading.Lock()
+        self._prewarm_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prewarm")
+
+    def prepare_personas(self, subtasks: List[dict]):
         """
-        LLMを使ってサブタスクに最適なペルソナを生成する
+        未生成のペルソナをバックグラウンドでまとめて生成する（呼び出し側はブロックしない）
 
         Args:
-            subtask_description: サブタスクの説明
-
-        Returns:
-            生成されたペルソナ
+            subtasks: ペルソナを用意しておくサブタスクのリスト
         """
-        print("    L Factory: LLMに最適なペルソナを問い合わせ中...")
+        with self._persona_lock:
+            targets = {}
+            for subtask in subtasks:
+                key = _persona_key(subtask["description"])
+                if key not in self._personas and key not in self._pending_personas:
+                    targets[key] = subtask["description"]
+
+            keys = list(targets)
+            batch_size = max(1, config.persona_batch_size)
+            for start in range(0, len(keys), batch_size):
+                batch = {key: targets[key] for key in keys[start : start + batch_size]}
+                future = self._persona_executor.submit(self._generate_personas_batch, batch)
+                for key in batch:
+                    self._pending_personas[key] = future
+
+        if keys:
+            print(f"  [Factory] {len(keys)}件のタスクのペルソナをバックグラウンドで一括生成します...")
+
+    @observe()
+    def _generate_personas_batch(self, batch: Dict[str, str]) -> Dict[str, str]:
+        """1回のLLM呼び出しで複数タスクのペルソナを生成し、メモに登録する"""
+        keys = list(batch)
+        task_lines = "\n".join(f"{i}: 「{batch[key]}」" for i, key in enumerate(keys))
         prompt = f"""
+以下の各サブタスクを実行するのに最も適した専門家の役割（ペルソナ）を、それぞれ簡潔な日本語で一行で記述してください。
+index には各サブタスクの番号をそのまま指定してください。
+
+例：
+サブタスク: 「東京の主要な交通手段（電車、地下鉄）について調べる」
+ペルソナ: 「東京の公共交通網に精通した交通コンサルタント。」
+
+# サブタスク一覧
+{task_lines}
+"""
+        generated = {}
+        try:
+            response = llm_client.completion_mini(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3,
+                response_format=PersonaList,
+                call_site="persona",
+                cache=True,
+            )
+            for item in json.loads(response.choices[0].message.content).get("personas", []):
+                persona = str(item.get("persona", "")).strip()
+                index = item.get("index")
+                if persona and isinstance(index, int) and 0 <= index < len(keys):
+                    generated[keys[index]] = persona
+        except Exception as e:
+            print(f"    L Factory: ペルソナの一括生成中にエラーが発生しました: {e}")
+
+        with self._persona_lock:
+            self._personas.update(generated)
+            for key in keys:
+                self._pending_personas.pop(key, None)
+        return generated
+
+    def _lookup_persona(self, subtask_description: str):
+        """メモ済みのペルソナ、または生成中のバッチのFutureを返す"""
+        key = _persona_key(subtask_description)
+        with self._persona_lock:
+            return self._personas.get(key), self._pending_personas.get(key)
+
+    def _remember_persona(self, subtask_description: str, persona: str) -> str:
+        with self._persona_lock:
+            self._personas[_persona_key(subtask_description)] = persona
+        return persona
+
+    def get_persona(self, subtask_description: str) -> str:
+        """
+        サブタスクのペルソナを返す。一括生成済みならLLMを呼ばずに返し、
+        生成中ならその完了を待ち、どちらでもなければ個別に生成する。
+        """
+        persona, pending = self._lookup_persona(subtask_description)
+        if persona is None and pending is not None:
+            pending.result()
+            persona, _ = self._lookup_persona(subtask_description)
+        if persona is None:
+            persona = self._remember_persona(subtask_description, self._generate_persona(subtask_description))
+        return persona
+
+    async def aget_persona(self, subtask_description: str) -> str:
+        """get_personaの非同期版"""
+        persona, pending = self._lookup_persona(subtask_description)
+        if persona is None and pending is not None:
+            await asyncio.wrap_future(pending)
+            persona, _ = self._lookup_persona(subtask_description)
+        if persona is None:
+            persona = self._remember_persona(subtask_description, await self._agenerate_persona(subtask_description))
+        return persona
+
+    def _persona_prompt(self, subtask_description: str) -> str:
+        """ペルソナ生成用のプロンプトを構築する"""
+        return f"""
 以下のサブタスクを実行するのに最も適した専門家の役割（ペルソナ）を、簡潔な日本語で一行で記述してください。
 
 例：
@@ -36,17 +207,185 @@ class ActorFactory:
 サブタスク: 「{subtask_description}」
 ペルソナ:
 """
+
+    @staticmethod
+    def _parse_persona(response) -> str:
+        """LLMの応答からペルソナを取り出す"""
+        persona = response.choices[0].message.content.strip().replace("ペルソナ:", "").strip()
+        return persona if persona else DEFAULT_PERSONA
+
+    @observe()
+    def _generate_persona(self, subtask_description: str) -> str:
+        """
+        LLMを使ってサブタスクに最適なペルソナを生成する
+
+        Args:
+            subtask_description: サブタスクの説明
+
+        Returns:
+            生成されたペルソナ
+        """
+        print("    L Factory: LLMに最適なペルソナを問い合わせ中...")
         try:
             response = llm_client.completion_mini(
-                messages=[{"role": "user", "content": prompt}],
+                messages=[{"role": "user", "content": self._persona_prompt(subtask_description)}],
                 temperature=0.3,
                 max_tokens=50,
+                call_site="persona",
+                cache=True,
             )
-            persona = response.choices[0].message.content.strip().replace("ペルソナ:", "").strip()
-            return persona if persona else "多才なアシスタント。"
+            return self._parse_persona(response)
         except Exception as e:
             print(f"    L Factory: ペルソナ生成中にエラーが発生しました: {e}")
-            return "多才なアシスタント。"  # エラー時はデフォルトを返す  # エラー時はデフォルトを返す
+            return DEFAULT_PERSONA  # エラー時はデフォルトを返す
+
+    @observe()
+    async def _agenerate_persona(self, subtask_description: str) -> str:
+        """LLMを使ってサブタスクに最適なペルソナを非同期に生成する"""
+        print("    L Factory: LLMに最適なペルソナを問い合わせ中...")
+        try:
+            response = await llm_client.acompletion_mini(
+                messages=[{"role": "user", "content": self._persona_prompt(subtask_description)}],
+                temperature=0.3,
+                max_tokens=50,
+                call_site="persona",
+                cache=True,
+            )
+            return self._parse_persona(response)
+        except Exception as e:
+            print(f"    L Factory: ペルソナ生成中にエラーが発生しました: {e}")
+            return DEFAULT_PERSONA
+
+    def prewarm(self, subtasks: List[dict], build_actor: bool = True, use_async_tools: bool = False):
+        """
+        依存タスクの完了を待っているタスクのActorを、バックグラウンドで先に用意する（呼び出し側はブロックしない）
+
+        ペルソナを取得し、前提知識以外のプロンプトの固定部分を構築したActorを用意しておく。
+        config.prewarm_search_enabled の場合は、タスクの説明をクエリとした検索も先に行う。
+        用意する数は config.prewarm_max_tasks までで、subtasks の先頭から優先する。
+
+        Args:
+            subtasks: 用意するタスク（実行すべき順）
+            build_actor: Falseの場合はペルソナだけを用意する（Actorをワーカーで実行する場合）
+            use_async_tools: 非同期ツールを持つActorを用意するか（asyncioモード）
+        """
+        started = []
+        with self._prepared_lock:
+            for subtask in subtasks:
+                if len(self._prepared) >= config.prewarm_max_tasks:
+                    break
+                prepared = self._prepared.get(subtask["id"])
+                if prepared is not None and prepared.description == subtask["description"]:
+                    continue
+                if prepared is not None:
+                    prepared.future.cancel()
+                future = self._prewarm_executor.submit(self._prepare_actor, subtask, build_actor, use_async_tools)
+                self._prepared[subtask["id"]] = _PreparedActor(subtask["description"], future)
+                started.append(subtask)
+
+        if started:
+            print(f"  [Factory] 依存タスクの完了を待っているタスク {[subtask['id'] for subtask in started]} を先に用意します...")
+        if started and config.prewarm_search_enabled and build_actor:
+            for subtask in started:
+                self._prewarm_executor.submit(self._prewarm_search, subtask)
+
+    def _prepare_actor(self, subtask: dict, build_actor: bool, use_async_tools: bool) -> Optional[DynamicActor]:
+        persona = self.get_persona(subtask["description"])
+        if not build_actor:
+            return None
+        actor = DynamicActor(
+            subtask=subtask,
+            persona=persona,
+            knowledge="",
+            tools={**(self.async_base_tools if use_async_tools else self.base_tools)},
+            progress_manager=self.progress_manager,
+            knowledge_index=self.knowledge_index,
+        )
+        actor.warm_up()
+        return actor
+
+    def _prewarm_search(self, subtask: dict):
+        """タスクの説明で検索し、結果を検索キャッシュと知識インデックスに入れておく"""
+        try:
+            observation = str(self.base_tools["web_search"](subtask["description"]))
+        except Exception as e:
+            print(f"    L Factory: タスク {subtask['id']} の事前検索中にエラーが発生しました: {e}")
+            return
+        if self.knowledge_index is not None and not TOOL_ERROR_PATTERN.match(observation):
+            self.knowledge_index.add(f"タスク{subtask['id']}の事前検索[{subtask['description']}]", observation)
+
+    def take_prepared(self, subtask: dict) -> Optional[Future]:
+        """
+        先に用意しておいたActorのFutureを取り出す（用意していない、またはタスクの説明が変わった場合はNone）
+
+        取り出したActorには、実行前に set_knowledge() で前提知識を渡す。
+        """
+        with self._prepared_lock:
+            prepared = self._prepared.pop(subtask["id"], None)
+        if prepared is None:
+            return None
+        if prepared.description != subtask["description"] or prepared.future.cancelled():
+            self._discard(prepared)
+            return None
+        if prepared.future.cancel():
+            # 用意に着手する前に実行可能になった場合は、順番を待たずに通常どおり生成する
+            metrics.inc("aime_prewarm_total", outcome="not_started")
+            return None
+        metrics.inc("aime_prewarm_total", outcome="used")
+        return prepared.future
+
+    def get_prepared_persona(self, subtask: dict) -> str:
+        """
+        ワーカーで実行するタスクのペルソナを返す
+
+        先に用意している場合はその完了を待ってから使い、ペルソナを二重に生成しない。
+        """
+        if (prepared := self.take_prepared(subtask)) is not None:
+            try:
+                prepared.result()
+            except Exception as e:
+                print(f"    L Factory: 先に用意したペルソナを使えないため、改めて生成します: {e}")
+        return self.get_persona(subtask["description"])
+
+    async def aget_prepared_persona(self, subtask: dict) -> str:
+        """get_prepared_personaの非同期版"""
+        if (prepared := self.take_prepared(subtask)) is not None:
+            try:
+                await asyncio.wrap_future(prepared)
+            except Exception as e:
+                print(f"    L Factory: 先に用意したペルソナを使えないため、改めて生成します: {e}")
+        return await self.aget_persona(subtask["description"])
+
+    def discard_prepared(self, keep: List[dict]):
+        """
+        keep に含まれない（再計画で削除・変更された）タスクのために用意したActorを破棄する
+
+        Args:
+            keep: 用意したActorを残すタスク（未実行のタスク）
+        """
+        descriptions = {subtask["id"]: subtask["description"] for subtask in keep}
+        with self._prepared_lock:
+            stale = [
+                task_id
+                for task_id, prepared in self._prepared.items()
+                if descriptions.get(task_id) != prepared.description
+            ]
+            discarded = [self._prepared.pop(task_id) for task_id in stale]
+        for prepared in discarded:
+            self._discard(prepared)
+        if discarded:
+            print(f"  [Factory] 計画から外れたタスク {stale} のために用意したActorを破棄しました。")
+
+    @staticmethod
+    def _discard(prepared: _PreparedActor):
+        prepared.future.cancel()
+        metrics.inc("aime_prewarm_total", outcome="discarded")
+
+    def shutdown(self):
+        """ペルソナの生成と事前準備のスレッドを停止する（実行中の処理の完了は待たない）"""
+        self.discard_prepared([])
+        self._persona_executor.shutdown(wait=False, cancel_futures=True)
+        self._prewarm_executor.shutdown(wait=False, cancel_futures=True)
 
     @observe()
     def create_actor(self, subtask: dict, knowledge_context: str = "") -> DynamicActor:
@@ -54,9 +393,17 @@ class ActorFactory:
         サブタスクを分析し、適切なペルソナ、知識、ツールを持つActorを生成する
         """
         description = subtask["description"]
+        if (prepared := self.take_prepared(subtask)) is not None:
+            try:
+                if (actor := prepared.result()) is not None:
+                    actor.set_knowledge(knowledge_context)
+                    print(f"--- Actor Factory: 先に用意しておいた「{actor.persona}」のペルソナを持つActorを使います ---")
+                    return actor
+            except Exception as e:
+                print(f"    L Factory: 先に用意したActorを使えないため、改めて生成します: {e}")
 
-        # 1. LLMでペルソナを動的に生成
-        persona = self._generate_persona(description)
+        # 1. ペルソナを取得（一括生成済みでなければLLMで動的に生成）
+        persona = self.get_persona(description)
         print(f"    L Factory: 生成されたペルソナ -> 「{persona}」")
 
         # 2. サブタスク内容に基づいて知識とツールを決定
@@ -70,4 +417,32 @@ class ActorFactory:
             knowledge=knowledge_context,
             tools=tools,
             progress_manager=self.progress_manager,
+            knowledge_index=self.knowledge_index,
+        )
+
+    @observe()
+    async def acreate_actor(self, subtask: dict, knowledge_context: str = "") -> DynamicActor:
+        """
+        create_actorの非同期版。非同期ツールを持つActorを生成する（Actorは arun() で実行する）
+        """
+        if (prepared := self.take_prepared(subtask)) is not None:
+            try:
+                if (actor := await asyncio.wrap_future(prepared)) is not None:
+                    actor.set_knowledge(knowledge_context)
+                    print(f"--- Actor Factory: 先に用意しておいた「{actor.persona}」のペルソナを持つActorを使います ---")
+                    return actor
+            except Exception as e:
+                print(f"    L Factory: 先に用意したActorを使えないため、改めて生成します: {e}")
+
+        persona = await self.aget_persona(subtask["description"])
+        print(f"    L Factory: 生成されたペルソナ -> 「{persona}」")
+        print(f"--- Actor Factory: 「{persona}」のペルソナを持つActorを生成しました ---")
+
+        return DynamicActor(
+            subtask=subtask,
+            persona=persona,
+            knowledge=knowledge_context,
+            tools={**self.async_base_tools},
+            progress_manager=self.progress_manager,
+            knowledge_index=self.knowledge_index,
         )
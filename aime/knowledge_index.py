@@ -0,0 +1,230 @@
+"""
+実行中に集めた情報の全文検索インデックス
+Actorの観察結果・update_progressの進捗ログ・完了したタスクの結果を段落単位でBM25の転置インデックスに追加し、
+他のタスクが既に調べた情報を、Web検索をせずにプロセス内で検索できるようにする
+インデックスは実行（DynamicPlanner）ごとに作成し、knowledge_index_path を指定した場合だけ実行をまたいで引き継ぐ
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from aime.config import config
+from aime.progress_writer import atomic_write_text
+from aime.result_store import extract_terms, split_chunks
+
+# BM25のパラメータ（語の出現回数の飽和度と、段落の長さによる正規化の強さ）
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+
+# 永続化ファイルへの書き込み（同じファイルを使う複数の実行のインデックスで共有する）
+_persist_lock = threading.Lock()
+
+
+@dataclass
+class _Document:
+    source: str  # 情報の出所（例: "タスク3 web_search[東京 ホテル]"）
+    text: str
+    key: str  # 重複判定用の正規化したテキストのハッシュ
+    term_counts: Dict[str, int]
+    length: int
+    run: Optional[str] = None  # 登録した実行のラベル
+
+
+def _persisted_line(source: str, text: str, run: Optional[str]) -> str:
+    return json.dumps({"source": source, "text": text, "run": run}, ensure_ascii=False) + "\n"
+
+
+def _document_key(text: str) -> str:
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class KnowledgeIndex:
+    """
+    スレッドセーフなBM25の転置インデックス（1回の実行の全Actorで共有する）。
+    追加は段落単位で、同じ内容の段落は1回だけ登録する。上限を超えた場合は古い段落から削除する。
+    永続化パスを指定すると、追加した段落を実行ラベルとともにJSONLファイルに追記し、次回以降の実行でも検索できる。
+    最大段落数は省略時にconfigから読み込む。
+    """
+
+    def __init__(self, max_documents: Optional[int] = None, persist_path: Optional[str] = None, run_label: Optional[str] = None):
+        """
+        Args:
+            max_documents: 保持する段落数の上限（Noneの場合はconfig値）
+            persist_path: 段落を追記するJSONLファイル（Noneの場合は永続化せず、この実行の中だけで検索する）
+            run_label: 永続化する段落に記録する実行のラベル（他の実行で登録した段落は、出所にラベルを付けて返す）
+        """
+        self._max_documents = max_documents
+        self.persist_path = persist_path
+        self.run_label = run_label
+        self._documents: OrderedDict[int, _Document] = OrderedDict()
+        self._postings: Dict[str, Dict[int, int]] = {}  # 語 -> {段落ID: 出現回数}
+        self._keys: Dict[str, int] = {}  # 正規化したテキストのハッシュ -> 段落ID
+        self._total_length = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    def max_documents(self) -> int:
+        return self._max_documents if self._max_documents is not None else config.knowledge_index_max_documents
+
+    def _ensure_loaded(self):
+        """永続化ファイルがあれば初回アクセス時に読み込む（ロック取得済みの前提）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        lines = 0
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    lines += 1
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 書き込み途中で終了した行は無視する
+                    self._insert(item["source"], item["text"], Counter(extract_terms(item["text"])), item.get("run"))
+        except (OSError, KeyError, TypeError) as e:
+            print(f"[WARN] 知識インデックスの読み込みに失敗しました: {e}")
+            return
+        self._evict()
+        if lines > len(self._documents) * 2:
+            # 重複と削除済みの段落が多い場合は、残っている段落だけで書き直す
+            self._rewrite()
+
+    def _rewrite(self):
+        try:
+            with _persist_lock:
+                atomic_write_text(
+                    self.persist_path,
+                    "".join(
+                        _persisted_line(document.source, document.text, document.run)
+                        for document in self._documents.values()
+                    ),
+                )
+        except OSError as e:
+            print(f"[WARN] 知識インデックスの書き直しに失敗しました: {e}")
+
+    def _insert(self, source: str, text: str, term_counts: Counter, run: Optional[str]) -> bool:
+        """段落を1件登録する（ロック取得済みの前提）。重複または語を含まない場合はFalse"""
+        key = _document_key(text)
+        if not term_counts or key in self._keys:
+            return False
+        doc_id = self._next_id
+        self._next_id += 1
+        length = sum(term_counts.values())
+        self._documents[doc_id] = _Document(source, text, key, dict(term_counts), length, run)
+        self._keys[key] = doc_id
+        self._total_length += length
+        for term, count in term_counts.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+        return True
+
+    def _evict(self):
+        """上限を超えた分の古い段落を削除する（ロック取得済みの前提）"""
+        while len(self._documents) > self.max_documents:
+            doc_id, document = self._documents.popitem(last=False)
+            del self._keys[document.key]
+            self._total_length -= document.length
+            for term in document.term_counts:
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+
+    def add(self, source: str, text: str, persist: bool = True) -> int:
+        """
+        テキストを段落に分けて登録する
+
+        Args:
+            source: 情報の出所（検索結果に表示する）
+            text: 登録するテキスト
+            persist: 永続化ファイルにも追記するか（他のインデックスから受け取った段落を登録する場合はFalse）
+
+        Returns:
+            新たに登録した段落数
+        """
+        # 語の抽出はロックの外で行う
+        prepared = [(chunk, Counter(extract_terms(chunk))) for chunk in split_chunks(str(text), config.knowledge_chunk_chars)]
+        added = []
+        with self._lock:
+            self._ensure_loaded()
+            for chunk, term_counts in prepared:
+                if self._insert(source, chunk, term_counts, self.run_label):
+                    added.append(chunk)
+            self._evict()
+
+        if added and persist and self.persist_path:
+            self._append(source, added)
+        return len(added)
+
+    def _append(self, source: str, chunks: List[str]):
+        lines = "".join(_persisted_line(source, chunk, self.run_label) for chunk in chunks)
+        try:
+            with _persist_lock:
+                if directory := os.path.dirname(self.persist_path):
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.persist_path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+        except OSError as e:
+            print(f"[WARN] 知識インデックスの保存に失敗しました: {e}")
+
+    def search(self, query: str, top_k: int = None) -> List[Tuple[str, str, float]]:
+        """
+        queryに関連する段落をBM25のスコアが高い順に返す
+
+        Returns:
+            （出所, 段落のテキスト, スコア）のリスト（最大 top_k 件）
+        """
+        terms = set(extract_terms(query))
+        with self._lock:
+            self._ensure_loaded()
+            if not terms or not self._documents:
+                return []
+            total = len(self._documents)
+            average_length = self._total_length / total
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, count in postings.items():
+                    norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * self._documents[doc_id].length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (_BM25_K1 + 1) / (count + norm)
+            best = heapq.nlargest(top_k or config.knowledge_search_top_k, scores.items(), key=lambda item: item[1])
+            return [(self._display_source(self._documents[doc_id]), self._documents[doc_id].text, score) for doc_id, score in best]
+
+    def _display_source(self, document: _Document) -> str:
+        """検索結果に表示する出所（他の実行で登録した段落は、その実行のラベルを付ける）"""
+        if document.run is not None and document.run != self.run_label:
+            return f"{document.source}（実行 {document.run}）"
+        return document.source
+
+    def stats(self) -> Dict[str, int]:
+        """登録済みの段落数と語の種類数を返す"""
+        with self._lock:
+            return {"documents": len(self._documents), "terms": len(self._postings)}
+
+
+def create_knowledge_index(run_label: Optional[str] = None) -> KnowledgeIndex:
+    """
+    1回の実行で使う知識インデックスを作成する（knowledge_index_path が設定されていれば、そのファイルで実行をまたいで引き継ぐ）
+
+    Args:
+        run_label: 永続化する段落に記録する実行のラベル（実行開始時に設定してもよい）
+    """
+    return KnowledgeIndex(persist_path=config.knowledge_index_path, run_label=run_label)
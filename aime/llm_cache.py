@@ -0,0 +1,119 @@
+"""
+LLMレスポンスの永続キャッシュ
+リクエスト内容（モデル、メッセージ、温度、レスポンス形式、その他のパラメータ）のハッシュをキーとして、
+レスポンスをSQLiteに保存する。全スレッドから同じキャッシュを共有できる。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import litellm
+from pydantic import BaseModel
+
+
+def _normalize(value: Any) -> Any:
+    """キャッシュキー計算のために値をJSON化可能な形に正規化する"""
+    if isinstance(value, type) and issubclass(value, BaseModel):
+        # response_formatにPydanticモデルが渡された場合はスキーマで区別する
+        return value.model_json_schema()
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+class LLMResponseCache:
+    """
+    コンテンツアドレス方式のLLMレスポンスキャッシュ。
+    TTLによる失効と、最大件数を超えた場合のLRU削除に対応する。
+    """
+
+    def __init__(self, path: str, ttl_seconds: Optional[int] = None, max_entries: int = 10000):
+        """
+        キャッシュを初期化
+
+        Args:
+            path: SQLiteファイルのパス
+            ttl_seconds: エントリの有効期間（秒）。Noneの場合は失効しない
+            max_entries: 保持する最大エントリ数。超えた分は最終アクセスが古い順に削除する
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if directory := os.path.dirname(path):
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)")
+
+    @staticmethod
+    def make_key(params: Dict[str, Any]) -> str:
+        """リクエストパラメータからキャッシュキーを計算する"""
+        payload = json.dumps(_normalize(params), sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """キャッシュされたレスポンスを返す（存在しない・失効している場合はNone）"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return litellm.ModelResponse(**json.loads(row[0]))
+
+    def put(self, key: str, model: str, response: Any):
+        """レスポンスをキャッシュに保存し、最大件数を超えた分を削除する"""
+        now = time.time()
+        payload = response.model_dump_json()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, payload, now, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミス数などの統計を返す"""
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries,
+            }
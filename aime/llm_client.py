@@ -2,12 +2,59 @@
 LLM API呼び出しを一元管理するクライアント
 Langfuse統合とエラーハンドリングを含む
 """
+import asyncio
+import contextlib
+import threading
 import time
-from typing import Dict, List, Optional, Any
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Any
 import litellm
 from litellm import RateLimitError
 from langfuse import observe
 from aime.config import config
+from aime.llm_cache import LLMResponseCache
+from aime.metrics import metrics
+from aime.rate_limiter import AIMDController, ModelRateLimiter, backoff_delay, parse_retry_after
+
+
+@dataclass
+class StreamResult:
+    """ストリーミング呼び出しの結果と計測値"""
+
+    text: str
+    ttft: Optional[float]  # 最初のトークンが届くまでの秒数
+    elapsed: float  # 呼び出し開始から受信終了（または打ち切り）までの秒数
+    early_stopped: bool  # stop_whenにより受信を打ち切ったか
+    finish_reason: Optional[str] = None
+
+
+def _close_stream(stream: Any):
+    """打ち切ったストリームの接続を閉じ、以降のトークン生成を受信しないようにする"""
+    close = getattr(getattr(stream, "completion_stream", None), "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def _response_usage(response: Any) -> Optional[tuple]:
+    """レスポンスの (プロンプトのトークン数, 生成したトークン数) を返す（使用量が含まれない場合はNone）"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """レート制限エラーのレスポンスヘッダーから、サーバーが指示した待機秒数を取り出す"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if retry_after_ms := headers.get("retry-after-ms"):
+            return max(0.0, float(retry_after_ms) / 1000)
+    except (TypeError, ValueError):
+        pass
+    return parse_retry_after(headers.get("retry-after"))
 
 
 class LLMClient:
@@ -17,6 +64,186 @@ class LLMClient:
         """LLMクライアントを初期化"""
         # litellm設定
         litellm.api_key = config.openai_api_key
+        self._cache: Optional[LLMResponseCache] = None
+        self._cache_lock = threading.Lock()
+        self._stream_stats = {"calls": 0, "early_stops": 0, "ttft_total": 0.0, "ttft_count": 0}
+        self._stream_stats_lock = threading.Lock()
+        # プロセス全体で共有するモデルごとのレート制限と、Actorの同時実行数の自動調整
+        self.rate_limiter = ModelRateLimiter()
+        self.concurrency = AIMDController()
+        self._resolved_models = set()
+        self._resolved_models_lock = threading.Lock()
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._unpriced_models = set()  # 料金表にないモデル（コストの計算を繰り返さない）
+
+    @property
+    def cache(self) -> Optional[LLMResponseCache]:
+        """レスポンスキャッシュ（config.llm_cache_enabledがFalseの場合はNone）"""
+        if not config.llm_cache_enabled:
+            return None
+        with self._cache_lock:
+            if self._cache is None:
+                self._cache = LLMResponseCache(
+                    config.llm_cache_path,
+                    ttl_seconds=config.llm_cache_ttl_seconds,
+                    max_entries=config.llm_cache_max_entries,
+                )
+            return self._cache
+
+    def _cache_for(self, params: Dict[str, Any], cache: Optional[bool] = None) -> Optional[LLMResponseCache]:
+        """
+        リクエストがキャッシュ対象であればキャッシュを返す
+
+        既定では低温度の呼び出しのみ対象とし、呼び出し元が cache=True を指定した場合は温度にかかわらず対象にする
+        （前回の生成結果を使い回してよい呼び出し）。cache=False の場合は対象にしない。
+        """
+        if params.get("stream") or cache is False:
+            return None
+        if cache is None and params["temperature"] > config.llm_cache_max_temperature:
+            return None
+        return self.cache
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """キャッシュのヒット・ミス数を返す（キャッシュ無効時はNone）"""
+        return self._cache.stats() if self._cache is not None else None
+
+    def _record_stream(self, result: StreamResult):
+        with self._stream_stats_lock:
+            self._stream_stats["calls"] += 1
+            self._stream_stats["early_stops"] += int(result.early_stopped)
+            if result.ttft is not None:
+                self._stream_stats["ttft_total"] += result.ttft
+                self._stream_stats["ttft_count"] += 1
+
+    def stream_stats(self) -> Optional[Dict[str, Any]]:
+        """ストリーミング呼び出しの統計（呼び出し数、早期停止数、平均TTFT）を返す（未使用時はNone）"""
+        with self._stream_stats_lock:
+            stats = dict(self._stream_stats)
+        if not stats["calls"]:
+            return None
+        return {
+            "calls": stats["calls"],
+            "early_stops": stats["early_stops"],
+            "avg_ttft": stats["ttft_total"] / stats["ttft_count"] if stats["ttft_count"] else None,
+        }
+
+    def _estimate_request_tokens(self, params: Dict[str, Any]) -> float:
+        """
+        モデルのレート制限の設定を解決し、TPMの制限がある場合は送信前にトークン数を見積もる
+
+        Returns:
+            プロンプトのトークン数と生成トークン数の上限（max_tokens）の合計（TPMの制限がない場合は0）
+        """
+        model = params["model"]
+        with self._resolved_models_lock:
+            if model not in self._resolved_models:
+                self._resolved_models.add(model)
+                limits = config.llm_model_rate_limits.get(model, {})
+                rpm = limits.get("rpm", config.llm_requests_per_minute)
+                tpm = limits.get("tpm", config.llm_tokens_per_minute)
+                if rpm or tpm:
+                    self.rate_limiter.configure(model, rpm, tpm)
+        if not self.rate_limiter.limits_tokens(model):
+            return 0.0
+        try:
+            prompt_tokens = litellm.token_counter(model=model, messages=params["messages"])
+        except Exception:
+            prompt_tokens = 0
+        return prompt_tokens + (params.get("max_tokens") or config.llm_expected_completion_tokens)
+
+    def _wait_for_capacity(self, params: Dict[str, Any]) -> float:
+        """モデルのRPM・TPMに空きができるまで待ち、見積もったトークン数を返す"""
+        estimated = self._estimate_request_tokens(params)
+        if waited := self.rate_limiter.acquire(params["model"], estimated):
+            metrics.observe("aime_llm_rate_limit_wait_seconds", waited, model=params["model"])
+        return estimated
+
+    async def _await_capacity(self, params: Dict[str, Any]) -> float:
+        """_wait_for_capacityの非同期版"""
+        estimated = self._estimate_request_tokens(params)
+        if waited := await self.rate_limiter.aacquire(params["model"], estimated):
+            metrics.observe("aime_llm_rate_limit_wait_seconds", waited, model=params["model"])
+        return estimated
+
+    @contextlib.contextmanager
+    def _track_in_flight(self):
+        with self._in_flight_lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+    def _on_success(self, params: Dict[str, Any], estimated: float, response: Any, usage: Optional[tuple]):
+        """成功した呼び出しをレート制限と同時実行数の調整に反映する"""
+        model = params["model"]
+        self.concurrency.on_success()
+        if usage is not None:
+            self.rate_limiter.settle(model, estimated, sum(usage))
+        if config.llm_rate_limits_from_headers and not self.rate_limiter.is_configured(model):
+            headers = (getattr(response, "_hidden_params", None) or {}).get("additional_headers") or {}
+            if self.rate_limiter.configure_from_headers(model, headers):
+                print(
+                    f"--- {model} のレート制限をレスポンスヘッダーから設定しました "
+                    f"(RPM {headers.get('x-ratelimit-limit-requests', '-')}, TPM {headers.get('x-ratelimit-limit-tokens', '-')}) ---"
+                )
+
+    def _on_rate_limited(self, params: Dict[str, Any], error: Exception, attempt: int) -> float:
+        """
+        レート制限を受けたとき、同じモデルへの送信を全スレッドでまとめて止め、必要ならActorの同時実行数を下げる
+
+        Returns:
+            再試行までの待機秒数（Retry-Afterがあればそれに従い、なければジッター付きの指数バックオフ）
+        """
+        delay = backoff_delay(attempt, config.llm_retry_base_delay, config.llm_retry_max_delay, _retry_after(error))
+        self.rate_limiter.block(params["model"], delay)
+        if config.llm_adaptive_concurrency:
+            with self._in_flight_lock:
+                in_flight = self._in_flight
+            # 制限を受けた呼び出し自身は既に完了しているため、その分を加える
+            self.concurrency.on_throttle(in_flight + 1)
+        return delay
+
+    def _record_metrics(
+        self, params: Dict[str, Any], call_site: str, outcome: str, elapsed: Optional[float] = None, usage: Optional[tuple] = None
+    ):
+        """1回の呼び出しの所要時間・トークン数・推定コストをメトリクスに記録する"""
+        if not config.metrics_enabled:
+            return
+        labels = {"model": params["model"], "call_site": call_site}
+        metrics.inc("aime_llm_requests_total", outcome=outcome, **labels)
+        if elapsed is not None:
+            metrics.observe("aime_llm_request_duration_seconds", elapsed, **labels)
+        if usage is None:
+            return
+        prompt_tokens, completion_tokens = usage
+        metrics.inc("aime_llm_tokens_total", prompt_tokens, type="prompt", **labels)
+        metrics.inc("aime_llm_tokens_total", completion_tokens, type="completion", **labels)
+        if params["model"] in self._unpriced_models:
+            return
+        try:
+            prompt_cost, completion_cost = litellm.cost_per_token(
+                model=params["model"], prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+            )
+        except Exception:
+            # 料金表にないモデルはコストを記録しない
+            self._unpriced_models.add(params["model"])
+            return
+        metrics.inc("aime_llm_cost_usd_total", prompt_cost + completion_cost, **labels)
+
+    def _estimate_usage(self, params: Dict[str, Any], text: str) -> Optional[tuple]:
+        """ストリーミング応答には使用量が含まれないため、送信したメッセージと受信したテキストからトークン数を見積もる"""
+        if not config.metrics_enabled and not self.rate_limiter.limits_tokens(params["model"]):
+            return None
+        try:
+            return (
+                litellm.token_counter(model=params["model"], messages=params["messages"]),
+                litellm.token_counter(model=params["model"], text=text) if text else 0,
+            )
+        except Exception:
+            return None
 
     @observe(name="llm-completion")
     def completion(
@@ -26,6 +253,8 @@ class LLMClient:
         temperature: Optional[float] = None,
         response_format: Optional[Dict[str, Any]] = None,
         max_retries: Optional[int] = None,
+        call_site: str = "other",
+        cache: Optional[bool] = None,
         **kwargs
     ) -> Any:
         """
@@ -37,6 +266,9 @@ class LLMClient:
             temperature: 生成温度（デフォルト: config.default_temperature）
             response_format: レスポンス形式指定
             max_retries: 最大再試行回数（デフォルト: config.max_retries）
+            call_site: メトリクスに記録する呼び出し元（"decompose" / "actor_turn" など）
+            cache: レスポンスキャッシュの対象にするか（Noneの場合は温度が llm_cache_max_temperature 以下の呼び出しのみ。
+                Trueで温度にかかわらず対象、Falseで対象外）
             **kwargs: その他のパラメータ
 
         Returns:
@@ -45,39 +277,281 @@ class LLMClient:
         Raises:
             Exception: 最大再試行回数に達した場合
         """
-        model = model or config.openai_model
-        temperature = temperature or config.default_temperature
+        params = self._build_params(messages, model, temperature, response_format, **kwargs)
         max_retries = max_retries or config.max_retries
 
-        delay = 5
+        cache = self._cache_for(params, cache)
+        if cache is not None:
+            cache_key = cache.make_key(params)
+            if (cached := cache.get(cache_key)) is not None:
+                self._record_metrics(params, call_site, "cache_hit")
+                return cached
+
         for attempt in range(max_retries):
+            estimated = self._wait_for_capacity(params)
+            started = time.perf_counter()
             try:
-                params = {
-                    "model": model,
-                    "messages": messages,
-                    "temperature": temperature,
-                    **kwargs,
-                }
-                if response_format:
-                    params["response_format"] = response_format
-
-                response = litellm.completion(**params)
+                with self._track_in_flight():
+                    response = litellm.completion(**params)
+                usage = _response_usage(response)
+                self._record_metrics(params, call_site, "success", time.perf_counter() - started, usage)
+                self._on_success(params, estimated, response, usage)
+                if cache is not None:
+                    cache.put(cache_key, params["model"], response)
                 return response
 
-            except RateLimitError:
+            except RateLimitError as e:
+                self._record_metrics(params, call_site, "rate_limited", time.perf_counter() - started)
+                delay = self._on_rate_limited(params, e, attempt)
                 if attempt < max_retries - 1:
-                    print(f"レートリミットエラー。{delay}秒待って再試行します... ({attempt + 1}/{max_retries})")
+                    print(f"レートリミットエラー。{delay:.1f}秒待って再試行します... ({attempt + 1}/{max_retries})")
                     time.sleep(delay)
-                    delay *= 2
                 else:
                     raise
 
             except Exception as e:
+                self._record_metrics(params, call_site, "error", time.perf_counter() - started)
+                print(f"予期せぬAPIエラー: {e}")
+                raise
+
+        raise Exception("APIリクエストが最大再試行回数に達しました。")
+
+    @observe(name="llm-acompletion")
+    async def acompletion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        max_retries: Optional[int] = None,
+        call_site: str = "other",
+        cache: Optional[bool] = None,
+        **kwargs
+    ) -> Any:
+        """
+        LLM APIを非同期に呼び出してレスポンスを取得（引数はcompletionと同じ）
+
+        待機中はスレッドをブロックせず、イベントループに制御を返す。
+        """
+        params = self._build_params(messages, model, temperature, response_format, **kwargs)
+        max_retries = max_retries or config.max_retries
+
+        cache = self._cache_for(params, cache)
+        if cache is not None:
+            cache_key = cache.make_key(params)
+            if (cached := cache.get(cache_key)) is not None:
+                self._record_metrics(params, call_site, "cache_hit")
+                return cached
+
+        for attempt in range(max_retries):
+            estimated = await self._await_capacity(params)
+            started = time.perf_counter()
+            try:
+                with self._track_in_flight():
+                    response = await litellm.acompletion(**params)
+                usage = _response_usage(response)
+                self._record_metrics(params, call_site, "success", time.perf_counter() - started, usage)
+                self._on_success(params, estimated, response, usage)
+                if cache is not None:
+                    cache.put(cache_key, params["model"], response)
+                return response
+
+            except RateLimitError as e:
+                self._record_metrics(params, call_site, "rate_limited", time.perf_counter() - started)
+                delay = self._on_rate_limited(params, e, attempt)
+                if attempt < max_retries - 1:
+                    print(f"レートリミットエラー。{delay:.1f}秒待って再試行します... ({attempt + 1}/{max_retries})")
+                    await asyncio.sleep(delay)
+                else:
+                    raise
+
+            except Exception as e:
+                self._record_metrics(params, call_site, "error", time.perf_counter() - started)
                 print(f"予期せぬAPIエラー: {e}")
                 raise
 
         raise Exception("APIリクエストが最大再試行回数に達しました。")
 
+    @observe(name="llm-stream-completion")
+    def stream_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        stop_when: Optional[Callable[[str], bool]] = None,
+        max_retries: Optional[int] = None,
+        call_site: str = "other",
+        **kwargs
+    ) -> StreamResult:
+        """
+        LLM APIをストリーミングで呼び出し、受信しながら打ち切り判定を行う
+
+        Args:
+            messages: 会話履歴のメッセージリスト
+            model: 使用するモデル名（デフォルト: config.openai_model）
+            temperature: 生成温度（デフォルト: config.default_temperature）
+            stop_when: 受信した差分テキストを受け取り、Trueを返したら受信を打ち切る関数
+            max_retries: 最大再試行回数（デフォルト: config.max_retries）
+            call_site: メトリクスに記録する呼び出し元
+            **kwargs: その他のパラメータ（stopシーケンスなど）
+
+        Returns:
+            受信したテキストとTTFTなどの計測値
+        """
+        params = self._build_params(messages, model, temperature, None, stream=True, **kwargs)
+        max_retries = max_retries or config.max_retries
+
+        for attempt in range(max_retries):
+            estimated = self._wait_for_capacity(params)
+            started = time.perf_counter()
+            parts: List[str] = []
+            try:
+                # 受信が終わるまでを1回の呼び出しとして扱う（受信中のエラーも再試行・メトリクスの対象にする）
+                with self._track_in_flight():
+                    stream = litellm.completion(**params)
+                    result = self._consume_stream(stream, started, stop_when, parts)
+                break
+            except RateLimitError as e:
+                self._record_metrics(params, call_site, "rate_limited", time.perf_counter() - started)
+                delay = self._on_rate_limited(params, e, attempt)
+                # 受信済みの差分はstop_whenに渡してしまっているため、途中からは再試行できない
+                if attempt < max_retries - 1 and not parts:
+                    print(f"レートリミットエラー。{delay:.1f}秒待って再試行します... ({attempt + 1}/{max_retries})")
+                    time.sleep(delay)
+                else:
+                    raise
+            except Exception as e:
+                self._record_metrics(params, call_site, "error", time.perf_counter() - started)
+                print(f"予期せぬAPIエラー: {e}")
+                raise
+        else:
+            raise Exception("APIリクエストが最大再試行回数に達しました。")
+
+        return self._finish_stream(params, call_site, estimated, stream, result)
+
+    @observe(name="llm-astream-completion")
+    async def astream_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        stop_when: Optional[Callable[[str], bool]] = None,
+        max_retries: Optional[int] = None,
+        call_site: str = "other",
+        **kwargs
+    ) -> StreamResult:
+        """stream_completionの非同期版"""
+        params = self._build_params(messages, model, temperature, None, stream=True, **kwargs)
+        max_retries = max_retries or config.max_retries
+
+        for attempt in range(max_retries):
+            estimated = await self._await_capacity(params)
+            started = time.perf_counter()
+            parts: List[str] = []
+            try:
+                with self._track_in_flight():
+                    stream = await litellm.acompletion(**params)
+                    result = await self._aconsume_stream(stream, started, stop_when, parts)
+                break
+            except RateLimitError as e:
+                self._record_metrics(params, call_site, "rate_limited", time.perf_counter() - started)
+                delay = self._on_rate_limited(params, e, attempt)
+                if attempt < max_retries - 1 and not parts:
+                    print(f"レートリミットエラー。{delay:.1f}秒待って再試行します... ({attempt + 1}/{max_retries})")
+                    await asyncio.sleep(delay)
+                else:
+                    raise
+            except Exception as e:
+                self._record_metrics(params, call_site, "error", time.perf_counter() - started)
+                print(f"予期せぬAPIエラー: {e}")
+                raise
+        else:
+            raise Exception("APIリクエストが最大再試行回数に達しました。")
+
+        return self._finish_stream(params, call_site, estimated, stream, result)
+
+    @staticmethod
+    def _consume_stream(
+        stream: Any, started: float, stop_when: Optional[Callable[[str], bool]], parts: List[str]
+    ) -> StreamResult:
+        """
+        ストリームを受信し、stop_whenがTrueを返した時点で打ち切る
+
+        Args:
+            parts: 受信した差分テキストを追加するリスト（途中でエラーになった場合に、受信済みかを呼び出し側で判定する）
+        """
+        ttft, early_stopped, finish_reason = None, False, None
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - started
+            parts.append(delta)
+            if stop_when is not None and stop_when(delta):
+                early_stopped = True
+                _close_stream(stream)
+                break
+        return StreamResult("".join(parts), ttft, time.perf_counter() - started, early_stopped, finish_reason)
+
+    @staticmethod
+    async def _aconsume_stream(
+        stream: Any, started: float, stop_when: Optional[Callable[[str], bool]], parts: List[str]
+    ) -> StreamResult:
+        """_consume_streamの非同期版"""
+        ttft, early_stopped, finish_reason = None, False, None
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - started
+            parts.append(delta)
+            if stop_when is not None and stop_when(delta):
+                early_stopped = True
+                if hasattr(stream, "aclose"):
+                    try:
+                        await stream.aclose()
+                    except Exception:
+                        pass
+                break
+        return StreamResult("".join(parts), ttft, time.perf_counter() - started, early_stopped, finish_reason)
+
+    def _finish_stream(
+        self, params: Dict[str, Any], call_site: str, estimated: float, stream: Any, result: StreamResult
+    ) -> StreamResult:
+        """受信を終えたストリーミング呼び出しを、計測値・メトリクス・レート制限に反映する"""
+        self._record_stream(result)
+        usage = self._estimate_usage(params, result.text)
+        self._record_metrics(params, call_site, "success", result.elapsed, usage)
+        self._on_success(params, estimated, stream, usage)
+        return result
+
+    def _build_params(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        temperature: Optional[float],
+        response_format: Optional[Dict[str, Any]],
+        **kwargs
+    ) -> Dict[str, Any]:
+        """litellmに渡すリクエストパラメータを組み立てる"""
+        params = {
+            "model": model or config.openai_model,
+            "messages": messages,
+            "temperature": config.default_temperature if temperature is None else temperature,
+            **kwargs,
+        }
+        if response_format:
+            params["response_format"] = response_format
+        return params
+
     def completion_mini(
         self,
         messages: List[Dict[str, str]],
@@ -102,6 +576,20 @@ class LLMClient:
             **kwargs
         )
 
+    async def acompletion_mini(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        **kwargs
+    ) -> Any:
+        """軽量タスク用のminiモデルでAPIを非同期に呼び出し"""
+        return await self.acompletion(
+            messages=messages,
+            model=config.openai_mini_model,
+            temperature=temperature,
+            **kwargs
+        )
+
 
 # グローバルLLMクライアントインスタンス
-llm_client = LLMClient()
\ No newline at end of file
+llm_client = LLMClient()
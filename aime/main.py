@@ -1,28 +1,60 @@
-import os
+import argparse
+import asyncio
 from dotenv import load_dotenv
 from langfuse.langchain import CallbackHandler
 from litellm import success_callback
+from aime.batch import BatchRunner, load_goals
+from aime.config import config
 from aime.planner import DynamicPlanner
 
 
 def main():
     """メイン実行関数"""
+    parser = argparse.ArgumentParser(description="Aimeフレームワークを実行する")
+    parser.add_argument("--resume", metavar="RUN_ID", help="中断した実行をジャーナルから再開する")
+    parser.add_argument("--batch", metavar="FILE", help="JSONLファイルの複数のゴールを同時に実行する")
+    parser.add_argument("--output-dir", help="バッチ実行の出力先（再開時は、再開する実行の出力先を指定する）")
+    parser.add_argument("--max-runs", type=int, help="バッチ実行で同時に実行するゴール数")
+    parser.add_argument("--workers", type=int, help="バッチ実行で全ゴールが共有するActorの同時実行数の上限")
+    args = parser.parse_args()
+
     # .envファイルから環境変数を読み込む
     load_dotenv()
 
     langfuse_callback_handler = CallbackHandler()
     success_callback.append(langfuse_callback_handler)
-    
+
+    # 複数のゴールのバッチ実行
+    if args.batch:
+        runner = BatchRunner(args.output_dir, max_workers=args.workers, max_runs=args.max_runs)
+        goals = load_goals(args.batch)
+        if config.execution_mode == "async":
+            asyncio.run(runner.arun(goals))
+        else:
+            runner.run(goals)
+        return
+
     # AimeのDynamic Plannerを初期化
-    planner = DynamicPlanner()
+    planner = DynamicPlanner(output_dir=args.output_dir)
 
     # ユーザーからのリクエスト
     user_request = (
         "東京での1泊2日の完璧な観光プランを作成してください。移動手段と予算の見積もりもお願いします。"
     )
 
+    # 中断した実行の再開
+    if args.resume:
+        if config.execution_mode == "async":
+            asyncio.run(planner.aresume(args.resume))
+        else:
+            planner.resume(args.resume)
+        return
+
     # Aimeフレームワークを実行
-    planner.run(user_request)
+    if config.execution_mode == "async":
+        asyncio.run(planner.arun(user_request))
+    else:
+        planner.run(user_request)
 
 
 if __name__ == "__main__":
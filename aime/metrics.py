@@ -0,0 +1,266 @@
+"""
+実行メトリクスの収集と出力
+LLM呼び出し・ツール実行・タスクの待ち時間などのカウンタとヒストグラムをプロセス内で集計し、
+実行終了時にJSONの要約またはPrometheusのテキスト形式で出力する（Langfuseの設定の有無に依存しない）
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from aime.config import config
+
+# 秒単位の所要時間のバケット境界
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# 回数のバケット境界（Actorのターン数など）
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+# メトリクス名ごとの種類、説明、ヒストグラムのバケット境界
+METRIC_DEFINITIONS: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = {
+    "aime_llm_requests_total": ("counter", "LLM呼び出しの回数（outcome: success / error / rate_limited / cache_hit）", None),
+    "aime_llm_request_duration_seconds": ("histogram", "LLM呼び出し1回あたりの所要時間", LATENCY_BUCKETS),
+    "aime_llm_tokens_total": ("counter", "LLM呼び出しのトークン数（type: prompt / completion）", None),
+    "aime_llm_cost_usd_total": ("counter", "LLM呼び出しの推定コスト（USD）", None),
+    "aime_llm_rate_limit_wait_seconds": ("histogram", "送信前にモデルのRPM・TPMの空きを待った時間", LATENCY_BUCKETS),
+    "aime_tool_calls_total": ("counter", "ツール呼び出しの回数（outcome: success / error）", None),
+    "aime_tool_duration_seconds": ("histogram", "ツール呼び出し1回あたりの所要時間", LATENCY_BUCKETS),
+    "aime_task_queue_wait_seconds": ("histogram", "タスクが実行可能になってから実行が始まるまでの待ち時間", LATENCY_BUCKETS),
+    "aime_task_execution_seconds": ("histogram", "タスクの実行開始から完了・失敗までの所要時間", LATENCY_BUCKETS),
+    "aime_actor_turns": ("histogram", "タスク1件あたりのActorのターン数", COUNT_BUCKETS),
+    "aime_actor_generation_tokens_total": (
+        "counter",
+        "Actorのターンで行動行以降に生成されたトークン数（kind: avoided: 早期停止で生成させずに済んだ推定値 / wasted: 生成されて捨てた分）",
+        None,
+    ),
+    "aime_replans_total": ("counter", "適用した再計画の回数（scope: subgraph / full）", None),
+    "aime_prewarm_total": (
+        "counter",
+        "依存タスクの完了前に用意したActorの件数（outcome: used / not_started / discarded）",
+        None,
+    ),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    """累積ではない各バケットの件数と、合計・件数・最小・最大を保持するヒストグラム"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 末尾は +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """バケット内を線形補間して分位点を推定する"""
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else min(0.0, self.min)
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5) if self.count else None,
+            "p95": self.quantile(0.95) if self.count else None,
+        }
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = (*labels, *extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in items) + "}"
+
+
+def _format_number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """
+    プロセス全体で共有するメトリクスの集計器。
+    スレッドとイベントループのどちらから呼んでもよい（更新は1つのロックの下で辞書を書き換えるだけ）。
+    config.metrics_enabled がFalseの場合、記録は何もしない。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._histograms: Dict[Tuple[str, LabelKey], _Histogram] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, LabelKey]:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        """カウンタを加算する"""
+        if not config.metrics_enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        """ヒストグラムに値を1件記録する（バケット境界は METRIC_DEFINITIONS の定義に従う）"""
+        if not config.metrics_enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                definition = METRIC_DEFINITIONS.get(name)
+                histogram = self._histograms[key] = _Histogram(definition[2] if definition else LATENCY_BUCKETS)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_dict(self) -> Dict[str, List[Dict]]:
+        """メトリクス名ごとに、ラベルと値（ヒストグラムは件数・合計・平均・分位点など）の一覧を返す"""
+        with self._lock:
+            result: Dict[str, List[Dict]] = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                result.setdefault(name, []).append({"labels": dict(labels), **histogram.to_dict()})
+            return result
+
+    def to_prometheus(self) -> str:
+        """Prometheusのテキスト形式（node_exporterのtextfileコレクタなどで読み込める）に変換する"""
+        with self._lock:
+            series: Dict[str, List[str]] = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                lines = series.setdefault(name, [])
+                cumulative = 0
+                for bound, bucket_count in zip((*histogram.buckets, math.inf), histogram.counts):
+                    cumulative += bucket_count
+                    le = (("le", _format_number(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(histogram.sum)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        output = []
+        for name, lines in series.items():
+            metric_type, help_text, _ = METRIC_DEFINITIONS.get(name, ("untyped", "", None))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(lines)
+        return "\n".join(output) + "\n"
+
+    def export(self, path: str, fmt: str = "json"):
+        """
+        メトリクスをファイルに書き出す
+
+        Args:
+            path: 出力先のパス
+            fmt: "json" または "prometheus"
+        """
+        if fmt not in ("json", "prometheus"):
+            raise ValueError(f"不明なメトリクスの出力形式です: {fmt}")
+        content = self.to_prometheus() if fmt == "prometheus" else json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def format_summary(self) -> str:
+        """時間とコストの内訳を、コンソール表示用の短い表にまとめる"""
+        data = self.to_dict()
+        lines = []
+
+        llm: Dict[Tuple[str, str], Dict[str, float]] = {}
+        for entry in data.get("aime_llm_request_duration_seconds", []):
+            row = llm.setdefault((entry["labels"]["call_site"], entry["labels"]["model"]), {})
+            row["calls"], row["seconds"] = entry["count"], entry["sum"]
+        for entry in data.get("aime_llm_tokens_total", []):
+            row = llm.setdefault((entry["labels"]["call_site"], entry["labels"]["model"]), {})
+            row[entry["labels"]["type"]] = row.get(entry["labels"]["type"], 0) + entry["value"]
+        for entry in data.get("aime_llm_cost_usd_total", []):
+            row = llm.setdefault((entry["labels"]["call_site"], entry["labels"]["model"]), {})
+            row["cost"] = row.get("cost", 0.0) + entry["value"]
+        if llm:
+            lines.append("LLM呼び出し（呼び出し元 / モデル: 回数, 合計時間, プロンプト/生成トークン, 推定コスト）")
+            for (site, model), row in sorted(llm.items(), key=lambda item: -item[1].get("seconds", 0.0)):
+                lines.append(
+                    f"  {site} / {model}: {int(row.get('calls', 0))}回, {row.get('seconds', 0.0):.1f}秒, "
+                    f"{int(row.get('prompt', 0))}/{int(row.get('completion', 0))}トークン, ${row.get('cost', 0.0):.4f}"
+                )
+
+        tools: Dict[str, Dict[str, float]] = {}
+        for entry in data.get("aime_tool_calls_total", []):
+            row = tools.setdefault(entry["labels"]["tool"], {})
+            row[entry["labels"]["outcome"]] = row.get(entry["labels"]["outcome"], 0) + entry["value"]
+        for entry in data.get("aime_tool_duration_seconds", []):
+            tools.setdefault(entry["labels"]["tool"], {})["seconds"] = entry["sum"]
+        if tools:
+            lines.append("ツール呼び出し（回数, 合計時間, エラー率）")
+            for tool, row in sorted(tools.items()):
+                calls = row.get("success", 0) + row.get("error", 0)
+                error_rate = row.get("error", 0) / calls if calls else 0.0
+                lines.append(f"  {tool}: {int(calls)}回, {row.get('seconds', 0.0):.1f}秒, エラー率 {error_rate:.0%}")
+
+        for name, label in (("aime_task_queue_wait_seconds", "待ち時間"), ("aime_task_execution_seconds", "実行時間")):
+            for entry in data.get(name, []):
+                suffix = f" ({entry['labels']['status']})" if "status" in entry["labels"] else ""
+                lines.append(
+                    f"タスクの{label}{suffix}: {entry['count']}件, 平均 {entry['mean']:.2f}秒, p95 {entry['p95']:.2f}秒"
+                )
+        for entry in data.get("aime_actor_turns", []):
+            lines.append(f"Actorのターン数: 平均 {entry['mean']:.1f}, 最大 {int(entry['max'])}")
+        generation = {
+            entry["labels"]["kind"]: int(entry["value"]) for entry in data.get("aime_actor_generation_tokens_total", [])
+        }
+        if generation:
+            lines.append(
+                f"行動行以降の生成: 早期停止で回避 {generation.get('avoided', 0)}トークン（推定）, "
+                f"生成して捨てた分 {generation.get('wasted', 0)}トークン"
+            )
+        replans = {entry["labels"]["scope"]: int(entry["value"]) for entry in data.get("aime_replans_total", [])}
+        if replans:
+            lines.append("再計画: " + ", ".join(f"{scope} {count}回" for scope, count in sorted(replans.items())))
+        prewarm = {entry["labels"]["outcome"]: int(entry["value"]) for entry in data.get("aime_prewarm_total", [])}
+        if prewarm:
+            lines.append(
+                f"Actorの事前準備: 使用 {prewarm.get('used', 0)}件, 間に合わず {prewarm.get('not_started', 0)}件, "
+                f"破棄 {prewarm.get('discarded', 0)}件"
+            )
+        return "\n".join(lines)
+
+
+# グローバルメトリクスインスタンス
+metrics = MetricsRegistry()
@@ -0,0 +1,263 @@
+"""
+Webページの取得と本文の抽出
+接続はkeep-aliveで使い回し、同じホストへの同時接続数を制限する。本文はダウンロードしながら少しずつ抽出し、
+サイズ・時間・文字数の上限に達した時点で打ち切るため、ページ全体をメモリに読み込まない
+"""
+
+import codecs
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from urllib3.exceptions import ReadTimeoutError
+
+from aime.search_cache import SearchCache
+
+# 本文として扱わない要素（中身ごと読み飛ばす）
+_SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "canvas"}
+
+# 前後で改行を入れるブロック要素
+_BLOCK_TAGS = set(
+    "address article aside blockquote br dd div dl dt figcaption footer form h1 h2 h3 h4 h5 h6 "
+    "header hr li main nav ol p pre section table td th tr ul".split()
+)
+
+_CHARSET_PATTERN = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+_META_CHARSET_PATTERN = re.compile(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+# 本文を抽出するContent-Type（それ以外のバイナリなどは取得しない）
+_TEXT_CONTENT_TYPES = ("text/", "html", "xml", "json")
+
+# 1回の読み込みで受け取る最大バイト数（届いた分だけを受け取り、次の読み込みの前に残り時間を確認する）
+_READ_CHUNK_BYTES = 16 * 1024
+
+
+class _TextExtractor(HTMLParser):
+    """HTMLを少しずつ受け取り、本文のテキストを max_chars 文字まで取り出す"""
+
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.title = ""
+        self._parts: List[str] = []
+        self._length = 0
+        self._skip_depth = 0
+        self._in_title = False
+
+    @property
+    def done(self) -> bool:
+        return self._length >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in _BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in _BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title = re.sub(r"\s+", " ", self.title + data).strip()
+            return
+        if self._skip_depth or self.done:
+            return
+        text = re.sub(r"\s+", " ", data)
+        if text.strip():
+            self._parts.append(text)
+            self._length += len(text)
+
+    def text(self) -> str:
+        text = re.sub(r" *\n[\s]*", "\n", "".join(self._parts)).strip()
+        return text[: self.max_chars]
+
+
+class PageFetcher:
+    """
+    全Actorで共有するページ取得クライアント。
+    requests.Sessionの接続プールでkeep-aliveの接続を使い回し、ホストごとのセマフォで同時接続数を制限する。
+    取得した本文は、URLをキーにTTL付きでキャッシュする（同じURLの同時取得は1回にまとめる）。
+    """
+
+    def __init__(
+        self,
+        timeout: float,
+        max_bytes: int,
+        max_chars: int,
+        per_host: int,
+        max_workers: int,
+        cache_ttl_seconds: int,
+        cache_max_entries: int,
+    ):
+        """
+        Args:
+            timeout: 1ページの取得にかける時間の上限（秒）
+            max_bytes: 1ページでダウンロードするバイト数の上限
+            max_chars: 1ページから取り出す本文の最大文字数
+            per_host: 同じホストへの同時接続数
+            max_workers: 複数のURLをまとめて取得する際の同時取得数
+            cache_ttl_seconds: 取得した本文のキャッシュ期間
+            cache_max_entries: キャッシュするページ数の上限
+        """
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.per_host = per_host
+        self.cache = SearchCache(ttl_seconds=cache_ttl_seconds, max_entries=cache_max_entries, persist_path="")
+        self._session = requests.Session()
+        self._session.headers.update(
+            {"User-Agent": "Mozilla/5.0 (compatible; aime-workflow)", "Accept-Language": "ja,en;q=0.8"}
+        )
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=max(1, per_host))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="page-fetch")
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._host_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(max(1, self.per_host))
+            return slot
+
+    def fetch(self, url: str) -> str:
+        """ページの本文を返す（キャッシュ済みの場合はキャッシュを使う）"""
+        # URLはパスの大文字・小文字を区別するため、正規化せずにキーにする
+        return self.cache.get_or_fetch("page", url, lambda: self._fetch_uncached(url), normalize=False)
+
+    def fetch_many(self, urls: List[str]) -> List[str]:
+        """複数のページを並行して取得し、URLの順に本文を返す"""
+        if len(urls) == 1:
+            return [self.fetch(urls[0])]
+        return list(self._executor.map(self.fetch, urls))
+
+    def _fetch_uncached(self, url: str) -> Tuple[str, bool]:
+        """ページを取得し、（本文, キャッシュ可否）を返す"""
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.netloc:
+            return f"エラー: http(s)のURLを指定してください: {url}", False
+
+        deadline = time.monotonic() + self.timeout
+        slot = self._host_slot(parsed.netloc)
+        if not slot.acquire(timeout=self.timeout):
+            return f"エラー: {parsed.netloc} への接続待ちが{self.timeout:.0f}秒を超えました: {url}", False
+        try:
+            # 接続と応答ヘッダーの受信にも、接続待ちの後の残り時間だけをかける
+            remaining = max(0.1, deadline - time.monotonic())
+            with self._session.get(url, stream=True, timeout=remaining) as response:
+                if response.status_code >= 400:
+                    # 404などのクライアントエラーは取得し直しても同じなのでキャッシュする
+                    return f"エラー: HTTP {response.status_code} {response.reason}: {url}", response.status_code < 500
+                content_type = response.headers.get("Content-Type", "").lower()
+                if content_type and not any(kind in content_type for kind in _TEXT_CONTENT_TYPES):
+                    return f"エラー: テキストではないコンテンツのため取得しません ({content_type}): {url}", True
+                title, text, note, timed_out = self._extract(response, content_type, deadline)
+        except (requests.RequestException, Urllib3HTTPError) as e:
+            return f"ページの取得中にエラーが発生しました: {url}: {e}", False
+        finally:
+            slot.release()
+
+        lines = [f"URL: {response.url}"]
+        if title:
+            lines.append(f"タイトル: {title}")
+        lines.append(text or "（本文のテキストが見つかりませんでした）")
+        if note:
+            lines.append(f"（{note}）")
+        # 時間の上限で打ち切った場合は、次回は最後まで取得できる可能性があるのでキャッシュしない
+        return "\n".join(lines), not timed_out
+
+    def _extract(
+        self, response: requests.Response, content_type: str, deadline: float
+    ) -> Tuple[str, str, Optional[str], bool]:
+        """
+        レスポンスを少しずつ読みながら本文を抽出する
+
+        Returns:
+            （タイトル, 本文, 打ち切った場合の注記, 時間の上限で打ち切ったか）
+        """
+        is_html = "html" in content_type or not content_type
+        extractor = _TextExtractor(self.max_chars) if is_html else None
+        plain_parts: List[str] = []
+        plain_length = 0
+        decoder = None
+        received = 0
+        note = None
+        timed_out = False
+
+        sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+        while True:
+            # 読み込みごとにソケットのタイムアウトを残り時間まで縮め、応答が止まっても全体の上限で打ち切る
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                note = "時間の上限に達したため途中までです"
+                timed_out = True
+                break
+            if sock is not None:
+                sock.settimeout(remaining)
+            try:
+                chunk = response.raw.read1(_READ_CHUNK_BYTES, decode_content=True)
+            except (ReadTimeoutError, TimeoutError):
+                note = "時間の上限に達したため途中までです"
+                timed_out = True
+                break
+            if not chunk:
+                break
+            if decoder is None:
+                decoder = self._decoder(content_type, chunk)
+            received += len(chunk)
+            if received > self.max_bytes:
+                chunk = chunk[: len(chunk) - (received - self.max_bytes)]
+            text = decoder.decode(chunk)
+            if extractor is not None:
+                extractor.feed(text)
+                reached_chars = extractor.done
+            else:
+                plain_parts.append(text)
+                plain_length += len(text)
+                reached_chars = plain_length >= self.max_chars
+            if reached_chars:
+                note = f"{self.max_chars}文字で打ち切りました"
+                break
+            if received >= self.max_bytes:
+                note = f"{self.max_bytes // 1024}KBで打ち切りました"
+                break
+
+        if decoder is not None:
+            tail = decoder.decode(b"", final=True)
+            if extractor is not None:
+                extractor.feed(tail)
+            else:
+                plain_parts.append(tail)
+        if extractor is not None:
+            extractor.close()
+            return extractor.title, extractor.text(), note, timed_out
+        return "", "".join(plain_parts).strip()[: self.max_chars], note, timed_out
+
+    @staticmethod
+    def _decoder(content_type: str, head: bytes):
+        """Content-Typeのcharset、なければ先頭のmetaタグから文字コードを決め、逐次デコーダーを返す"""
+        match = _CHARSET_PATTERN.search(content_type) or _META_CHARSET_PATTERN.search(head[:4096])
+        encoding = match.group(1) if match else "utf-8"
+        if isinstance(encoding, bytes):
+            encoding = encoding.decode("ascii", errors="ignore")
+        try:
+            return codecs.getincrementaldecoder(encoding)(errors="replace")
+        except LookupError:
+            return codecs.getincrementaldecoder("utf-8")(errors="replace")
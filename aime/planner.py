@@ -1,17 +1,23 @@
+import asyncio
+import contextlib
 import json
-import time
 import os
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 from graphlib import TopologicalSorter, CycleError
 from aime.progress_manager import ProgressManagementModule
 from aime.factory import ActorFactory
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from langfuse import observe
 from aime.config import config
+from aime.knowledge_index import create_knowledge_index
 from aime.llm_client import llm_client
+from aime.metrics import metrics
+from aime.result_store import ResultStore
+from aime.run_journal import RunJournal, new_run_id
+from aime.worker_backend import WorkerBackend, create_worker_backend
 
 from pydantic import BaseModel
-from typing import List
 
 
 class Task(BaseModel):
@@ -24,23 +30,62 @@ class TasksList(BaseModel):
     tasks: List[Task]
 
 
+class PlanDelta(BaseModel):
+    remove_ids: List[int]
+    upsert: List[Task]
+
+
 class DynamicPlanner:
     """
     動的プランナー - タスクの分解、実行、調整を行う中央オーケストレーター
     """
 
-    def __init__(self, max_parallel_actors: int = None):
+    def __init__(
+        self,
+        max_parallel_actors: int = None,
+        run_id: str = None,
+        output_dir: str = None,
+        executor: ThreadPoolExecutor = None,
+        actor_semaphore: asyncio.Semaphore = None,
+        export_metrics: bool = True,
+        worker_backend: WorkerBackend = None,
+    ):
         """
         プランナーを初期化
 
         Args:
             max_parallel_actors: 最大並列アクター数（Noneの場合はconfig値を使用）
+            run_id: 実行ID（ジャーナルの保存先 runs/<run_id> に使う。Noneの場合は実行開始時に生成）
+            output_dir: 進捗・タスク結果・最終報告書の出力先（Noneの場合はカレントディレクトリ。複数の実行を同時に行う場合に分ける）
+            executor: Actorを実行する共有スレッドプール（Noneの場合は実行ごとに作成する。スレッドモードのみ）
+            actor_semaphore: 複数の実行で共有するActorの同時実行数の上限（asyncioモードのみ）
+            export_metrics: 実行終了時にメトリクスを出力するか（メトリクスはプロセス全体の集計のため、バッチ実行ではまとめて出力する）
+            worker_backend: Actorを実行する共有のワーカーバックエンド（Noneの場合は config.actor_backend に従い、必要なら実行ごとに作成する）
         """
-        self.progress_manager = ProgressManagementModule()
-        self.factory = ActorFactory(self.progress_manager)
-        self.results_dir = config.results_dir
+        self.output_dir = output_dir
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        # 知識インデックスは実行ごとに持つ（knowledge_index_path を指定した場合だけ、ファイルで実行をまたいで引き継ぐ）
+        self.knowledge_index = create_knowledge_index(run_id)
+        self.progress_manager = ProgressManagementModule(
+            filepath=self._output_path(config.progress_file), knowledge_index=self.knowledge_index
+        )
+        self.result_store = ResultStore()
+        self.factory = ActorFactory(self.progress_manager, self.knowledge_index)
+        self.results_dir = self._output_path(config.results_dir)
+        self.final_report_path = self._output_path(config.final_report_file)
+        self.executor = executor
+        self.actor_semaphore = actor_semaphore
+        self.export_metrics = export_metrics
+        self.worker_backend = worker_backend
+        self._owns_worker_backend = False
         self.max_parallel_actors = max_parallel_actors or config.max_parallel_actors
         self.main_goal = ""
+        self.run_id = run_id
+        self.journal = None
+
+    def _output_path(self, name: str) -> str:
+        return os.path.join(self.output_dir, name) if self.output_dir else name
 
     @observe()
     def _decompose_task(self, main_goal: str) -> List[Dict[str, Any]]:
@@ -65,6 +110,8 @@ class DynamicPlanner:
             messages=[{"role": "user", "content": prompt}],
             temperature=0.5,
             response_format=TasksList,
+            call_site="decompose",
+            cache=True,
         )
         try:
             data = json.loads(response.choices[0].message.content)
@@ -126,6 +173,7 @@ class DynamicPlanner:
         prompt = f"""
 あなたはプロジェクトマネージャーAIです。以下の初期目標と現在の進捗状況、そして再計画のトリガーとなった理由を考慮して、残りの計画を最適化してください。
 タスクの追加、変更、削除が可能です。出力は以前と同じJSON形式（IDと依存関係を含む）で、"completed"ステータスのタスクはそのまま含めてください。
+"in_progress"ステータスのタスクは実行中のため、変更せずにそのまま含めてください。
 失敗したタスクは、代替案のタスクを新たに追加するか、修正して再試行できるようにしてください。
 代替案のタスクは必要に応じて実施順番を入れ替えてください。
 
@@ -144,6 +192,7 @@ class DynamicPlanner:
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
             response_format=TasksList,
+            call_site="refine",
         )
         try:
             new_plan = json.loads(response.choices[0].message.content)
@@ -155,156 +204,620 @@ class DynamicPlanner:
 
             print("--- 新しい計画が生成・ソートされました ---")
             self.progress_manager.update_tasks(sorted_plan)
+            self.progress_manager.record_replan(trigger_reason, None, "full")
             print("--- タスクリストが新しい計画で更新されました ---")
+            self.factory.prepare_personas(self.progress_manager.get_pending_tasks())
+            self.factory.discard_prepared(self.progress_manager.get_pending_tasks())
         except (json.JSONDecodeError, ValueError) as e:
             print(f"計画修正のJSONパースに失敗しました: {e}")
 
+    @observe()
+    def _refine_subgraph(self, failed_task_id: int, trigger_reason: str):
+        """
+        失敗したタスクとその下流のタスクだけを対象に、計画の差分を生成して適用する
+        （他のタスクは変更しないため、独立した枝の実行はそのまま続けられる）
+
+        Args:
+            failed_task_id: 失敗したタスクのID
+            trigger_reason: 再計画のトリガーとなった理由
+
+        Raises:
+            ValueError: 差分が解析できない、または計画に適用できない場合
+        """
+        print(f"\n[!!!] Planner: {trigger_reason} のため、タスク {failed_task_id} とその下流の計画を修正します...")
+
+        downstream = self.progress_manager.get_downstream_tasks(failed_task_id)
+        if not downstream:
+            raise ValueError(f"タスク {failed_task_id} が計画に存在しません。")
+        scope_ids = {task["id"] for task in downstream}
+        scope_context = "\n".join(
+            f"- Task {task['id']}: {task['description']} (Status: {task['status']}, 依存: {task['dependencies']})"
+            for task in downstream
+        )
+        # 修正対象の外側のタスクは、依存先として使えるように説明だけを渡す
+        other_context = "\n".join(
+            f"- Task {task['id']}: {task['description']} (Status: {task['status']})"
+            for task in self.progress_manager.tasks
+            if task["id"] not in scope_ids and task["status"] != "failed"
+        )
+
+        prompt = f"""
+あなたはプロジェクトマネージャーAIです。タスク {failed_task_id} が失敗しました。
+失敗したタスクと、その結果に依存する下流のタスクだけを修正し、計画の差分をJSONで出力してください。
+それ以外のタスク（実行中・完了済みのものを含む）は変更できません。
+
+- remove_ids: 削除するタスクのID（修正対象のタスクのみ指定できます）
+- upsert: 追加または置き換えるタスク。既存のIDを指定すると置き換え、新しいタスクには {self.progress_manager.next_task_id()} 以降のIDを振ってください。
+- 失敗したタスクは、代替案に置き換えるか、削除して下流のタスクの依存関係を付け替えてください。失敗したままのタスクに依存することはできません。
+- 依存関係には、修正対象のタスク、新しいタスク、その他の既存のタスクのIDを指定できます。
+
+# 初期目標
+{self.main_goal}
+
+# 修正対象のタスク（失敗したタスクとその下流）
+{scope_context}
+
+# その他の既存のタスク
+{other_context if other_context else "なし"}
+
+# 再計画の理由
+{trigger_reason}
+
+# 計画の差分（JSON）:
+"""
+        response = llm_client.completion(
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            response_format=PlanDelta,
+            call_site="refine",
+        )
+        try:
+            delta = json.loads(response.choices[0].message.content)
+            remove_ids = [int(task_id) for task_id in delta.get("remove_ids", [])]
+            upsert = [Task(**task_data).model_dump() for task_data in delta.get("upsert", [])]
+        except (json.JSONDecodeError, TypeError, AttributeError, ValueError) as e:
+            raise ValueError(f"計画の差分を解析できません: {e}") from e
+
+        outside = [task_id for task_id in remove_ids if task_id not in scope_ids]
+        if outside:
+            raise ValueError(f"修正対象外のタスク {outside} を削除しようとしました。")
+        existing_ids = {task["id"] for task in self.progress_manager.tasks}
+        overwritten = [task["id"] for task in upsert if task["id"] in existing_ids and task["id"] not in scope_ids]
+        if overwritten:
+            raise ValueError(f"修正対象外のタスク {overwritten} を置き換えようとしました。")
+
+        self.progress_manager.apply_plan_delta(remove_ids, upsert)
+        self.progress_manager.record_replan(trigger_reason, failed_task_id, "subgraph")
+        print(f"--- 計画の差分を適用しました (削除: {remove_ids}, 追加・置換: {[task['id'] for task in upsert]}) ---")
+        self.factory.prepare_personas(self.progress_manager.get_pending_tasks())
+        self.factory.discard_prepared(self.progress_manager.get_pending_tasks())
+
+    def _replan(self, failed_task_id: Optional[int], trigger_reason: str):
+        """
+        再計画を行う（実行ループをブロックしないよう、再計画用のワーカーで実行される）
+
+        失敗したタスクが分かっている場合は下流のみの差分修正を試み、
+        差分が不正な場合（循環依存など）は計画全体の再生成にフォールバックする。
+        """
+        try:
+            if failed_task_id is not None and config.replan_scope == "subgraph":
+                try:
+                    self._refine_subgraph(failed_task_id, trigger_reason)
+                    return
+                except ValueError as e:
+                    print(f"  [WARN] 部分的な再計画に失敗したため、計画全体を再生成します: {e}")
+            self._refine_plan(trigger_reason)
+        except Exception as e:
+            print(f"  [ERROR] 再計画中に予期せぬエラーが発生しました: {e}")
+
+    def _build_knowledge_context(self, task: dict) -> str:
+        """依存タスクの結果の要約と関連する抜粋を、前提知識としてコンテキストにまとめる"""
+        knowledge_context = f"最終目標: {self.main_goal}\n"
+        if task.get("dependencies"):
+            dependency_context = self.result_store.build_context(task["dependencies"], task["description"])
+            if dependency_context:
+                knowledge_context += f"\n# 前提となる関連タスクの結果:\n{dependency_context}\n"
+        return knowledge_context.strip()
+
+    def _save_task_result(self, task: dict, result: str):
+        """タスク結果をファイルに保存する"""
+        result_filename = f"task_{task['id']}_result.md"
+        result_filepath = os.path.join(self.results_dir, result_filename)
+        with open(result_filepath, "w", encoding="utf-8") as f:
+            f.write(result)
+        print(f"  ▶ タスク結果を '{result_filepath}' に保存しました。")
+
     @observe()
     def _execute_task_wrapper(self, task: dict):
         """Actorの生成と実行をラップし、並列処理で呼び出せるようにする"""
         try:
-            # 依存タスクの結果を収集し、前提知識としてコンテキストを作成
-            knowledge_context = f"最終目標: {self.main_goal}\n"
-            if task.get("dependencies"):
-                completed_results = self.progress_manager.get_completed_task_results(task["dependencies"])
-                if completed_results:
-                    knowledge_context += "\n# 前提となる関連タスクの結果:\n"
-                    for dep_id, result in completed_results.items():
-                        # 結果が長すぎる場合、500文字に要約
-                        result_summary = result if len(str(result)) < 500 else f"{str(result)[:500]}..."
-                        knowledge_context += f"## タスク{dep_id}の結果概要:\n{result_summary}\n\n"
+            # 依存タスクの要約が作成中であれば、上限の秒数まで待つ
+            self.result_store.wait(task.get("dependencies", []), config.result_summary_max_wait_seconds)
+            knowledge_context = self._build_knowledge_context(task)
 
             # Phase 2-1: Actorのインスタンス化 (knowledge_contextを渡す)
             print(f"  ▶ Actor Factory: タスク '{task['description']}' のActorを生成中...")
-            actor = self.factory.create_actor(task, knowledge_context.strip())
+            if self.worker_backend is not None:
+                # ワーカーで実行する場合は、ペルソナだけを用意してジョブとして送り、結果を待つ
+                persona = self.factory.get_prepared_persona(task)
+                print(f"  ▶ Worker Backend: タスク '{task['description']}' をワーカーに送信します...")
+                result = self._submit_to_worker(task, persona, knowledge_context).result()
+            else:
+                actor = self.factory.create_actor(task, knowledge_context)
+
+                # Phase 2-2: Actorの実行
+                print(f"  ▶ Dynamic Actor: タスク '{task['description']}' の実行を開始します...")
+                result = actor.run()
+
+            self._save_task_result(task, result)
+            return task["id"], result
+        except Exception as e:
+            error_message = f"タスク {task['id']} の実行中に予期せぬエラーが発生しました: {e}"
+            print(f"  ▶ [ERROR] {error_message}")
+            return task["id"], error_message
+
+    @observe()
+    async def _aexecute_task_wrapper(self, task: dict):
+        """_execute_task_wrapperの非同期版（イベントループ上でActorを実行する）"""
+        try:
+            await self.result_store.await_summaries(task.get("dependencies", []), config.result_summary_max_wait_seconds)
+            knowledge_context = self._build_knowledge_context(task)
 
-            # Phase 2-2: Actorの実行
-            print(f"  ▶ Dynamic Actor: タスク '{task['description']}' の実行を開始します...")
-            result = actor.run()
+            print(f"  ▶ Actor Factory: タスク '{task['description']}' のActorを生成中...")
+            if self.worker_backend is not None:
+                persona = await self.factory.aget_prepared_persona(task)
+                print(f"  ▶ Worker Backend: タスク '{task['description']}' をワーカーに送信します...")
+                result = await asyncio.wrap_future(self._submit_to_worker(task, persona, knowledge_context))
+            else:
+                actor = await self.factory.acreate_actor(task, knowledge_context)
 
-            # 結果の保存
-            result_filename = f"task_{task['id']}_result.md"
-            result_filepath = os.path.join(self.results_dir, result_filename)
-            with open(result_filepath, "w", encoding="utf-8") as f:
-                f.write(result)
-            print(f"  ▶ タスク結果を '{result_filepath}' に保存しました。")
+                print(f"  ▶ Dynamic Actor: タスク '{task['description']}' の実行を開始します...")
+                result = await actor.arun()
 
+            self._save_task_result(task, result)
             return task["id"], result
         except Exception as e:
             error_message = f"タスク {task['id']} の実行中に予期せぬエラーが発生しました: {e}"
             print(f"  ▶ [ERROR] {error_message}")
             return task["id"], error_message
 
-    @observe(name="Aime-Workflow")
-    def run(self, main_goal: str):
+    def _submit_to_worker(self, task: dict, persona: str, knowledge_context: str):
+        """
+        タスクをジョブとしてワーカーバックエンドに投入する（ワーカーの進捗ログはこの実行の進捗管理モジュールに反映する）
+
+        ワーカーは知識インデックスを共有しないため、タスクの説明で検索した段落をジョブに添えて送る。
+        """
+        hits = self.knowledge_index.search(task["description"], top_k=config.knowledge_worker_hits)
+        job = {
+            "task": {"id": task["id"], "description": task["description"], "dependencies": task.get("dependencies", [])},
+            "persona": persona,
+            "knowledge": knowledge_context,
+            "knowledge_hits": [[source, text] for source, text, _ in hits],
+            "run_label": self.knowledge_index.run_label,
+        }
+        return self.worker_backend.submit(job, on_log=self.progress_manager.add_task_log)
+
+    def _start_worker_backend(self):
+        """共有のワーカーバックエンドが渡されておらず、設定でワーカーでの実行が指定されている場合は作成する"""
+        if self.worker_backend is None and config.actor_backend != "thread":
+            self.worker_backend = create_worker_backend()
+            self._owns_worker_backend = True
+
+    def _stop_worker_backend(self):
+        if self._owns_worker_backend:
+            self.worker_backend.shutdown()
+            self.worker_backend = None
+            self._owns_worker_backend = False
+
+    def _prewarm_upcoming(self, started_ids: Optional[List[int]] = None, use_async_tools: bool = False):
+        """
+        実行中のタスクの完了だけを待っているタスクのActorを、依存タスクの完了前に用意しておく
+
+        Args:
+            started_ids: 実行を開始したタスクのID（その下流だけを調べる。Noneの場合は再計画後などで全タスクを調べる）
+            use_async_tools: asyncioモードの場合はTrue
+        """
+        # レート制限で同時実行数を絞っている間は、LLMの呼び出しに余裕がないため用意しない
+        if not config.prewarm_enabled or llm_client.concurrency.limit is not None:
+            return
+        candidates = self.progress_manager.get_prewarm_candidates(started_ids)
+        if candidates:
+            self.factory.prewarm(candidates, build_actor=self.worker_backend is None, use_async_tools=use_async_tools)
+
+    async def _arun_actor_slot(self, task: dict):
+        """共有の同時実行数の上限が渡されている場合は、その枠を確保してからActorを実行する"""
+        if self.actor_semaphore is None:
+            return await self._aexecute_task_wrapper(task)
+        async with self.actor_semaphore:
+            return await self._aexecute_task_wrapper(task)
+
+    def _process_task_report(self, task_id: int, result_str: str) -> Optional[str]:
+        """
+        Actorからの報告を解析し、タスクのステータスを更新する
+
+        Args:
+            task_id: 報告元のタスクID
+            result_str: Actorが返した報告（JSON文字列）
+
+        Returns:
+            再計画が必要な場合はその理由、不要な場合はNone
+        """
+        task = self.progress_manager.get_task(task_id)
+        if task is None:
+            # 実行中に計画の全面的な修正でタスクが削除された場合は、報告を反映しない
+            print(f"  ▶ [WARN] タスク {task_id} は計画から削除されているため、報告を無視します。")
+            return None
+        description = task["description"]
+        try:
+            # Actorからの報告をJSONとしてパース
+            report = json.loads(result_str)
+            status = report.get("status")
+            message = report.get("message", "メッセージがありません。")
+
+            if status == "success":
+                print(f"  ▶ タスク {task_id} は成功しました。")
+                self.progress_manager.update_task_status(task_id, "completed", message)
+                # 依存先のタスクに渡す要約を、完了した時点でバックグラウンドで作成しておく
+                self.result_store.add(task_id, description, message)
+                self.knowledge_index.add(f"タスク{task_id}（{description}）の結果", message)
+                return None
+            if status == "failure":
+                print(f"  ▶ [!] タスク {task_id} は失敗と報告されました。計画を修正します。")
+                self.progress_manager.update_task_status(task_id, "failed", message)
+                return f"タスク {task_id} ('{description}') が失敗しました。報告された理由: {message}"
+
+            # statusキーが不正な場合も失敗とみなし、再計画
+            print(f"  ▶ [WARN] タスク {task_id} から不正なステータス '{status}' が報告されました。")
+            self.progress_manager.update_task_status(task_id, "failed", f"不正な報告: {result_str}")
+            return f"タスク {task_id} が不正な形式の報告を行いました: {result_str}"
+
+        except (json.JSONDecodeError, AttributeError):
+            # JSONパースに失敗した場合、結果全体を失敗メッセージとして扱い再計画
+            print(f"  ▶ [WARN] タスク {task_id} の結果がJSON形式ではありません。失敗として扱います。")
+            self.progress_manager.update_task_status(task_id, "failed", result_str)
+            return f"タスク {task_id} がJSON形式でない不正な報告を行いました: {result_str}"
+
+    def _handle_finished(self, task_id: int, future) -> Optional[str]:
+        """
+        完了したFuture（またはasyncio.Task）の結果を処理する
+
+        Returns:
+            再計画が必要な場合はその理由、不要な場合はNone
+        """
+        try:
+            _task_id, result_str = future.result()
+            return self._process_task_report(task_id, result_str)
+        except Exception as exc:
+            print(f"  ▶ [ERROR] タスク {task_id} の実行で致命的な例外: {exc}")
+            self.progress_manager.update_task_status(task_id, "failed", str(exc))
+            return f"タスク {task_id} が致命的な例外で失敗しました。"
+
+    def _run_dir(self, run_id: str) -> str:
+        return os.path.join(config.runs_dir, run_id)
+
+    def _open_journal(self):
+        """この実行のジャーナルを開き、進捗管理モジュールの状態の変更を記録させる"""
+        self.journal = RunJournal(self._run_dir(self.run_id), fsync=config.journal_fsync)
+        self.progress_manager.attach_journal(self.journal)
+
+    def _close_journal(self):
+        if self.journal is not None:
+            self.progress_manager.attach_journal(None)
+            self.journal.close()
+            self.journal = None
+
+    def _begin_run(self, main_goal: str):
         self.main_goal = main_goal
         print(f"=== Aimeフレームワーク実行開始: {self.main_goal} ===")
         os.makedirs(self.results_dir, exist_ok=True)
+        if config.journal_enabled:
+            self.run_id = self.run_id or new_run_id()
+            self._open_journal()
+            self.journal.append("run_started", main_goal=main_goal)
+            print(f"--- 実行ID: {self.run_id} (中断した場合は resume('{self.run_id}') で再開できます) ---")
+        # 永続化する知識インデックスの段落に、どの実行で登録したかを記録する
+        self.knowledge_index.run_label = self.run_id or new_run_id()
+        print("\n[Phase 1/4] Dynamic Planner: タスク分解を開始します...")
+
+    def _restore_run(self, run_id: str) -> bool:
+        """
+        ジャーナルから実行を復元する
+
+        Returns:
+            未完了のタスクの実行に進む場合はTrue（復元できない場合や、最終報告書まで完了済みの場合はFalse）
+        """
+        try:
+            events = RunJournal.load(self._run_dir(run_id))
+        except FileNotFoundError:
+            print(f"実行 {run_id} のジャーナルが見つからないため、再開できません。")
+            return False
+
+        started = next((event for event in events if event["type"] == "run_started"), None)
+        if started is None or not any(event["type"] == "plan" for event in events):
+            print(f"実行 {run_id} には計画が記録されていないため、再開できません。最初から実行してください。")
+            return False
+
+        self.run_id = run_id
+        self.knowledge_index.run_label = run_id
+        self.main_goal = started["main_goal"]
+        print(f"=== Aimeフレームワーク実行再開: {self.main_goal} (実行ID: {run_id}) ===")
+        os.makedirs(self.results_dir, exist_ok=True)
+
+        final = next((event for event in reversed(events) if event["type"] == "final"), None)
+        if final is not None:
+            print("--- この実行は最終報告書まで完了しています ---")
+            self._write_final_report(final["report"])
+            return False
+
+        self._open_journal()
+        reset_ids = self.progress_manager.restore(events)
+        self.journal.append("resumed", reset_task_ids=reset_ids)
+        if reset_ids:
+            print(f"--- 実行中だったタスク {reset_ids} を再実行します ---")
+        self.factory.prepare_personas(self.progress_manager.get_pending_tasks())
+        for completed in self.progress_manager.tasks:
+            if completed["status"] == "completed":
+                self.result_store.add(completed["id"], completed["description"], completed.get("result", ""))
+                self.knowledge_index.add(f"タスク{completed['id']}（{completed['description']}）の結果", completed.get("result") or "")
+        return True
+
+    def _write_final_report(self, final_report: str):
+        """最終報告書をファイルとコンソールに出力する"""
+        print("\n[Phase 4/4] Planner: 最終報告書をファイルに出力します...")
+        report_filepath = self.final_report_path
+        try:
+            with open(report_filepath, "w", encoding="utf-8") as f:
+                f.write(final_report)
+            print(f"--- 最終報告書を {report_filepath} に出力しました ---")
+        except OSError as e:
+            print(f"ファイルへの書き込みに失敗しました: {e}")
+
+        self.progress_manager.record_final_report(final_report)
+        self._close_journal()
+
+        print("\n=== Aimeフレームワークの全処理が完了しました ===")
+        print("\n--- 最終報告書 ---")
+        print(final_report)
+        print("--------------------")
+
+        if (stream_stats := llm_client.stream_stats()) is not None:
+            avg_ttft = f"{stream_stats['avg_ttft']:.2f}秒" if stream_stats["avg_ttft"] is not None else "N/A"
+            print(
+                f"--- ストリーミング: {stream_stats['calls']}回 (平均TTFT {avg_ttft}, "
+                f"行動行での早期停止 {stream_stats['early_stops']}回) ---"
+            )
+        if (cache_stats := llm_client.cache_stats()) is not None:
+            print(
+                f"--- LLMキャッシュ: ヒット {cache_stats['hits']}件 / ミス {cache_stats['misses']}件 "
+                f"(ヒット率 {cache_stats['hit_rate']:.0%}, 保存件数 {cache_stats['entries']}件) ---"
+            )
 
+    @observe(name="Aime-Workflow")
+    def run(self, main_goal: str):
         # Phase 1: タスク分解
-        print("\n[Phase 1/4] Dynamic Planner: タスク分解を開始します...")
+        self._begin_run(main_goal)
         subtasks = self._decompose_task(self.main_goal)
         if not subtasks:
             print("タスクの分解に失敗したため、処理を終了します。")
+            self._close_journal()
+            self.progress_manager.close()
             return
         self.progress_manager.initialize_tasks(subtasks)
+        self.factory.prepare_personas(subtasks)
 
-        # Phase 2: 実行ループ (依存関係を考慮した並列処理)
-        print(f"\n[Phase 2/4] Planner: サブタスクの実行ループを開始します (最大ワーカー数: {self.max_parallel_actors})...")
+        self._dispatch_tasks()
+        self._finish_run()
 
-        with ThreadPoolExecutor(max_workers=self.max_parallel_actors) as executor:
-            active_futures = {}
-            while not self.progress_manager.are_all_tasks_done():
-                executable_tasks = self.progress_manager.get_executable_tasks()
-
-                # 実行可能なタスクをワーカーに投入
-                while len(active_futures) < self.max_parallel_actors and executable_tasks:
-                    task_to_run = executable_tasks.pop(0)
-                    if task_to_run["id"] not in [f.result()[0] for f in active_futures if f.done()] and task_to_run[
-                        "id"
-                    ] not in [active_futures[f] for f in active_futures if not f.done()]:
-                        self.progress_manager.update_task_status(task_to_run["id"], "in_progress")
-                        future = executor.submit(self._execute_task_wrapper, task_to_run)
-                        active_futures[future] = task_to_run["id"]
-
-                # 完了したタスクを処理
-                if not active_futures:
-                    if not self.progress_manager.get_executable_tasks() and not self.progress_manager.are_all_tasks_done():
-                        print(
-                            "[WARN] 実行可能なタスクがありませんが、まだ完了していないタスクがあります。デッドロックの可能性があります。"
-                        )
-                        # ここでデッドロック解消のための再計画をトリガーすることも可能
-                        self._refine_plan("デッドロックの可能性: 実行可能なタスクがありません。")
+    @observe(name="Aime-Workflow")
+    def resume(self, run_id: str):
+        """
+        ジャーナルから中断した実行を復元し、未完了のタスクだけを再実行する
 
-                    time.sleep(2)
-                    continue
+        Args:
+            run_id: 再開する実行のID（runs/<run_id>/journal.jsonl）
+        """
+        if not self._restore_run(run_id):
+            self.progress_manager.close()
+            return
+        self._dispatch_tasks()
+        self._finish_run()
 
-                done_futures = []
-                for future in list(active_futures.keys()):
-                    if future.done():
-                        task_id = active_futures[future]
-                        try:
-                            _task_id, result_str = future.result()
-
-                            try:
-                                # Actorからの報告をJSONとしてパース
-                                report = json.loads(result_str)
-                                status = report.get("status")
-                                message = report.get("message", "メッセージがありません。")
-
-                                if status == "success":
-                                    print(f"  ▶ タスク {task_id} は成功しました。")
-                                    self.progress_manager.update_task_status(task_id, "completed", message)
-                                elif status == "failure":
-                                    print(f"  ▶ [!] タスク {task_id} は失敗と報告されました。計画を修正します。")
-                                    self.progress_manager.update_task_status(task_id, "failed", message)
-                                    self._refine_plan(
-                                        f"タスク {task_id} ('{self.progress_manager.tasks[task_id]['description']}') が失敗しました。報告された理由: {message}"
-                                    )
-                                else:
-                                    # statusキーが不正な場合も失敗とみなし、再計画
-                                    print(f"  ▶ [WARN] タスク {task_id} から不正なステータス '{status}' が報告されました。")
-                                    self.progress_manager.update_task_status(task_id, "failed", f"不正な報告: {result_str}")
-                                    self._refine_plan(f"タスク {task_id} が不正な形式の報告を行いました: {result_str}")
-
-                            except json.JSONDecodeError:
-                                # JSONパースに失敗した場合、結果全体を失敗メッセージとして扱い再計画
-                                print(f"  ▶ [WARN] タスク {task_id} の結果がJSON形式ではありません。失敗として扱います。")
-                                self.progress_manager.update_task_status(task_id, "failed", result_str)
-                                self._refine_plan(f"タスク {task_id} がJSON形式でない不正な報告を行いました: {result_str}")
-
-                        except Exception as exc:
-                            print(f"  ▶ [ERROR] タスク {task_id} の実行で致命的な例外: {exc}")
-                            self.progress_manager.update_task_status(task_id, "failed", str(exc))
-                            self._refine_plan(f"タスク {task_id} が致命的な例外で失敗しました。")
-
-                        done_futures.append(future)
+    def _dispatch_tasks(self):
+        """Phase 2: 依存関係を考慮して、未完了のタスクをスレッドプールで並列実行する"""
+        print(f"\n[Phase 2/4] Planner: サブタスクの実行ループを開始します (最大ワーカー数: {self.max_parallel_actors})...")
+        # 再計画は専用の1ワーカーで順に実行し、その間も独立したタスクの実行と完了処理を続ける
+        # 共有のスレッドプールが渡されている場合は、他の実行と同じワーカーを使う（終了時にシャットダウンしない）
+        actor_executor = (
+            contextlib.nullcontext(self.executor)
+            if self.executor is not None
+            else ThreadPoolExecutor(max_workers=self.max_parallel_actors)
+        )
+        self._start_worker_backend()
+        with (
+            contextlib.ExitStack() as stack,
+            actor_executor as executor,
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="replan") as replan_executor,
+        ):
+            stack.callback(self._stop_worker_backend)
+            active_futures = {}
+            replan_futures = set()
+            deadlock_replans = 0  # タスクを投入できないまま続けて行ったデッドロックの再計画の回数
+            while not self.progress_manager.are_all_tasks_done() or replan_futures:
+                # 実行可能なタスクを空いているワーカーに投入（レート制限を受けている間は同時実行数を絞る）
+                capacity = llm_client.concurrency.effective_limit(self.max_parallel_actors)
+                started_ids = []
+                for task_to_run in self.progress_manager.claim_executable_tasks(capacity - len(active_futures)):
+                    future = executor.submit(self._execute_task_wrapper, task_to_run)
+                    active_futures[future] = task_to_run["id"]
+                    started_ids.append(task_to_run["id"])
+                if started_ids:
+                    deadlock_replans = 0
+                    self._prewarm_upcoming(started_ids)
+
+                if not active_futures and not replan_futures:
+                    backoff = self._deadlock_backoff(deadlock_replans)
+                    if backoff is None:
+                        continue
+                    time.sleep(backoff)
+                    deadlock_replans += 1
+                    replan_futures.add(
+                        replan_executor.submit(self._replan, None, "デッドロックの可能性: 実行可能なタスクがありません。")
+                    )
+                    continue
 
+                # ポーリングせず、いずれかのタスクまたは再計画が完了するまでブロックする
+                done_futures, _ = wait([*active_futures, *replan_futures], return_when=FIRST_COMPLETED)
                 for future in done_futures:
-                    del active_futures[future]
+                    if future in replan_futures:
+                        replan_futures.discard(future)
+                        self._prewarm_upcoming()
+                        continue
+                    task_id = active_futures.pop(future)
+                    replan_reason = self._handle_finished(task_id, future)
+                    if replan_reason:
+                        replan_futures.add(replan_executor.submit(self._replan, task_id, replan_reason))
+
+        self.progress_manager.flush()
+        print("\n[Phase 2/4] 全てのサブタスクの実行が完了しました。")
 
-                time.sleep(1)
+    def _deadlock_backoff(self, attempts: int) -> Optional[float]:
+        """
+        実行可能なタスクがない場合に、次の再計画までに待つ秒数を返す
 
-        print("\n[Phase 2/4] 全てのサブタスクの実行が完了しました。")
+        Args:
+            attempts: タスクを投入できないまま続けて行った再計画の回数
 
-        # Phase 3: 最終報告書の作成
+        Returns:
+            待つ秒数（1回目は待たない）。上限に達した場合は残りのタスクを失敗にしてNoneを返す
+        """
+        if attempts >= config.deadlock_max_replans:
+            print(
+                f"[ERROR] デッドロックの再計画が{config.deadlock_max_replans}回続けて解消しなかったため、"
+                "残りのタスクを失敗として実行を終了します。"
+            )
+            for task in list(self.progress_manager.tasks):
+                if task["status"] not in ("completed", "failed"):
+                    self.progress_manager.update_task_status(
+                        task["id"], "failed", "依存関係を解消できず、実行できませんでした（デッドロック）。"
+                    )
+            return None
+        print("[WARN] 実行可能なタスクがありませんが、まだ完了していないタスクがあります。デッドロックの可能性があります。")
+        return config.deadlock_backoff_seconds * 2 ** (attempts - 1) if attempts else 0.0
+
+    def _finish_run(self):
+        """Phase 3, 4: 最終報告書を作成して出力する"""
         print("\n[Phase 3/4] Planner: 全てのタスクが完了しました。最終報告書を作成します...")
-        final_report = self._generate_final_report(main_goal)
-
-        # Phase 4: 最終報告書の出力
-        print("\n[Phase 4/4] Planner: 最終報告書をファイルに出力します...")
-        report_filepath = "final_report.md"
+        self.result_store.close()
+        self.factory.discard_prepared([])
         try:
-            with open(report_filepath, "w", encoding="utf-8") as f:
-                f.write(final_report)
-            print(f"--- 最終報告書を {report_filepath} に出力しました ---")
-        except IOError as e:
-            print(f"ファイルへの書き込みに失敗しました: {e}")
+            final_report = self._generate_final_report(self.main_goal)
+            self._write_final_report(final_report)
+            if self.export_metrics:
+                self._export_metrics()
+        finally:
+            # 進捗ファイルの書き込みスレッドを止める（バッチ実行では実行ごとにスレッドが残らないようにする）
+            self.progress_manager.close()
+
+    def _export_metrics(self):
+        """メトリクスをファイルに出力し、時間とコストの内訳を表示する"""
+        if not config.metrics_enabled:
+            return
+        extension = "prom" if config.metrics_format == "prometheus" else "json"
+        path = config.metrics_file or (
+            os.path.join(self._run_dir(self.run_id), f"metrics.{extension}") if self.run_id else f"metrics.{extension}"
+        )
+        try:
+            metrics.export(path, config.metrics_format)
+            print(f"--- メトリクスを {path} に出力しました ---")
+        except (OSError, ValueError) as e:
+            print(f"メトリクスの出力に失敗しました: {e}")
+        if summary := metrics.format_summary():
+            print(summary)
 
-        print("\n=== Aimeフレームワークの全処理が完了しました ===")
-        print("\n--- 最終報告書 ---")
-        print(final_report)
-        print("--------------------")
+    @observe(name="Aime-Workflow")
+    async def arun(self, main_goal: str, max_concurrency: int = None):
+        """
+        asyncioモードでフレームワークを実行する。
+        Actorはスレッドを占有せず、1つのイベントループ上で最大 max_concurrency 個まで並行実行される。
+        計画の分解・修正・最終報告書の作成は単発の呼び出しのため、スレッドに逃がして実行する。
+
+        Args:
+            main_goal: メインゴール
+            max_concurrency: 同時実行Actor数の上限（Noneの場合はconfig値を使用）
+        """
+        # Phase 1: タスク分解
+        self._begin_run(main_goal)
+        subtasks = await asyncio.to_thread(self._decompose_task, self.main_goal)
+        if not subtasks:
+            print("タスクの分解に失敗したため、処理を終了します。")
+            self._close_journal()
+            self.progress_manager.close()
+            return
+        self.progress_manager.initialize_tasks(subtasks)
+        self.factory.prepare_personas(subtasks)
+
+        await self._adispatch_tasks(max_concurrency or config.max_async_actors)
+        await asyncio.to_thread(self._finish_run)
+
+    @observe(name="Aime-Workflow")
+    async def aresume(self, run_id: str, max_concurrency: int = None):
+        """resumeの非同期版（未完了のタスクをasyncioモードで再実行する）"""
+        if not self._restore_run(run_id):
+            self.progress_manager.close()
+            return
+        await self._adispatch_tasks(max_concurrency or config.max_async_actors)
+        await asyncio.to_thread(self._finish_run)
+
+    async def _adispatch_tasks(self, max_concurrency: int):
+        """Phase 2: 未完了のタスクをイベントループ上で並行実行する"""
+        print(f"\n[Phase 2/4] Planner: サブタスクの非同期実行ループを開始します (最大同時実行数: {max_concurrency})...")
+
+        loop = asyncio.get_running_loop()
+        active_tasks = {}
+        replan_futures = set()
+        deadlock_replans = 0
+        self._start_worker_backend()
+        with (
+            contextlib.ExitStack() as stack,
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="replan") as replan_executor,
+        ):
+            stack.callback(self._stop_worker_backend)
+            while not self.progress_manager.are_all_tasks_done() or replan_futures:
+                capacity = llm_client.concurrency.effective_limit(max_concurrency)
+                started_ids = []
+                for task_to_run in self.progress_manager.claim_executable_tasks(capacity - len(active_tasks)):
+                    active_tasks[asyncio.create_task(self._arun_actor_slot(task_to_run))] = task_to_run["id"]
+                    started_ids.append(task_to_run["id"])
+                if started_ids:
+                    deadlock_replans = 0
+                    self._prewarm_upcoming(started_ids, use_async_tools=True)
+
+                if not active_tasks and not replan_futures:
+                    backoff = self._deadlock_backoff(deadlock_replans)
+                    if backoff is None:
+                        continue
+                    await asyncio.sleep(backoff)
+                    deadlock_replans += 1
+                    replan_futures.add(
+                        loop.run_in_executor(
+                            replan_executor, self._replan, None, "デッドロックの可能性: 実行可能なタスクがありません。"
+                        )
+                    )
+                    continue
+
+                done_tasks, _ = await asyncio.wait([*active_tasks, *replan_futures], return_when=asyncio.FIRST_COMPLETED)
+                for done_task in done_tasks:
+                    if done_task in replan_futures:
+                        replan_futures.discard(done_task)
+                        self._prewarm_upcoming(use_async_tools=True)
+                        continue
+                    task_id = active_tasks.pop(done_task)
+                    replan_reason = self._handle_finished(task_id, done_task)
+                    if replan_reason:
+                        replan_futures.add(loop.run_in_executor(replan_executor, self._replan, task_id, replan_reason))
+
+        self.progress_manager.flush()
+        print("\n[Phase 2/4] 全てのサブタスクの実行が完了しました。")
 
     @observe()
     def _generate_final_report(self, main_goal: str) -> str:
@@ -335,5 +848,6 @@ class DynamicPlanner:
         response = llm_client.completion(
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
+            call_site="final_report",
         )
         return response.choices[0].message.content
@@ -1,119 +1,506 @@
-import os
+import time
+from graphlib import CycleError, TopologicalSorter
 from threading import RLock
+from aime.config import config
+from aime.metrics import metrics
+from aime.progress_writer import ProgressFileWriter
 
 
 class ProgressManagementModule:
     """
     システム全体のタスク進捗を管理する中央モジュール。
-    進捗をMarkdownファイルにも出力する。
+    進捗をMarkdownファイルにも出力する（書き込みはバックグラウンドスレッドでまとめて行う）。
     """
 
-    def __init__(self, filepath="progress.md"):
+    def __init__(self, filepath: str | None = None, write_to_file: bool | None = None, journal=None, knowledge_index=None):
+        """
+        Args:
+            filepath: 進捗ファイルのパス（Noneの場合はconfig値を使用）
+            write_to_file: 進捗ファイルを出力するか（Noneの場合はconfig値を使用）
+            journal: 状態の変更を追記するRunJournal（Noneの場合は記録しない。attach_journal()で後から設定可能）
+            knowledge_index: 進捗ログを登録する、この実行の知識インデックス（Noneの場合は登録しない）
+        """
         self.tasks = []
+        self.replan_history: list[dict] = []
+        self._journal = journal
+        self.knowledge_index = knowledge_index
         self._lock = RLock()
-        self.filepath = filepath
-        # 初期化時に空ファイルを作成
-        with open(self.filepath, "w", encoding="utf-8") as f:
-            f.write("# Aime Framework Task Progress\n\n")
+        # 依存関係インデックス（ステータス変更と計画更新のたびに差分更新する）
+        self._task_map: dict[int, dict] = {}
+        self._dependents: dict[int, list[int]] = {}
+        self._unmet_deps: dict[int, int] = {}
+        self._ready: dict[int, None] = {}  # 実行可能なタスクIDの順序付き集合
+        self._open_count = 0  # completed/failed 以外のタスク数
+        # メトリクス用: 実行可能になった時刻と実行を開始した時刻（待ち時間と実行時間の計測に使う）
+        self._ready_since: dict[int, float] = {}
+        self._started_at: dict[int, float] = {}
+        # 実行順の優先度（計画の変更時に、変更のあったタスクとその上流だけ再計算する）
+        self.priority_policy = config.task_priority_policy
+        self._priority_deps: dict[int, tuple] = {}  # 優先度を計算した時点の依存関係
+        self._path_length: dict[int, float] = {}  # 自身を含む、下流の最長経路の長さ（推定所要時間の合計）
+        self._descendants: dict[int, int] = {}  # 推移的に依存するタスクの集合（タスクごとのビットの論理和）
+        self._task_bits: dict[int, int] = {}
+        self._duration_estimates: dict[int, float] = {}
+        self._default_duration = 1.0
+        self.filepath = filepath or config.progress_file
+        if write_to_file is None:
+            write_to_file = config.progress_file_enabled
+
+        self._writer = None
+        if write_to_file:
+            self._writer = ProgressFileWriter(self.filepath, self._render_progress_markdown, config.progress_flush_interval_ms)
+            # 初期化時に空ファイルを作成
+            self._writer.flush()
+
+    def _render_progress_markdown(self) -> str:
+        """現在の進捗状況をMarkdown文字列に変換する（書き込みスレッドから呼ばれる）"""
+        with self._lock:
+            lines = ["# Aime Framework Task Progress\n"]
+            for task in self.tasks:
+                if task["status"] == "completed":
+                    marker = "✅"
+                elif task["status"] == "in_progress":
+                    marker = "[-]"
+                elif task["status"] == "failed":
+                    marker = "❌"
+                else:  # pending
+                    marker = "[ ]"
+                lines.append(f"- {marker} {task['description']}")
+
+                # ログの表示を追加
+                for log_entry in task.get("logs", []):
+                    lines.append(f"  - 📝 Log: {log_entry}")
+
+                if task["status"] == "failed" and task["result"]:
+                    lines.append(f"  - **failed:** {str(task['result'])[:100]}...")
+        return "\n".join(lines) + "\n"
 
     def _write_progress_to_file(self):
-        """現在の進捗状況をMarkdownファイルに書き込む"""
-        # このメソッドはロックを取得済みのコンテキストから呼ばれることを想定
-        md_content = "# Aime Framework Task Progress\n\n"
+        """進捗ファイルの更新を書き込みスレッドに通知する（実際の書き込みは非同期にまとめて行われる）"""
+        if self._writer is not None:
+            self._writer.mark_dirty()
+
+    def flush(self):
+        """未反映の進捗を即座にファイルへ書き出す"""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """
+        未反映の進捗をファイルに書き出し、書き込みスレッドを停止する（実行の終了時に呼ぶ）
+
+        以降の変更はファイルに反映しない。
+        """
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+
+    def attach_journal(self, journal):
+        """以降の状態の変更を記録するジャーナルを設定する"""
+        with self._lock:
+            self._journal = journal
+
+    def _journal_event(self, event_type: str, **data):
+        """ジャーナルにイベントを追記する（ロック取得済みの前提。状態の変更と同じ順序で記録される）"""
+        if self._journal is not None:
+            self._journal.append(event_type, **data)
+
+    def _rebuild_index(self):
+        """タスクリスト全体から依存関係インデックスを再構築する（ロック取得済みの前提）"""
+        self._task_map = {task["id"]: task for task in self.tasks}
+        self._dependents = {task_id: [] for task_id in self._task_map}
+        self._unmet_deps = {}
+        self._ready = {}
+        self._open_count = 0
         for task in self.tasks:
-            if task["status"] == "completed":
-                marker = "✅"
-            elif task["status"] == "in_progress":
-                marker = "[-]"
-            elif task["status"] == "failed":
-                marker = "❌"
-            else:  # pending
-                marker = "[ ]"
-            md_content += f"- {marker} {task['description']}\n"
-
-            # ログの表示を追加
-            if task.get("logs"):
-                for log_entry in task["logs"]:
-                    md_content += f"  - 📝 Log: {log_entry}\n"
-
-            # if task["status"] == "completed" and task["result"]:
-            #     md_content += f"  - **Result:** {str(task['result'])[:150]}...\n"
-            if task["status"] == "failed" and task["result"]:
-                md_content += f"  - **failed:** {str(task['result'])[:100]}...\n"
-
-        with open(self.filepath, "w", encoding="utf-8") as f:
-            f.write(md_content)
+            unmet = 0
+            for dep_id in task["dependencies"]:
+                self._dependents.setdefault(dep_id, []).append(task["id"])
+                dep_task = self._task_map.get(dep_id)
+                if dep_task is None or dep_task["status"] != "completed":
+                    unmet += 1
+            self._unmet_deps[task["id"]] = unmet
+            if task["status"] == "pending" and unmet == 0:
+                self._mark_ready(task["id"])
+            if task["status"] not in ("completed", "failed"):
+                self._open_count += 1
+        self._ready_since = {task_id: since for task_id, since in self._ready_since.items() if task_id in self._ready}
+        self._update_priorities()
+
+    def _task_bit(self, task_id: int) -> int:
+        if task_id not in self._task_bits:
+            self._task_bits[task_id] = 1 << len(self._task_bits)
+        return self._task_bits[task_id]
+
+    def _update_priorities(self, changed_ids: set[int] | None = None):
+        """
+        下流の最長経路の長さと推移的な依存タスク数を更新する（ロック取得済みの前提）
+
+        前回の計算から依存関係が変わったタスク（と changed_ids）を起点に、その上流のタスクだけを再計算する。
+        """
+        new_deps = {task["id"]: tuple(task["dependencies"]) for task in self.tasks}
+        changed = set(changed_ids or ())
+        for task_id, deps in new_deps.items():
+            if self._priority_deps.get(task_id) != deps:
+                changed.add(task_id)
+        for task_id, deps in self._priority_deps.items():
+            if new_deps.get(task_id) != deps:
+                # 依存関係が変わった・削除されたタスクの元の依存先は、下流が変わっている
+                changed.update(dep_id for dep_id in deps if dep_id in new_deps)
+                if task_id not in new_deps:
+                    self._path_length.pop(task_id, None)
+                    self._descendants.pop(task_id, None)
+        self._priority_deps = new_deps
+
+        dirty = set()
+        stack = [task_id for task_id in changed if task_id in self._task_map]
+        while stack:
+            task_id = stack.pop()
+            if task_id in dirty:
+                continue
+            dirty.add(task_id)
+            stack.extend(dep_id for dep_id in new_deps[task_id] if dep_id in self._task_map)
+        if not dirty:
+            return
+
+        # 依存しているタスク（下流）から先に計算する
+        graph = {task_id: [d for d in self._dependents.get(task_id, []) if d in dirty] for task_id in dirty}
+        try:
+            order, has_cycle = list(TopologicalSorter(graph).static_order()), False
+        except CycleError:
+            # 循環依存のある計画は実行できないため（デッドロックとして再計画される）、下流を考慮せずに計算する
+            order, has_cycle = list(dirty), True
+        for task_id in order:
+            longest, descendants = 0.0, 0
+            for dependent_id in [] if has_cycle else self._dependents.get(task_id, []):
+                longest = max(longest, self._path_length.get(dependent_id, 0.0))
+                descendants |= self._descendants.get(dependent_id, 0) | self._task_bit(dependent_id)
+            self._path_length[task_id] = self._duration_estimates.get(task_id, self._default_duration) + longest
+            self._descendants[task_id] = descendants
+
+    def set_duration_estimates(self, estimates: dict[int, float], default: float | None = None):
+        """
+        タスクの所要時間の推定値（過去の実行の実績など）を設定し、優先度に反映する
+
+        Args:
+            estimates: タスクIDごとの推定所要時間（単位は任意だが、全タスクで揃える）
+            default: 推定値のないタスクの所要時間（Noneの場合は変更しない。初期値は1.0で、下流のタスク数の最長経路になる）
+        """
+        with self._lock:
+            self._duration_estimates.update(estimates)
+            changed = set(estimates)
+            if default is not None and default != self._default_duration:
+                self._default_duration = default
+                changed = set(self._task_map)
+            self._update_priorities(changed)
+
+    def get_task_priority(self, task_id: int) -> tuple[float, int]:
+        """タスクの優先度（下流の最長経路の長さ, 推移的に依存するタスク数）を返す"""
+        with self._lock:
+            return self._path_length.get(task_id, 0.0), self._descendants.get(task_id, 0).bit_count()
+
+    def _mark_ready(self, task_id: int):
+        """タスクを実行可能な集合に加え、実行可能になった時刻を記録する（ロック取得済みの前提）"""
+        self._ready[task_id] = None
+        self._ready_since.setdefault(task_id, time.monotonic())
+
+    def _record_timing(self, task_id: int, new_status: str):
+        """実行開始時に待ち時間を、完了・失敗時に実行時間をメトリクスに記録する（ロック取得済みの前提）"""
+        if new_status == "pending":
+            self._started_at.pop(task_id, None)
+            return
+        now = time.monotonic()
+        ready_since = self._ready_since.pop(task_id, None)
+        if new_status == "in_progress":
+            if ready_since is not None:
+                metrics.observe("aime_task_queue_wait_seconds", now - ready_since)
+            self._started_at[task_id] = now
+        elif (started_at := self._started_at.pop(task_id, None)) is not None:
+            metrics.observe("aime_task_execution_seconds", now - started_at, status=new_status)
+
+    def _apply_status_change(self, task: dict, old_status: str, new_status: str):
+        """ステータス変更をインデックスに反映する（ロック取得済みの前提）"""
+        if old_status == new_status:
+            return
+        task_id = task["id"]
+
+        # 完了状態の出入りに応じて、依存先タスクの未解決依存数を増減させる
+        if old_status == "completed":
+            for dependent_id in self._dependents.get(task_id, []):
+                self._unmet_deps[dependent_id] += 1
+                self._ready.pop(dependent_id, None)
+                self._ready_since.pop(dependent_id, None)
+        if new_status == "completed":
+            for dependent_id in self._dependents.get(task_id, []):
+                self._unmet_deps[dependent_id] -= 1
+                if self._unmet_deps[dependent_id] == 0 and self._task_map[dependent_id]["status"] == "pending":
+                    self._mark_ready(dependent_id)
+
+        if new_status == "pending" and self._unmet_deps[task_id] == 0:
+            self._mark_ready(task_id)
+        elif new_status != "pending":
+            self._ready.pop(task_id, None)
+        self._record_timing(task_id, new_status)
+
+        was_open = old_status not in ("completed", "failed")
+        is_open = new_status not in ("completed", "failed")
+        self._open_count += int(is_open) - int(was_open)
+
+    @staticmethod
+    def _new_task(task_data: dict) -> dict:
+        """計画のタスク定義から、未着手の状態のタスクを作成する"""
+        return {
+            "id": task_data["id"],
+            "description": task_data["description"],
+            "dependencies": task_data.get("dependencies", []),
+            "status": "pending",
+            "result": None,
+            "logs": [],
+        }
 
     def initialize_tasks(self, tasks_with_deps: list[dict]):
         """依存関係を含むタスクリストを初期化する"""
         with self._lock:
-            self.tasks = []
-            for task_data in tasks_with_deps:
-                self.tasks.append(
-                    {
-                        "id": task_data["id"],
-                        "description": task_data["description"],
-                        "dependencies": task_data.get("dependencies", []),
-                        "status": "pending",
-                        "result": None,
-                        "logs": [],
-                    }
-                )
+            self.tasks = [self._new_task(task_data) for task_data in tasks_with_deps]
+            self._rebuild_index()
+            self._journal_event("plan", tasks=self.tasks)
             print("--- Progress Manager: 依存関係を含むタスクリストを初期化しました ---")
             self.display_progress()
             self._write_progress_to_file()
 
     def update_tasks(self, new_plan: list[dict]):
-        """LLMによって再生成された新しい計画でタスクリストを更新する"""
+        """
+        LLMによって再生成された新しい計画でタスクリストを更新する
+
+        完了済みのタスクと実行中のタスクは、そのまま維持する（実行中のタスクは新しい計画に含まれていなくても残す）。
+        """
         with self._lock:
             new_tasks = []
-            existing_ids = {t["id"] for t in self.tasks}
-            completed_tasks = {t["id"]: t for t in self.tasks if t["status"] == "completed"}
+            kept_tasks = {t["id"]: t for t in self.tasks if t["status"] in ("completed", "in_progress")}
 
             for task_data in new_plan:
                 task_id = task_data["id"]
-                if task_id in completed_tasks:
-                    new_tasks.append(completed_tasks[task_id])  # 完了済みタスクは維持
+                if task_id in kept_tasks:
+                    new_tasks.append(kept_tasks.pop(task_id))  # 完了済み・実行中のタスクは維持
+                else:
+                    new_tasks.append(self._new_task(task_data))  # 失敗したタスクも再度pendingに戻す
+            # 新しい計画から漏れた実行中のタスクも、結果を受け取れるように残す
+            new_tasks.extend(task for task in kept_tasks.values() if task["status"] == "in_progress")
+            self.tasks = new_tasks
+            self._rebuild_index()
+            self._journal_event("plan", tasks=self.tasks)
+            self.display_progress()
+            self._write_progress_to_file()
+
+    def get_downstream_tasks(self, task_id: int) -> list[dict]:
+        """指定したタスクと、その結果に（推移的に）依存する下流のタスクを計画順に返す"""
+        with self._lock:
+            if task_id not in self._task_map:
+                return []
+            downstream = {task_id}
+            stack = [task_id]
+            while stack:
+                for dependent_id in self._dependents.get(stack.pop(), []):
+                    if dependent_id not in downstream:
+                        downstream.add(dependent_id)
+                        stack.append(dependent_id)
+            return [task for task in self.tasks if task["id"] in downstream]
+
+    def next_task_id(self) -> int:
+        """新しいタスクに振るIDを返す"""
+        with self._lock:
+            return max(self._task_map, default=-1) + 1
+
+    def apply_plan_delta(self, remove_ids: list[int], upsert: list[dict]):
+        """
+        計画の差分（タスクの削除と追加・置き換え）を適用する。実行中・完了済みのタスクには影響しない。
+
+        Args:
+            remove_ids: 削除するタスクのID
+            upsert: 追加または置き換えるタスク（既存のIDは置き換え、新しいIDは追加）
+
+        Raises:
+            ValueError: 実行中・完了済みのタスクを変更しようとした場合や、
+                適用後の計画に存在しない依存先・失敗したタスクへの依存・循環依存がある場合（計画は変更しない）
+        """
+        with self._lock:
+            upsert_by_id = {task_data["id"]: task_data for task_data in upsert}
+            for task_id in [*remove_ids, *upsert_by_id]:
+                task = self._task_map.get(task_id)
+                if task is not None and task["status"] in ("completed", "in_progress"):
+                    raise ValueError(f"タスク {task_id} は{task['status']}のため変更できません。")
+
+            new_tasks = []
+            for task in self.tasks:
+                if task["id"] in remove_ids:
+                    continue
+                if task["id"] in upsert_by_id:
+                    new_tasks.append(self._new_task(upsert_by_id.pop(task["id"])))
                 else:
-                    new_tasks.append(
-                        {
-                            "id": task_id,
-                            "description": task_data["description"],
-                            "dependencies": task_data.get("dependencies", []),
-                            "status": "pending",  # 失敗したタスクも再度pendingに戻す
-                            "result": None,
-                            "logs": [],
-                        }
-                    )
+                    new_tasks.append(task)
+            new_tasks.extend(self._new_task(task_data) for task_data in upsert_by_id.values())
+
+            new_map = {task["id"]: task for task in new_tasks}
+            for task in new_tasks:
+                if task["status"] != "pending":
+                    continue
+                for dep_id in task["dependencies"]:
+                    if dep_id not in new_map:
+                        raise ValueError(f"タスク {task['id']} の依存先 {dep_id} が存在しません。")
+                    if new_map[dep_id]["status"] == "failed":
+                        raise ValueError(f"タスク {task['id']} が失敗したタスク {dep_id} に依存しています。")
+            try:
+                TopologicalSorter({task["id"]: task["dependencies"] for task in new_tasks}).prepare()
+            except CycleError as e:
+                raise ValueError(f"循環依存があります: {e}") from e
+
             self.tasks = new_tasks
+            self._rebuild_index()
+            self._journal_event("plan", tasks=self.tasks)
             self.display_progress()
             self._write_progress_to_file()
 
+    def _set_status(self, task: dict, status: str, result: str = None):
+        """タスクのステータスを変更し、インデックスとジャーナルに反映する（ロック取得済みの前提）"""
+        old_status = task["status"]
+        task["status"] = status
+        if result:
+            task["result"] = result
+        self._apply_status_change(task, old_status, status)
+        self._journal_event("status", task_id=task["id"], status=status, result=result)
+        print(f"--- Progress Manager: タスク {task['id']} ('{task['description']}') のステータスを {status} に更新 ---")
+
     def update_task_status(self, task_id: int, status: str, result: str = None):
         """タスクのステータスと結果を更新する"""
         with self._lock:
+            task = self._task_map.get(task_id)
+            if task is not None:
+                self._set_status(task, status, result)
+            self.display_progress()
+            self._write_progress_to_file()
+
+    def record_replan(self, reason: str, failed_task_id: int | None, scope: str):
+        """適用した再計画を履歴とジャーナルに記録する"""
+        with self._lock:
+            entry = {"reason": reason, "failed_task_id": failed_task_id, "scope": scope}
+            self.replan_history.append(entry)
+            self._journal_event("replan", **entry)
+        metrics.inc("aime_replans_total", scope=scope)
+
+    def record_final_report(self, report: str):
+        """最終報告書をジャーナルに記録する"""
+        with self._lock:
+            self._journal_event("final", report=report)
+
+    def restore(self, events: list[dict]) -> list[int]:
+        """
+        ジャーナルのイベントを再生して状態を復元する
+
+        実行中だったタスクは結果が失われているため未着手（pending）に戻し、再実行の対象にする。
+
+        Args:
+            events: RunJournal.load() で読み込んだイベント
+
+        Returns:
+            pendingに戻したタスクのID
+        """
+        with self._lock:
+            tasks, replan_history = [], []
+            task_map = {}
+            for event in events:
+                event_type = event["type"]
+                if event_type == "plan":
+                    tasks = [dict(task, dependencies=list(task["dependencies"]), logs=list(task["logs"])) for task in event["tasks"]]
+                    task_map = {task["id"]: task for task in tasks}
+                elif event_type == "status" and event["task_id"] in task_map:
+                    task = task_map[event["task_id"]]
+                    task["status"] = event["status"]
+                    if event.get("result"):
+                        task["result"] = event["result"]
+                elif event_type == "log" and event["task_id"] in task_map:
+                    task_map[event["task_id"]]["logs"].append(event["message"])
+                elif event_type == "replan":
+                    replan_history.append({key: event.get(key) for key in ("reason", "failed_task_id", "scope")})
+
+            self.tasks = tasks
+            self.replan_history = replan_history
+            reset_ids = []
             for task in self.tasks:
-                if task["id"] == task_id:
-                    task["status"] = status
-                    if result:
-                        task["result"] = result
-                    print(
-                        f"--- Progress Manager: タスク {task_id} ('{task['description']}') のステータスを {status} に更新 ---"
-                    )
-                    break
+                if task["status"] == "in_progress":
+                    task["status"] = "pending"
+                    reset_ids.append(task["id"])
+                    self._journal_event("status", task_id=task["id"], status="pending", result=None)
+            self._rebuild_index()
+            print(f"--- Progress Manager: ジャーナルから {len(self.tasks)} 件のタスクを復元しました ---")
             self.display_progress()
             self._write_progress_to_file()
+            return reset_ids
+
+    def get_task(self, task_id: int) -> dict | None:
+        """指定されたIDのタスクを返す（存在しない場合はNone）"""
+        with self._lock:
+            return self._task_map.get(task_id)
 
     def get_executable_tasks(self) -> list[dict]:
-        """実行可能（依存関係が満たされた）なタスクを全て返す"""
+        """
+        実行可能（依存関係が満たされた）なタスクを全て、実行すべき順に返す
+
+        priority_policy が "critical_path" の場合は、下流の最長経路が長い（長い依存の鎖の起点になっている）タスク、
+        次に推移的に依存するタスクが多いタスクを先にする。同順位と "fifo" の場合は実行可能になった順。
+        """
         with self._lock:
-            completed_ids = {t["id"] for t in self.tasks if t["status"] == "completed"}
-            executable_tasks = []
-            for task in self.tasks:
-                if task["status"] == "pending":
-                    if all(dep_id in completed_ids for dep_id in task["dependencies"]):
-                        executable_tasks.append(task)
-            return executable_tasks
+            return self._sort_by_priority([self._task_map[task_id] for task_id in self._ready])
+
+    def claim_executable_tasks(self, limit: int) -> list[dict]:
+        """
+        実行可能なタスクを実行すべき順に最大 limit 件選び、in_progress にして返す
+
+        選択とステータスの更新を同じロックの中で行うため、再計画と並行して呼んでも、
+        計画から削除されたタスクや他の呼び出し元が開始したタスクを返さない。
+        """
+        if limit <= 0:
+            return []
+        with self._lock:
+            claimed = self._sort_by_priority([self._task_map[task_id] for task_id in self._ready])[:limit]
+            for task in claimed:
+                self._set_status(task, "in_progress")
+            if claimed:
+                self.display_progress()
+                self._write_progress_to_file()
+            return claimed
+
+    def get_prewarm_candidates(self, started_ids: list[int] | None = None) -> list[dict]:
+        """
+        実行中のタスクの完了だけを待っている（未完了の依存タスクが全て実行中の）タスクを、実行すべき順に返す
+
+        依存タスクの完了前にActorを用意しておく対象の選択に使う。
+
+        Args:
+            started_ids: 実行を開始したタスクのID（指定した場合は、その下流のタスクだけを調べる。Noneの場合は全タスク）
+        """
+        with self._lock:
+            if started_ids is None:
+                tasks = self.tasks
+            else:
+                dependent_ids = dict.fromkeys(d for task_id in started_ids for d in self._dependents.get(task_id, []))
+                tasks = [self._task_map[task_id] for task_id in dependent_ids if task_id in self._task_map]
+            candidates = []
+            for task in tasks:
+                if task["status"] != "pending" or task["id"] in self._ready:
+                    continue
+                dependencies = [self._task_map.get(dep_id) for dep_id in task["dependencies"]]
+                if all(dep is not None and dep["status"] in ("completed", "in_progress") for dep in dependencies):
+                    candidates.append(task)
+            return self._sort_by_priority(candidates)
+
+    def _sort_by_priority(self, tasks: list[dict]) -> list[dict]:
+        """priority_policy に従ってタスクを並べ替える（ロック取得済みの前提。fifoの場合は渡された順のまま）"""
+        if self.priority_policy == "critical_path" and len(tasks) > 1:
+            tasks.sort(
+                key=lambda task: (self._path_length.get(task["id"], 0.0), self._descendants.get(task["id"], 0).bit_count()),
+                reverse=True,
+            )
+        return tasks
 
     def get_progress_summary(self) -> str:
         """計画修正のためにLLMに渡す進捗サマリーを生成する"""
@@ -130,13 +517,16 @@ class ProgressManagementModule:
     def add_task_log(self, task_id: int, message: str):
         """タスクにログメッセージを追加する（リアルタイム進捗報告用）"""
         with self._lock:
-            for task in self.tasks:
-                if task["id"] == task_id:
-                    task["logs"].append(message)
-                    print(f"--- Progress Manager: タスク {task_id} にログを追加: '{message}' ---")
-                    break
+            task = self._task_map.get(task_id)
+            if task is not None:
+                task["logs"].append(message)
+                self._journal_event("log", task_id=task_id, message=message)
+                print(f"--- Progress Manager: タスク {task_id} にログを追加: '{message}' ---")
             self.display_progress()
             self._write_progress_to_file()
+        if task is not None and self.knowledge_index is not None:
+            # 他のタスクが search_knowledge で検索できるようにする（語の抽出はロックの外で行う）
+            self.knowledge_index.add(f"タスク{task_id}の進捗報告", message)
 
     def get_pending_tasks(self) -> list[dict]:
         """実行待ち（pending状態）のタスクを全て返す"""
@@ -146,7 +536,7 @@ class ProgressManagementModule:
     def are_all_tasks_done(self) -> bool:
         """全てのタスクが完了したか確認する"""
         with self._lock:
-            return all(task["status"] in ["completed", "failed"] for task in self.tasks)
+            return self._open_count == 0
 
     def display_progress(self):
         """現在の進捗状況をコンソールに表示する"""
@@ -172,7 +562,8 @@ class ProgressManagementModule:
         """指定されたIDの完了済みタスクの結果を辞書で返す"""
         with self._lock:
             results = {}
-            for task in self.tasks:
-                if task["id"] in task_ids and task["status"] == "completed":
-                    results[task["id"]] = task.get("result")
+            for task_id in task_ids:
+                task = self._task_map.get(task_id)
+                if task is not None and task["status"] == "completed":
+                    results[task_id] = task.get("result")
             return results
@@ -0,0 +1,109 @@
+"""
+進捗ファイルの書き込みを専用スレッドで行うモジュール
+変更通知をまとめ（coalesce）、一定間隔ごとにアトミックにファイルへ書き出す（検索キャッシュの永続化にも使う）
+"""
+
+import atexit
+import os
+import tempfile
+import threading
+import time
+from typing import Callable
+
+
+def atomic_write_text(filepath: str, content: str):
+    """一時ファイルに書き込んでからリネームし、読み手が書きかけのファイルを見ないようにする"""
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(filepath))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ProgressFileWriter:
+    """
+    進捗ファイルのバックグラウンドライタ。
+    mark_dirty() による変更通知を合体させ、書き込みは最短でも flush_interval_ms 間隔に抑える。
+    プロセス終了時には未反映の変更を必ず書き出す。
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        render: Callable[[], str],
+        flush_interval_ms: int = 500,
+        label: str = "進捗ファイル",
+        thread_name: str = "progress-writer",
+    ):
+        """
+        ライタを初期化し、書き込みスレッドを起動する
+
+        Args:
+            filepath: 出力先ファイルパス
+            render: ファイル内容を生成するコールバック（書き込みスレッドから呼ばれる）
+            flush_interval_ms: 書き込みの最小間隔（ミリ秒）
+            label: 警告メッセージに表示するファイルの名前
+            thread_name: 書き込みスレッドの名前
+        """
+        self.filepath = filepath
+        self._render = render
+        self._label = label
+        self._interval = flush_interval_ms / 1000
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        self._closed = False
+        self._last_flush = 0.0
+        self._thread = threading.Thread(target=self._run, name=thread_name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def mark_dirty(self):
+        """内容が変更されたことを通知する（呼び出し側はブロックしない）"""
+        with self._cond:
+            self._dirty = True
+            self._cond.notify()
+
+    def flush(self):
+        """現在の内容を即座にファイルへ書き出す"""
+        with self._cond:
+            self._dirty = False
+        self._write()
+
+    def close(self):
+        """書き込みスレッドを停止し、未反映の変更を書き出す"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _write(self):
+        with self._flush_lock:
+            try:
+                atomic_write_text(self.filepath, self._render())
+            except OSError as e:
+                print(f"[WARN] {self._label}の書き込みに失敗しました: {e}")
+            self._last_flush = time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if not self._dirty:
+                    return
+                # 前回の書き込みから最小間隔が経過するまで待ち、その間の変更を1回の書き込みにまとめる
+                remaining = self._last_flush + self._interval - time.monotonic()
+                if remaining > 0 and not self._closed:
+                    self._cond.wait(remaining)
+                    continue
+                self._dirty = False
+            self._write()
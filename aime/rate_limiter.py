@@ -0,0 +1,292 @@
+"""
+プロセス全体で共有するレート制限
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+from aime.config import config
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を待機秒数に変換する"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float, maximum: float, retry_after: Optional[float] = None) -> float:
+    """
+    再試行までの待機秒数を返す
+
+    サーバーから Retry-After が返された場合はそれに従い、それ以外は指数バックオフに ±50% のジッターを加える
+    （同時に失敗した呼び出しが同じタイミングで一斉に再試行しないようにするため）。
+    """
+    if retry_after is not None:
+        return min(retry_after, maximum)
+    return min(maximum, base * 2**attempt) * (0.5 + random.random())
+
+
+class TokenBucket:
+    """
+    スレッドセーフなトークンバケット。
+    rate（トークン/秒）で補充され、最大 capacity まで貯められる。
+    capacity を超える量を要求された場合は、バケットが満杯になるのを待って全量を消費し、不足分は後続の取得を待たせる。
+    サーバーから待機を指示された場合（Retry-After）は、block_for() で全利用者をまとめて待たせる。
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Args:
+            rate: 1秒あたりの補充トークン数
+            capacity: バケットの容量（Noneの場合は1秒分、最低1）
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, tokens: float) -> float:
+        """トークンの取得を試み、取得できた場合は0、できない場合は待つべき秒数を返す"""
+        required = min(tokens, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if self._tokens >= required:
+                # 容量を超える分は残量を負にし、平均の速さが rate を超えないようにする
+                self._tokens -= tokens
+                return 0.0
+            return (required - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """トークンが取得できるまでブロックし、待った秒数を返す"""
+        waited = 0.0
+        while (wait := self._reserve(tokens)) > 0:
+            time.sleep(wait)
+            waited += wait
+        return waited
+
+    async def aacquire(self, tokens: float = 1.0) -> float:
+        """acquireの非同期版（待機中はイベントループに制御を返す）"""
+        waited = 0.0
+        while (wait := self._reserve(tokens)) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        return waited
+
+    def adjust(self, tokens: float):
+        """
+        取得済みのトークン数を事後に補正する（正の値で追加消費、負の値で返却）
+
+        見積もりより多く消費した場合は残量が負になり、その分だけ後続の取得が待たされる。
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - tokens)
+
+    def block_for(self, seconds: float, drain: bool = False):
+        """
+        指定秒数、全ての取得要求を待たせる（429応答のRetry-Afterなどに使う）
+
+        Args:
+            seconds: 待たせる秒数
+            drain: Trueの場合は貯まっているトークンも捨て、待機明けに一斉に取得されず補充の速さで少しずつ再開させる
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            if drain:
+                self._refill(time.monotonic())
+                self._tokens = min(self._tokens, 0.0)
+
+
+@dataclass
+class _ModelLimits:
+    requests: Optional[TokenBucket]  # 1分あたりのリクエスト数（RPM）
+    tokens: Optional[TokenBucket]  # 1分あたりのトークン数（TPM）
+    blocked_until: float = 0.0  # レート制限を受けて送信を止めている期限（上限を設定していないモデルにも使う）
+
+
+class ModelRateLimiter:
+    """
+    モデルごとのRPMとTPMのトークンバケットをまとめて管理する（プロセス全体で共有）。
+    1分間の上限を1分かけて補充し、貯められるのは config.llm_rate_limit_burst_seconds 秒分までとする
+    （1分間の上限を開始直後に一斉に送信すると、サーバー側の短い区間での制限を受けやすいため）。
+    """
+
+    def __init__(self):
+        self._limits: Dict[str, _ModelLimits] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, model: str, requests_per_minute: Optional[float], tokens_per_minute: Optional[float]):
+        """モデルの上限を設定する（Noneまたは0の項目は制限しない）"""
+        with self._lock:
+            previous = self._limits.get(model)
+            self._limits[model] = _ModelLimits(
+                self._bucket(requests_per_minute) if requests_per_minute else None,
+                self._bucket(tokens_per_minute) if tokens_per_minute else None,
+                previous.blocked_until if previous else 0.0,
+            )
+
+    @staticmethod
+    def _bucket(per_minute: float) -> TokenBucket:
+        """1分あたりの上限から、burst秒分（最低1）を容量とするバケットを作る"""
+        rate = per_minute / 60
+        return TokenBucket(rate, max(1.0, min(per_minute, rate * config.llm_rate_limit_burst_seconds)))
+
+    def is_configured(self, model: str) -> bool:
+        """RPMかTPMの上限が設定されているか"""
+        with self._lock:
+            limits = self._limits.get(model)
+            return limits is not None and (limits.requests is not None or limits.tokens is not None)
+
+    def limits_tokens(self, model: str) -> bool:
+        """TPMの制限があるか（送信前にトークン数を見積もる必要があるか）"""
+        with self._lock:
+            limits = self._limits.get(model)
+            return limits is not None and limits.tokens is not None
+
+    def _get(self, model: str) -> Optional[_ModelLimits]:
+        with self._lock:
+            return self._limits.get(model)
+
+    def acquire(self, model: str, tokens: float = 0.0) -> float:
+        """リクエスト1回分と見積もりトークン数を取得できるまでブロックし、待った秒数を返す"""
+        limits = self._get(model)
+        if limits is None:
+            return 0.0
+        waited = max(0.0, limits.blocked_until - time.monotonic())
+        if waited:
+            time.sleep(waited)
+        waited += limits.requests.acquire() if limits.requests else 0.0
+        if limits.tokens and tokens:
+            waited += limits.tokens.acquire(tokens)
+        return waited
+
+    async def aacquire(self, model: str, tokens: float = 0.0) -> float:
+        """acquireの非同期版"""
+        limits = self._get(model)
+        if limits is None:
+            return 0.0
+        waited = max(0.0, limits.blocked_until - time.monotonic())
+        if waited:
+            await asyncio.sleep(waited)
+        waited += await limits.requests.aacquire() if limits.requests else 0.0
+        if limits.tokens and tokens:
+            waited += await limits.tokens.aacquire(tokens)
+        return waited
+
+    def settle(self, model: str, estimated_tokens: float, actual_tokens: float):
+        """送信前の見積もりと実際の使用量の差をTPMのバケットに反映する"""
+        limits = self._get(model)
+        if limits is not None and limits.tokens and estimated_tokens:
+            limits.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def block(self, model: str, seconds: float):
+        """レート制限を受けたモデルへの送信を、全スレッドまとめて指定秒数止める"""
+        with self._lock:
+            limits = self._limits.setdefault(model, _ModelLimits(None, None))
+            limits.blocked_until = max(limits.blocked_until, time.monotonic() + seconds)
+        for bucket in (limits.requests, limits.tokens):
+            if bucket is not None:
+                bucket.block_for(seconds, drain=True)
+
+    def configure_from_headers(self, model: str, headers: Mapping[str, str]) -> bool:
+        """
+        レスポンスヘッダーの上限（x-ratelimit-limit-requests / -tokens）からモデルの上限を設定する
+
+        Returns:
+            設定した場合はTrue（ヘッダーに上限が含まれていない場合はFalse）
+        """
+        try:
+            rpm = float(headers["x-ratelimit-limit-requests"]) if "x-ratelimit-limit-requests" in headers else None
+            tpm = float(headers["x-ratelimit-limit-tokens"]) if "x-ratelimit-limit-tokens" in headers else None
+        except (TypeError, ValueError):
+            return False
+        if not rpm and not tpm:
+            return False
+        self.configure(model, rpm, tpm)
+        return True
+
+
+class AIMDController:
+    """
+    同時実行数の上限をAIMD（加算増加・乗算減少）で調整する。
+
+    レート制限を検出すると、その時点の同時実行数（呼び出し側の最大同時実行数。不明な場合は実行中の呼び出し数）に
+    decrease_factor を掛けた値まで上限を下げ、
+    その後は上限の数だけ成功するごとに1ずつ戻す。制限を受けた時点の同時実行数まで戻ったら上限を外す。
+    1回の過負荷で複数の呼び出しが同時に制限を受けるため、下げた直後の cooldown 秒間は続けて下げない。
+    """
+
+    def __init__(self, decrease_factor: float = 0.5, minimum: int = 1, cooldown: float = 5.0):
+        self.decrease_factor = decrease_factor
+        self.minimum = minimum
+        self.cooldown = cooldown
+        self.limit: Optional[int] = None  # Noneの場合は制限なし
+        self._maximum: Optional[int] = None  # effective_limit() に渡された最大同時実行数
+        self._ceiling = 0
+        self._successes = 0
+        self._last_decrease = -float("inf")
+        self._lock = threading.Lock()
+
+    def on_success(self):
+        with self._lock:
+            if self.limit is None:
+                return
+            self._successes += 1
+            if self._successes < self.limit:
+                return
+            self._successes = 0
+            self.limit += 1
+            if self.limit >= self._ceiling:
+                self.limit = None
+                print(f"--- 同時実行数の上限を解除しました (レート制限を受けた時点の同時実行数 {self._ceiling} まで回復) ---")
+
+    def on_throttle(self, concurrency: int) -> bool:
+        """
+        レート制限を受けたことを通知する
+
+        Args:
+            concurrency: 制限を受けた時点の実行中の呼び出し数（呼び出し側の最大同時実行数が分からない場合に使う）
+
+        Returns:
+            上限を下げた場合はTrue
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return False
+            current = self.limit if self.limit is not None else max(self._maximum or concurrency, self.minimum)
+            if self.limit is None:
+                self._ceiling = current
+            self.limit = max(self.minimum, int(current * self.decrease_factor))
+            self._successes = 0
+            self._last_decrease = now
+            print(f"[WARN] レート制限を検出したため、同時実行数の上限を {self.limit} に下げます。")
+            return True
+
+    def effective_limit(self, maximum: int) -> int:
+        """呼び出し側の最大同時実行数に、現在の上限を適用した値を返す"""
+        with self._lock:
+            self._maximum = maximum
+            return maximum if self.limit is None else max(self.minimum, min(maximum, self.limit))
@@ -0,0 +1,249 @@
+"""
+依存タスクへの結果の受け渡し
+完了したタスクの結果をタスクの完了時に1回だけminiモデルで要約しておき、依存先のタスクには
+要約と、そのタスクの説明に関連する段落の抜粋を、トークン予算の範囲で渡す
+"""
+
+import asyncio
+import math
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from aime.config import config
+from aime.context_budget import count_tokens
+from aime.llm_client import llm_client
+
+# 英数字の単語と、かな・漢字の連続（かな・漢字は2文字ずつの組に分けて照合する）
+_TERM_PATTERN = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def extract_terms(text: str) -> List[str]:
+    """照合用の語を取り出す（英数字は単語単位、かな・漢字は文字のbigram）"""
+    terms = []
+    for match in _TERM_PATTERN.finditer(unicodedata.normalize("NFKC", text).lower()):
+        token = match.group()
+        if token.isascii():
+            terms.append(token)
+        elif len(token) == 1:
+            terms.append(token)
+        else:
+            terms.extend(token[i : i + 2] for i in range(len(token) - 1))
+    return terms
+
+
+def split_chunks(text: str, max_chars: int) -> List[str]:
+    """結果を段落単位に分け、長い段落は max_chars 文字ごとに区切る"""
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        for start in range(0, len(paragraph), max_chars):
+            chunks.append(paragraph[start : start + max_chars])
+    return chunks
+
+
+def _truncate_to_tokens(text: str, tokens: int, budget: int) -> str:
+    """トークン数が tokens のテキストを、おおよそ budget トークンに収まるように切り詰める"""
+    if tokens <= budget:
+        return text
+    return f"{text[: max(0, len(text) * budget // max(1, tokens) - 3)]}..."
+
+
+@dataclass
+class _Chunk:
+    text: str
+    tokens: int
+    terms: Set[str]
+
+
+@dataclass
+class _StoredResult:
+    task_id: int
+    description: str
+    result: str
+    tokens: int = 0
+    chunks: List[_Chunk] = field(default_factory=list)
+    indexed: bool = False  # 段落への分割とトークン数の計算が済んだか
+    summary: Optional[str] = None
+    future: Optional[Future] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ResultStore:
+    """
+    完了したタスクの結果と、その要約・抜粋用の段落を保持する（実行ごとに1つ）。
+    要約はタスクの完了時にバックグラウンドで1回だけ作成し、依存先のタスクの数にかかわらず使い回す。
+    短い結果は要約せず、原文をそのまま要約として使う。
+    """
+
+    def __init__(self):
+        self._entries: Dict[int, _StoredResult] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="result-summary")
+
+    def add(self, task_id: int, description: str, result: str):
+        """
+        完了したタスクの結果を登録し、段落への分割と要約をバックグラウンドで行う（呼び出し側はブロックしない）
+
+        同じIDのタスクが再計画で置き換えられて再び完了した場合は、新しい結果で上書きする。
+        """
+        entry = _StoredResult(task_id, description, str(result))
+        with self._lock:
+            self._entries[task_id] = entry
+        try:
+            entry.future = self._executor.submit(self._process, entry)
+        except RuntimeError:
+            # 実行終了後（close後）に登録された場合は、参照時にその場で分割する
+            pass
+
+    def _process(self, entry: _StoredResult):
+        """結果を段落に分割し、長い結果は続けて要約する"""
+        self._ensure_indexed(entry)
+        if entry.summary is None and config.result_summary_enabled:
+            self._summarize(entry)
+
+    @staticmethod
+    def _ensure_indexed(entry: _StoredResult):
+        """結果を段落に分割し、トークン数と照合用の語を求める（済んでいる場合は何もしない）"""
+        with entry.lock:
+            if entry.indexed:
+                return
+            entry.chunks = [
+                _Chunk(text, count_tokens(text), set(extract_terms(text)))
+                for text in split_chunks(entry.result, config.result_excerpt_chars)
+            ]
+            entry.tokens = sum(chunk.tokens for chunk in entry.chunks)
+            if entry.tokens <= config.result_summary_min_tokens:
+                entry.summary = entry.result
+            entry.indexed = True
+
+    def _summarize(self, entry: _StoredResult):
+        """miniモデルで結果を要約する（失敗した場合は要約なしで、抜粋だけを渡す）"""
+        prompt = f"""
+以下はタスク「{entry.description}」の実行結果です。
+後続のタスクが前提知識として使えるように、結論と重要な事実（固有名詞、数値、日付、URLなど）を残して、簡潔な日本語で要約してください。
+
+# 実行結果
+{entry.result}
+
+# 要約
+"""
+        try:
+            response = llm_client.completion_mini(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.0,
+                max_tokens=config.result_summary_max_tokens,
+                call_site="result_summary",
+            )
+            summary = response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"  [WARN] タスク {entry.task_id} の結果の要約に失敗しました。関連する抜粋だけを渡します: {e}")
+            return
+        with entry.lock:
+            entry.summary = summary or None
+
+    def wait(self, task_ids: List[int], timeout: float):
+        """指定したタスクの段落への分割と要約の作成を、最大 timeout 秒待つ"""
+        futures = self._pending_futures(task_ids)
+        if futures and timeout > 0:
+            wait_futures(futures, timeout=timeout)
+
+    async def await_summaries(self, task_ids: List[int], timeout: float):
+        """waitの非同期版"""
+        futures = self._pending_futures(task_ids)
+        if futures and timeout > 0:
+            await asyncio.wait([asyncio.wrap_future(future) for future in futures], timeout=timeout)
+
+    def _pending_futures(self, task_ids: List[int]) -> List[Future]:
+        with self._lock:
+            entries = [self._entries[task_id] for task_id in task_ids if task_id in self._entries]
+        return [entry.future for entry in entries if entry.future is not None and not entry.future.done()]
+
+    def build_context(self, task_ids: List[int], query: str, token_budget: int = None) -> str:
+        """
+        依存タスクの要約と、query に関連する抜粋を token_budget トークンの範囲でまとめる（待たずに、その時点の要約を使う）
+
+        各タスクの要約（未作成の場合は結果の冒頭）に予算を均等に割り当て、残りの予算には
+        全タスクの段落からqueryとの関連度が高い順に抜粋を加える。
+
+        Args:
+            task_ids: 依存タスクのID（結果が登録されていないタスクは無視する）
+            query: 関連度の基準とするテキスト（依存先のタスクの説明）
+            token_budget: 全依存タスク合計のトークン数の上限（Noneの場合はconfig値を使用）
+        """
+        with self._lock:
+            entries = [self._entries[task_id] for task_id in task_ids if task_id in self._entries]
+        if not entries:
+            return ""
+
+        # バックグラウンドでの分割が間に合わなかった結果は、ここで分割する
+        for entry in entries:
+            self._ensure_indexed(entry)
+
+        budget = token_budget or config.knowledge_token_budget
+        share = budget // len(entries)
+        summaries: Dict[int, Optional[str]] = {}
+        leads: Dict[int, str] = {}
+        selected: Dict[int, Set[int]] = {entry.task_id: set() for entry in entries}
+        used = 0
+        for entry in entries:
+            with entry.lock:
+                summary = summaries[entry.task_id] = entry.summary
+            if summary is not None:
+                tokens = count_tokens(summary)
+                leads[entry.task_id] = _truncate_to_tokens(summary, tokens, share)
+                used += min(share, tokens)
+            elif entry.chunks:
+                # 要約がまだない場合は、結果の冒頭を必ず含める
+                head = entry.chunks[0]
+                leads[entry.task_id] = _truncate_to_tokens(head.text, head.tokens, share)
+                selected[entry.task_id].add(0)
+                used += min(share, head.tokens)
+
+        # 残りの予算に、関連度の高い段落から加える（要約が原文そのものの短い結果は除く）
+        candidates = [
+            (entry, index)
+            for entry in entries
+            if summaries[entry.task_id] != entry.result
+            for index in range(len(entry.chunks))
+            if index not in selected[entry.task_id]
+        ]
+        query_terms = set(extract_terms(query))
+        document_frequency: Dict[str, int] = {}
+        for entry, index in candidates:
+            for term in entry.chunks[index].terms & query_terms:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        scored = []
+        for entry, index in candidates:
+            chunk = entry.chunks[index]
+            shared = chunk.terms & query_terms
+            if shared:
+                weight = sum(math.log(1 + len(candidates) / document_frequency[term]) for term in shared)
+                scored.append((weight / math.sqrt(len(chunk.terms)), entry.task_id, index))
+        chunk_tokens = {(entry.task_id, index): entry.chunks[index].tokens for entry, index in candidates}
+        for _, task_id, index in sorted(scored, key=lambda item: -item[0]):
+            if used + chunk_tokens[(task_id, index)] <= budget:
+                selected[task_id].add(index)
+                used += chunk_tokens[(task_id, index)]
+
+        sections = []
+        for entry in entries:
+            lines = [f"## タスク{entry.task_id}の結果概要:", leads.get(entry.task_id, "")]
+            excerpts = [
+                entry.chunks[index].text
+                for index in sorted(selected[entry.task_id])
+                if index != 0 or summaries[entry.task_id] is not None
+            ]
+            if excerpts:
+                lines.append("### 関連する抜粋:")
+                lines.extend(f"> {excerpt}".replace("\n", "\n> ") for excerpt in excerpts)
+            sections.append("\n".join(line for line in lines if line))
+        return "\n\n".join(sections)
+
+    def close(self):
+        """未着手の要約を取り消す（実行中の要約は完了を待たない）"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,76 @@
+"""
+実行状態の追記型ジャーナル
+計画・ステータス・結果・ログ・再計画の履歴を runs/<run_id>/journal.jsonl に1行1イベントで追記し、
+プロセスが途中で終了しても、完了済みのタスクを再実行せずに再開できるようにする
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+JOURNAL_FILENAME = "journal.jsonl"
+
+
+def new_run_id() -> str:
+    """実行IDを生成する（日時 + プロセスID）"""
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+
+class RunJournal:
+    """
+    1回の実行分のジャーナル。イベントは追記のみで、書き込んだ行を書き換えることはない。
+    各イベントは書き込みごとにフラッシュし、fsync=Trueの場合はディスクへの同期まで行う。
+    """
+
+    def __init__(self, run_dir: str, fsync: bool = False):
+        """
+        Args:
+            run_dir: 実行ごとのディレクトリ（runs/<run_id>）
+            fsync: イベントごとにfsyncするか（電源断にも耐えるが、書き込みが遅くなる）
+        """
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, JOURNAL_FILENAME)
+        self.fsync = fsync
+        os.makedirs(run_dir, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def append(self, event_type: str, **data: Any):
+        """イベントを1行追記する"""
+        line = json.dumps({"type": event_type, "ts": time.time(), **data}, ensure_ascii=False)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    @staticmethod
+    def load(run_dir: str) -> List[Dict[str, Any]]:
+        """
+        ジャーナルのイベントを書き込み順に読み込む
+
+        書き込み途中で終了した末尾の行のように、JSONとして読めない行は読み飛ばす。
+
+        Raises:
+            FileNotFoundError: ジャーナルが存在しない場合
+        """
+        events = []
+        with open(os.path.join(run_dir, JOURNAL_FILENAME), encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"[WARN] ジャーナルの {line_number} 行目を読み込めないため読み飛ばします。")
+        return events
@@ -0,0 +1,189 @@
+"""
+検索ツールの結果キャッシュ
+正規化したクエリをキーにTTL付きで結果を共有し、同一クエリの同時実行は1回のリクエストにまとめる
+永続化ファイルへの書き込みはバックグラウンドスレッドでまとめて行い、検索の呼び出し側を待たせない
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from aime.config import config
+from aime.progress_writer import ProgressFileWriter
+
+_QUOTE_CHARS = "\"'“”‘’「」『』"
+
+
+def normalize_query(query: str) -> str:
+    """表記ゆれ（全角/半角、大文字/小文字、引用符、連続空白）を吸収したキャッシュキー用のクエリを返す"""
+    normalized = unicodedata.normalize("NFKC", query).lower()
+    normalized = normalized.translate({ord(c): " " for c in _QUOTE_CHARS})
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+class SearchCache:
+    """
+    スレッドセーフな検索結果キャッシュ。
+    同じクエリを複数のActorが同時に発行した場合、最初の1件だけが実際に検索し、残りはその結果を待つ。
+    設定値（TTL、最大件数、永続化パス）は省略時にconfigから読み込む。
+    永続化パスがある場合、結果の追加は ProgressFileWriter に通知し、最小間隔ごとにキャッシュ全体を書き出す。
+    """
+
+    def __init__(
+        self, ttl_seconds: Optional[int] = None, max_entries: Optional[int] = None, persist_path: Optional[str] = None
+    ):
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._persist_path = persist_path
+        self._entries: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._writer: Optional[ProgressFileWriter] = None
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    @property
+    def ttl_seconds(self) -> int:
+        return self._ttl_seconds if self._ttl_seconds is not None else config.search_cache_ttl_seconds
+
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries if self._max_entries is not None else config.search_cache_max_entries
+
+    @property
+    def persist_path(self) -> Optional[str]:
+        return self._persist_path if self._persist_path is not None else config.search_cache_path
+
+    def _ensure_loaded(self):
+        """
+        永続化ファイルがあれば初回アクセス時に読み込む（ロック取得済みの前提）
+        期限切れのエントリは読み込まず、最大件数を超える分は古い（最後に使われたのが前の）ものから捨てる
+        """
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                stored = json.load(f)
+            now = time.time()
+            for key, (stored_at, result) in stored.items():
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries[key] = (stored_at, result)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"[WARN] 検索キャッシュの読み込みに失敗しました: {e}")
+        self._trim()
+
+    def _trim(self):
+        """最大件数を超えた分を、最後に使われたのが古いものから捨てる（ロック取得済みの前提）"""
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _render(self) -> str:
+        """永続化ファイルの内容（書き込みスレッドから呼ばれる）"""
+        with self._lock:
+            snapshot = dict(self._entries)
+        return json.dumps(snapshot, ensure_ascii=False)
+
+    def _mark_dirty(self):
+        """変更を書き込みスレッドに通知する（初回に書き込みスレッドを起動する）"""
+        with self._lock:
+            if self._writer is None:
+                try:
+                    if directory := os.path.dirname(self.persist_path):
+                        os.makedirs(directory, exist_ok=True)
+                except OSError as e:
+                    print(f"[WARN] 検索キャッシュの保存先を作成できません: {e}")
+                    return
+                self._writer = ProgressFileWriter(
+                    self.persist_path,
+                    self._render,
+                    config.search_cache_flush_interval_ms,
+                    label="検索キャッシュ",
+                    thread_name="search-cache-writer",
+                )
+            writer = self._writer
+        writer.mark_dirty()
+
+    def flush(self):
+        """未反映の変更を即座に永続化ファイルへ書き出す"""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """書き込みスレッドを停止し、未反映の変更を書き出す（プロセス終了時にも自動で呼ばれる）"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+
+    def get_or_fetch(
+        self, namespace: str, query: str, fetch: Callable[[], Tuple[str, bool]], normalize: bool = True
+    ) -> str:
+        """
+        キャッシュ済みの結果を返す。なければ fetch を実行して結果を保存する。
+
+        Args:
+            namespace: 検索バックエンド名（バックエンドごとにキャッシュを分ける）
+            query: 検索クエリ
+            fetch: 実際の検索を行う関数。（結果, キャッシュしてよいか）を返す
+            normalize: Falseの場合はqueryを正規化せずにキーにする（URLなど、大文字・小文字を区別する場合）
+
+        Returns:
+            検索結果
+        """
+        key = f"{namespace}:{normalize_query(query) if normalize else query}"
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            future = self._inflight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.collapsed += 1
+
+        if not is_owner:
+            # 同じクエリを実行中の他スレッドの結果を待つ
+            return future.result()
+
+        try:
+            result, cacheable = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            if cacheable:
+                self._entries[key] = (time.time(), result)
+                self._entries.move_to_end(key)
+                self._trim()
+        future.set_result(result)
+
+        if cacheable and self.persist_path:
+            self._mark_dirty()
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット数、ミス数、同時実行の集約数を返す"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "collapsed": self.collapsed, "entries": len(self._entries)}
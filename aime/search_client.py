@@ -0,0 +1,84 @@
+"""
+Google Custom Search APIの長寿命クライアント
+サービスオブジェクトは一度だけ構築し、HTTP接続はスレッドごとに再利用（keep-alive）する
+"""
+
+import threading
+import time
+from typing import Any, Dict
+
+import httplib2
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from aime.rate_limiter import TokenBucket, backoff_delay, parse_retry_after
+
+# リトライ対象のHTTPステータス（レート制限とサーバーエラー）
+RETRYABLE_STATUSES = {429, 500, 502, 503}
+
+
+class GoogleSearchClient:
+    """
+    全Actorで共有するGoogle Custom Searchクライアント。
+    ディスカバリ文書の処理はクライアント生成時の1回だけで、クエリごとのコストは実際のリクエストのみになる。
+    httplib2.Httpはスレッドセーフではないため、接続はスレッドローカルに保持して使い回す。
+    """
+
+    def __init__(self, api_key: str, cse_id: str, requests_per_minute: float, timeout: float = 10.0):
+        """
+        Args:
+            api_key: Google APIキー
+            cse_id: プログラマブル検索エンジンID
+            requests_per_minute: 全スレッド合計の最大リクエスト数/分
+            timeout: HTTPタイムアウト（秒）
+        """
+        self.api_key = api_key
+        self.cse_id = cse_id
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(rate=requests_per_minute / 60)
+        self._service = build("customsearch", "v1", developerKey=api_key, cache_discovery=False, static_discovery=True)
+        self._local = threading.local()
+
+    def _http(self) -> httplib2.Http:
+        """このスレッド専用のHTTP接続（keep-aliveで再利用される）を返す"""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = httplib2.Http(timeout=self.timeout)
+            self._local.http = http
+        return http
+
+    def search(self, query: str, num: int = 3, max_retries: int = 3) -> Dict[str, Any]:
+        """
+        検索を実行してAPIのレスポンスを返す
+
+        Args:
+            query: 検索クエリ
+            num: 取得件数
+            max_retries: 最大試行回数
+
+        Returns:
+            Custom Search APIのレスポンス
+
+        Raises:
+            HttpError: リトライ不可能なエラー、または最大試行回数に達した場合
+        """
+        max_retries = max(1, max_retries)
+        for attempt in range(max_retries):
+            self.rate_limiter.acquire()
+            try:
+                request = self._service.cse().list(q=query, cx=self.cse_id, num=num)
+                return request.execute(http=self._http())
+            except HttpError as e:
+                if e.resp.status not in RETRYABLE_STATUSES or attempt == max_retries - 1:
+                    raise
+                delay = backoff_delay(attempt, 1.0, float("inf"), parse_retry_after(e.resp.get("retry-after")))
+                if e.resp.status == 429:
+                    # レート制限は全Actor共通なので、共有リミッタごと待たせる
+                    self.rate_limiter.block_for(delay)
+                print(f"  [WARN] Google Search APIエラー: {e.resp.status}。{delay:.1f}秒後にリトライします... ({attempt + 1}/{max_retries})")
+                time.sleep(delay)
+            except (OSError, httplib2.HttpLib2Error):
+                # 切断された接続を破棄し、次の試行で張り直す
+                self._local.http = None
+                if attempt == max_retries - 1:
+                    raise
@@ -0,0 +1,66 @@
+"""
+ツール関数からFunction Calling用のJSONスキーマを生成するモジュール
+シグネチャの型注釈とdocstringから、OpenAI形式の関数定義を組み立てる
+"""
+
+import inspect
+import re
+from typing import Any, Callable, Dict
+
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+
+
+def _parse_docstring(doc: str) -> tuple[str, Dict[str, str]]:
+    """docstringを本文の説明と、Args節の引数ごとの説明に分ける"""
+    doc = inspect.cleandoc(doc or "")
+    description_lines, arg_descriptions = [], {}
+    in_args = False
+    for line in doc.splitlines():
+        stripped = line.strip()
+        if stripped in ("Args:", "Arguments:"):
+            in_args = True
+            continue
+        if stripped in ("Returns:", "Raises:"):
+            in_args = False
+            continue
+        if in_args:
+            if match := re.match(r"(\w+)(?:\s*\(.*?\))?\s*:\s*(.*)", stripped):
+                arg_descriptions[match.group(1)] = match.group(2)
+            continue
+        description_lines.append(stripped)
+    return " ".join(line for line in description_lines if line), arg_descriptions
+
+
+def function_schema(name: str, func: Callable[..., Any]) -> Dict[str, Any]:
+    """
+    ツール関数からFunction Calling用の関数定義を生成する
+
+    Args:
+        name: LLMに公開するツール名
+        func: ツール関数（非同期ツールはラップ元の関数のシグネチャを使う）
+
+    Returns:
+        {"type": "function", "function": {...}} 形式の関数定義
+    """
+    description, arg_descriptions = _parse_docstring(func.__doc__)
+    properties, required = {}, []
+    for param in inspect.signature(func).parameters.values():
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        if param.default is not param.empty:
+            # 既定値のある引数（リトライ回数など）は実装側の設定としてLLMには公開しない
+            continue
+        prop = {"type": _JSON_TYPES.get(param.annotation, "string")}
+        if param.name in arg_descriptions:
+            prop["description"] = arg_descriptions[param.name]
+        properties[param.name] = prop
+        required.append(param.name)
+
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        },
+    }
@@ -1,9 +1,29 @@
+import asyncio
+import functools
+import re
+import threading
 from duckduckgo_search import DDGS
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-import time
 
 from aime.config import config
+from aime.knowledge_index import KnowledgeIndex
+from aime.page_fetcher import PageFetcher
+from aime.search_cache import SearchCache
+from aime.search_client import GoogleSearchClient, RETRYABLE_STATUSES
+
+# 全Actorで共有する検索結果キャッシュ
+search_cache = SearchCache()
+
+# 全Actorで共有するGoogle検索クライアント
+_google_client = None
+_google_client_lock = threading.Lock()
+
+# 全Actorで共有するページ取得クライアント
+_page_fetcher = None
+_page_fetcher_lock = threading.Lock()
+
+# ツールの引数から取り出すURL（空白・引用符・全角の句読点で区切る）
+_URL_PATTERN = re.compile(r"https?://[^\s\"'<>、。，）」]+")
 
 
 def web_search(query: str) -> str:
@@ -14,6 +34,11 @@ def web_search(query: str) -> str:
     if query.startswith('"') and query.endswith('"'):
         query = query[1:-1]
 
+    return search_cache.get_or_fetch("duckduckgo", query, lambda: _web_search_uncached(query))
+
+
+def _web_search_uncached(query: str) -> tuple[str, bool]:
+    """DuckDuckGoで検索し、（結果, キャッシュ可否）を返す"""
     try:
         with DDGS() as ddgs:
             results = [r for r in ddgs.text(query, max_results=3)]
@@ -21,9 +46,9 @@ def web_search(query: str) -> str:
                 "\n".join([f"Title: {res['title']}\nBody: {res['body']}" for res in results])
                 if results
                 else "検索結果が見つかりませんでした。"
-            )
+            ), True
     except Exception as e:
-        return f"検索中にエラーが発生しました: {e}"
+        return f"検索中にエラーが発生しました: {e}", False
 
 
 def google_search(query: str, max_retries: int = 3) -> str:  # リトライ回数を引数に追加
@@ -44,36 +69,84 @@ def google_search(query: str, max_retries: int = 3) -> str:  # リトライ回
     if not api_key or not cse_id:
         return "エラー: GOOGLE_API_KEY または GOOGLE_CSE_ID が環境変数に設定されていません。"
 
-    # ▼▼▼ リトライ処理のループを追加 ▼▼▼
-    for attempt in range(max_retries):
-        try:
-            service = build("customsearch", "v1", developerKey=api_key)
-            res = service.cse().list(q=query, cx=cse_id, num=3).execute()
-
-            if "items" in res and res["items"]:
-                results = []
-                for item in res["items"]:
-                    title = item.get("title", "N/A")
-                    snippet = item.get("snippet", "N/A")
-                    link = item.get("link", "N/A")
-                    results.append(f"Title: {title}\nSnippet: {snippet}\nLink: {link}")
-                return "\n---\n".join(results)
-            else:
-                # 検索結果が0件の場合はリトライ不要なので、ここでループを抜ける
-                return "検索結果が見つかりませんでした。"
-
-        except HttpError as e:
-            # サーバーエラー(5xx)やレート制限(429)の場合のみリトライ
-            if e.resp.status in [429, 500, 503]:
-                print(f"  [WARN] Google Search APIエラー: {e.resp.status}。リトライします... ({attempt + 1}/{max_retries})")
-                time.sleep(2**attempt)  # 1, 2, 4秒... と待機時間を増やす
-            else:
-                # その他のクライアントエラー(4xx)はリトライしても無駄なので即時失敗させる
-                return f"Google API HTTPエラー（リトライ不可）: {e.resp.status} {e.reason}"
-        except Exception as e:
-            return f"予期せぬエラーが発生しました: {e}"
-
-    return f"最大リトライ回数({max_retries}回)に達しました。検索に失敗しました。"
+    return search_cache.get_or_fetch("google", query, lambda: _google_search_uncached(query, max_retries))
+
+
+def get_google_search_client() -> GoogleSearchClient:
+    """全Actorで共有するGoogle検索クライアントを返す（初回呼び出し時に生成）"""
+    global _google_client
+    with _google_client_lock:
+        if (
+            _google_client is None
+            or _google_client.api_key != config.google_api_key
+            or _google_client.cse_id != config.google_cse_id
+        ):
+            _google_client = GoogleSearchClient(
+                config.google_api_key, config.google_cse_id, config.google_search_requests_per_minute
+            )
+        return _google_client
+
+
+def _google_search_uncached(query: str, max_retries: int) -> tuple[str, bool]:
+    """Google Custom Searchで検索し、（結果, キャッシュ可否）を返す"""
+    try:
+        res = get_google_search_client().search(query, num=3, max_retries=max_retries)
+    except HttpError as e:
+        if e.resp.status in RETRYABLE_STATUSES:
+            return f"最大リトライ回数({max_retries}回)に達しました。検索に失敗しました。", False
+        # その他のクライアントエラー(4xx)はリトライしても無駄なので即時失敗させる
+        return f"Google API HTTPエラー（リトライ不可）: {e.resp.status} {e.reason}", False
+    except Exception as e:
+        return f"予期せぬエラーが発生しました: {e}", False
+
+    if "items" in res and res["items"]:
+        results = []
+        for item in res["items"]:
+            title = item.get("title", "N/A")
+            snippet = item.get("snippet", "N/A")
+            link = item.get("link", "N/A")
+            results.append(f"Title: {title}\nSnippet: {snippet}\nLink: {link}")
+        return "\n---\n".join(results), True
+    # 検索結果が0件の場合もキャッシュしてよい
+    return "検索結果が見つかりませんでした。", True
+
+
+def fetch_page(url: str) -> str:
+    """
+    Webページを取得して本文のテキストを返すツール。検索結果の概要だけでは足りない場合に、ページの内容を読むために使う。
+    複数のページを読む場合は、URLを空白か改行で区切って指定すると並行して取得する。
+    """
+    urls = list(dict.fromkeys(_strip_url(match) for match in _URL_PATTERN.findall(url)))
+    print(f"  [TOOL] fetch_page: URL={urls}")
+    if not urls:
+        return "エラー: http:// または https:// で始まるURLを指定してください。"
+    urls = urls[: max(1, config.page_fetch_max_urls)]
+    return "\n\n---\n\n".join(get_page_fetcher().fetch_many(urls))
+
+
+def _strip_url(url: str) -> str:
+    """URLの末尾に続いた句読点と、対応する開き括弧のない閉じ括弧を取り除く"""
+    url = url.rstrip(".,;:")
+    while url.endswith((")", "]")) and url.count(url[-1]) > url.count("(" if url[-1] == ")" else "["):
+        url = url[:-1].rstrip(".,;:")
+    return url
+
+
+def get_page_fetcher() -> PageFetcher:
+    """全Actorで共有するページ取得クライアントを返す（初回呼び出し時に生成）"""
+    global _page_fetcher
+    with _page_fetcher_lock:
+        if _page_fetcher is None:
+            _page_fetcher = PageFetcher(
+                timeout=config.page_fetch_timeout,
+                max_bytes=config.page_fetch_max_bytes,
+                max_chars=config.page_fetch_max_chars,
+                per_host=config.page_fetch_per_host,
+                max_workers=config.page_fetch_max_workers,
+                cache_ttl_seconds=config.page_cache_ttl_seconds,
+                cache_max_entries=config.page_cache_max_entries,
+            )
+        return _page_fetcher
 
 
 # Actorがタスク完了を宣言するための特別なツール
@@ -92,3 +165,56 @@ def reflect(reflection: str) -> str:
     """
     print(f"  [TOOL] reflect: 思考内容='{reflection}'")
     return f"思考内容を記録しました: '{reflection}'"
+
+
+def make_search_knowledge(index: KnowledgeIndex):
+    """
+    指定した知識インデックスを検索する search_knowledge ツールを返す（インデックスは実行ごとに異なるため、Actorの生成元で束縛する）
+
+    Args:
+        index: 検索対象の知識インデックス
+    """
+
+    def search_knowledge(query: str) -> str:
+        """
+        この実行で他のタスクが既に調べた情報（検索結果、進捗報告、完了したタスクの結果）を全文検索するツール。
+        Web検索より高速で検索回数も消費しないため、Web検索の前にまず使う。
+        """
+        print(f"  [TOOL] search_knowledge: クエリ='{query}'")
+        hits = index.search(query)
+        if not hits:
+            return "関連する情報は見つかりませんでした。必要に応じてWeb検索を使ってください。"
+        return "\n---\n".join(f"出所: {source}\n{text}" for source, text, _ in hits)
+
+    return search_knowledge
+
+
+def make_asearch_knowledge(index: KnowledgeIndex):
+    """make_search_knowledge の非同期実行モード用"""
+    return _to_async_tool(make_search_knowledge(index), offload=False)
+
+
+def _to_async_tool(func, offload: bool = True):
+    """
+    同期ツールを非同期ツールに変換する（docstringはツール説明として引き継ぐ）
+
+    Args:
+        func: 変換元の同期ツール
+        offload: ブロッキングI/Oを含むツールの場合はTrue（スレッドで実行してイベントループを止めない）
+    """
+
+    @functools.wraps(func)
+    async def async_tool(*args, **kwargs) -> str:
+        if offload:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    return async_tool
+
+
+# 非同期実行モード用のツール群
+aweb_search = _to_async_tool(web_search)
+agoogle_search = _to_async_tool(google_search)
+afetch_page = _to_async_tool(fetch_page)
+afinish = _to_async_tool(finish, offload=False)
+areflect = _to_async_tool(reflect, offload=False)
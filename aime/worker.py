@@ -0,0 +1,65 @@
+"""
+別ノードでActorを実行するワーカーの実行エントリーポイント
+SocketWorkerBackend で待ち受けているコーディネーターに接続し、割り当てられたジョブを実行する
+
+実行例:
+    python -m aime.worker --connect 192.168.0.10:7070 --slots 4
+"""
+
+import argparse
+import os
+import socket
+import threading
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from aime.config import config
+from aime.worker_runtime import decode_message, encode_message, serve
+
+
+def connect(host: str, port: int, slots: int, token: str = None):
+    """
+    SocketWorkerBackend に接続し、切断されるかshutdownを受け取るまでジョブを実行する
+
+    Args:
+        host: コーディネーターのホスト
+        port: コーディネーターのポート
+        slots: 同時に実行するジョブ数
+        token: 認証トークン（コーディネーターの worker_auth_token と同じ値）
+    """
+    with socket.create_connection((host, port)) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile("r", encoding="utf-8")
+        send_lock = threading.Lock()
+
+        def receive() -> Optional[Dict[str, Any]]:
+            line = reader.readline()
+            return decode_message(line) if line else None
+
+        def send(message: Dict[str, Any]):
+            data = (encode_message(message) + "\n").encode("utf-8")
+            with send_lock:
+                sock.sendall(data)
+
+        print(f"--- ワーカー: {host}:{port} に接続しました (同時実行数: {slots}) ---")
+        serve(receive, send, slots, token)
+    print("--- ワーカー: コーディネーターとの接続を終了しました ---")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コーディネーターに接続してActorを実行するワーカー")
+    parser.add_argument("--connect", required=True, metavar="HOST:PORT", help="コーディネーターのアドレス")
+    parser.add_argument("--slots", type=int, default=config.actor_worker_slots, help="同時に実行するジョブ数")
+    parser.add_argument("--token", default=os.getenv("AIME_WORKER_TOKEN"), help="認証トークン（既定は環境変数 AIME_WORKER_TOKEN）")
+    args = parser.parse_args()
+
+    # .envファイルから環境変数を読み込む
+    load_dotenv()
+
+    host, _, port = args.connect.rpartition(":")
+    connect(host, int(port), args.slots, args.token)
+
+
+if __name__ == "__main__":
+    main()
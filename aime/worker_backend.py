@@ -0,0 +1,438 @@
+"""
+Actorを別プロセス・別ノードで実行するワーカーバックエンド
+プランナーが作ったジョブ（タスク・ペルソナ・前提知識）をワーカーに割り当て、結果をFutureで返す。
+ワーカーの死活を監視し、応答しなくなったワーカーが実行中だったジョブは別のワーカーに再投入する。
+ワーカー側の処理とメッセージの形式は aime.worker_runtime を参照。
+"""
+
+import contextlib
+import itertools
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from aime import worker_runtime
+from aime.config import config
+
+
+class WorkerLostError(RuntimeError):
+    """ジョブを実行していたワーカーが、再投入の上限まで続けて失われた"""
+
+
+@dataclass
+class _Job:
+    job_id: str
+    payload: Dict[str, Any]
+    future: Future
+    on_log: Optional[Callable[[int, str], None]]
+    attempts: int = 0
+    worker_id: Optional[str] = None  # 実行中のワーカー（待機中はNone）
+
+
+@dataclass
+class _WorkerState:
+    worker_id: str
+    slots: int
+    last_seen: float
+    jobs: Set[str] = field(default_factory=set)
+    description: str = ""
+
+
+class WorkerBackend:
+    """
+    ジョブの割り当て・ワーカーの死活監視・再投入を行う共通部分。
+    ワーカーとの通信路（キューやソケット）は派生クラスが _send() と _disconnect() で実装する。
+    """
+
+    def __init__(self, heartbeat_timeout: float = None, max_attempts: int = None):
+        """
+        Args:
+            heartbeat_timeout: この秒数メッセージが届かないワーカーを失われたとみなす（Noneの場合はconfig値）
+            max_attempts: 1件のジョブを実行するワーカーの数の上限（Noneの場合はconfig値）
+        """
+        self.heartbeat_timeout = heartbeat_timeout or config.worker_timeout
+        self.max_attempts = max_attempts or config.worker_job_max_attempts
+        self._lock = threading.Lock()
+        self._workers: Dict[str, _WorkerState] = {}
+        self._jobs: Dict[str, _Job] = {}
+        self._pending: Deque[str] = deque()
+        self._job_ids = itertools.count()
+        self._closed = threading.Event()
+        self._monitor = threading.Thread(target=self._monitor_loop, name="worker-monitor", daemon=True)
+        self._monitor.start()
+
+    def submit(self, payload: Dict[str, Any], on_log: Callable[[int, str], None] = None) -> Future:
+        """
+        ジョブを投入する
+
+        Args:
+            payload: JSONに変換できるジョブの内容（task, persona, knowledge）
+            on_log: ワーカーから進捗ログが届いたときに (task_id, message) で呼ぶ関数
+
+        Returns:
+            Actorの報告（文字列）で完了するFuture
+        """
+        future = Future()
+        with self._lock:
+            if self._closed.is_set():
+                raise RuntimeError("ワーカーバックエンドは終了しています。")
+            job_id = str(next(self._job_ids))
+            self._jobs[job_id] = _Job(job_id, payload, future, on_log)
+            self._pending.append(job_id)
+        self._assign()
+        return future
+
+    def _assign(self):
+        """待機中のジョブを、空きのあるワーカーに割り当てる"""
+        assignments = []
+        with self._lock:
+            for state in self._workers.values():
+                while self._pending and len(state.jobs) < state.slots:
+                    job = self._jobs[self._pending.popleft()]
+                    job.worker_id = state.worker_id
+                    job.attempts += 1
+                    state.jobs.add(job.job_id)
+                    assignments.append((state.worker_id, {"type": "job", "job_id": job.job_id, **job.payload}))
+        for worker_id, message in assignments:
+            try:
+                self._send(worker_id, message)
+            except OSError as e:
+                self._worker_lost(worker_id, f"送信に失敗しました: {e}")
+
+    def _register(self, worker_id: str, slots: int, description: str):
+        with self._lock:
+            self._workers[worker_id] = _WorkerState(worker_id, max(1, slots), time.monotonic(), description=description)
+        print(f"--- ワーカー {worker_id} が参加しました ({description}, 同時実行数: {slots}) ---")
+        try:
+            self._send(worker_id, {"type": "config", "values": worker_runtime.config_snapshot()})
+        except OSError as e:
+            self._worker_lost(worker_id, f"送信に失敗しました: {e}")
+            return
+        self._assign()
+
+    def _handle_message(self, worker_id: str, message: Dict[str, Any]):
+        """ワーカーから届いたメッセージ（hello以外）を処理する"""
+        with self._lock:
+            state = self._workers.get(worker_id)
+            if state is None:
+                return
+            state.last_seen = time.monotonic()
+            job = self._jobs.get(message.get("job_id"))
+            # 失われたとみなしたワーカーから遅れて届いたメッセージは、再投入先の実行と重複するため捨てる
+            if job is not None and job.worker_id != worker_id:
+                job = None
+            if message["type"] == "result" and job is not None:
+                del self._jobs[job.job_id]
+                state.jobs.discard(job.job_id)
+
+        if job is None:
+            return
+        if message["type"] == "log":
+            if job.on_log is not None:
+                job.on_log(message["task_id"], message["message"])
+        elif message["type"] == "result":
+            if "error" in message:
+                job.future.set_exception(RuntimeError(f"ワーカー {worker_id} でのActorの実行に失敗しました: {message['error']}"))
+            else:
+                job.future.set_result(message["result"])
+            self._assign()
+
+    def _worker_lost(self, worker_id: str, reason: str):
+        """ワーカーを切り離し、実行中だったジョブを待機列の先頭に戻す（上限に達したジョブは失敗させる）"""
+        failed: List[_Job] = []
+        with self._lock:
+            state = self._workers.pop(worker_id, None)
+            closed = self._closed.is_set()
+            if state is not None and not closed:
+                for job_id in sorted(state.jobs, key=int, reverse=True):
+                    job = self._jobs[job_id]
+                    job.worker_id = None
+                    if job.attempts >= self.max_attempts:
+                        del self._jobs[job_id]
+                        failed.append(job)
+                    else:
+                        self._pending.appendleft(job_id)
+        if state is None:
+            return
+        if closed:
+            # 終了処理中の切断は想定どおりのため、通信路を閉じるだけにする
+            self._disconnect(worker_id)
+            return
+        if state.jobs:
+            print(f"[WARN] ワーカー {worker_id} が失われました ({reason})。実行中だった{len(state.jobs)}件のジョブを再投入します。")
+        else:
+            print(f"[WARN] ワーカー {worker_id} が失われました ({reason})。")
+        for job in failed:
+            job.future.set_exception(
+                WorkerLostError(f"ジョブを実行したワーカーが{job.attempts}回続けて失われました (最後の理由: {reason})")
+            )
+        self._disconnect(worker_id)
+        self._assign()
+
+    def _monitor_loop(self):
+        while not self._closed.wait(min(1.0, self.heartbeat_timeout / 4)):
+            now = time.monotonic()
+            with self._lock:
+                silent = [w for w, state in self._workers.items() if now - state.last_seen > self.heartbeat_timeout]
+            for worker_id in silent:
+                self._worker_lost(worker_id, f"{self.heartbeat_timeout:.0f}秒間応答がありません")
+            self._check_workers()
+
+    def shutdown(self):
+        """全ワーカーに終了を指示し、未完了のジョブを失敗させる"""
+        with self._lock:
+            self._closed.set()
+            worker_ids = list(self._workers)
+            unfinished = list(self._jobs.values())
+            self._jobs.clear()
+            self._pending.clear()
+        for worker_id in worker_ids:
+            with contextlib.suppress(OSError):
+                self._send(worker_id, {"type": "shutdown"})
+        for job in unfinished:
+            job.future.set_exception(WorkerLostError("ワーカーバックエンドが終了しました。"))
+        self._monitor.join(timeout=5)
+        self._close()
+
+    # --- 派生クラスで実装する通信路 ---
+
+    def _send(self, worker_id: str, message: Dict[str, Any]):
+        raise NotImplementedError
+
+    def _disconnect(self, worker_id: str):
+        """失われたワーカーとの通信路を閉じる（プロセスの場合は終了させる）"""
+
+    def _check_workers(self):
+        """監視スレッドから定期的に呼ばれる（プロセスの終了検知と補充など）"""
+
+    def _close(self):
+        """shutdown() の最後に呼ばれ、通信路とワーカーを片付ける"""
+
+
+class ProcessWorkerBackend(WorkerBackend):
+    """
+    ローカルのワーカープロセスでActorを実行する（GILとプロセスのメモリの制約を受けずにActorを並列化する）。
+    ワーカーごとの受信キューと送信用のパイプで通信する。終了したプロセスは補充する。
+    送信側を全ワーカーで共有すると、書き込み中に強制終了されたワーカーが共有のロックを保持したままになり、
+    他のワーカーが送信できなくなるため、パイプはワーカーごとに分ける。
+    """
+
+    def __init__(self, processes: int = None, slots: int = None, initializer: Callable[[], None] = None, **kwargs):
+        """
+        Args:
+            processes: ワーカープロセス数（Noneの場合はconfig値）
+            slots: 1プロセスあたりの同時実行ジョブ数（Noneの場合はconfig値）
+            initializer: 各ワーカープロセスの起動時に呼ぶ、pickle可能な関数
+        """
+        self.processes = processes or config.actor_worker_processes
+        self.slots = slots or config.actor_worker_slots
+        self.initializer = initializer
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: Dict[str, Any] = {}
+        self._inboxes: Dict[str, Any] = {}
+        self._readers: List[threading.Thread] = []
+        self._process_ids = itertools.count()
+        super().__init__(**kwargs)
+        for _ in range(self.processes):
+            self._spawn()
+
+    def _spawn(self):
+        worker_id = f"process-{next(self._process_ids)}"
+        inbox = self._context.Queue()
+        events, events_writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=worker_runtime.process_main,
+            args=(worker_id, inbox, events_writer, self.slots, self.initializer),
+            name=f"aime-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        # 書き込み側はワーカーだけが持つ（ワーカーが終了すると読み込み側がEOFになる）
+        events_writer.close()
+        with self._lock:
+            self._processes[worker_id] = process
+            self._inboxes[worker_id] = inbox
+        reader = threading.Thread(target=self._read_events, args=(worker_id, events), name=f"worker-events-{worker_id}", daemon=True)
+        reader.start()
+        self._readers.append(reader)
+
+    def _read_events(self, worker_id: str, events):
+        """ワーカー1つ分のメッセージを受け取る（プロセスの終了は _check_workers() で検知する）"""
+        with events:
+            while True:
+                try:
+                    line = events.recv_bytes().decode("utf-8")
+                except (EOFError, OSError):
+                    return
+                self._dispatch_event(worker_id, worker_runtime.decode_message(line))
+
+    def _dispatch_event(self, worker_id: str, message: Dict[str, Any]):
+        if message["type"] == "hello":
+            process = self._processes.get(worker_id)
+            if process is not None and process.is_alive():
+                self._register(worker_id, message["slots"], f"pid {message['pid']}")
+        else:
+            self._handle_message(worker_id, message)
+
+    def _send(self, worker_id: str, message: Dict[str, Any]):
+        inbox = self._inboxes.get(worker_id)
+        if inbox is None:
+            raise OSError(f"ワーカー {worker_id} は終了しています。")
+        inbox.put(worker_runtime.encode_message(message))
+
+    def _disconnect(self, worker_id: str):
+        with self._lock:
+            process = self._processes.pop(worker_id, None)
+            self._inboxes.pop(worker_id, None)
+        if process is not None and process.is_alive():
+            process.terminate()
+
+    def _check_workers(self):
+        with self._lock:
+            exited = {w: process.exitcode for w, process in self._processes.items() if not process.is_alive()}
+        for worker_id, exitcode in exited.items():
+            self._worker_lost(worker_id, f"プロセスが終了しました (終了コード {exitcode})")
+            self._disconnect(worker_id)
+        # 終了したプロセスと、応答がなく停止させたプロセスの分を補充する
+        while not self._closed.is_set() and len(self._processes) < self.processes:
+            self._spawn()
+
+    def _close(self):
+        with self._lock:
+            processes = list(self._processes.values())
+            inboxes = list(self._inboxes.values())
+            self._processes.clear()
+            self._inboxes.clear()
+        for inbox in inboxes:
+            inbox.put(None)
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for reader in self._readers:
+            reader.join(timeout=5)
+
+
+class SocketWorkerBackend(WorkerBackend):
+    """
+    TCPで接続してきたワーカー（python -m aime.worker --connect HOST:PORT）でActorを実行する。
+    別ノードのワーカーを使えるほか、local_workers を指定するとローカルにワーカープロセスを起動する。
+    """
+
+    def __init__(self, host: str = None, port: int = None, local_workers: int = None, slots: int = None, token: str = None, **kwargs):
+        """
+        Args:
+            host: 待ち受けるアドレス（Noneの場合はconfig値）
+            port: 待ち受けるポート（0の場合は空いているポートを使う）
+            local_workers: ローカルに起動するワーカープロセス数（0の場合は外部のワーカーの接続だけを待つ）
+            slots: ローカルのワーカー1つあたりの同時実行ジョブ数
+            token: ワーカーの認証トークン（Noneの場合はconfig値。設定されていれば一致しないワーカーを拒否する）
+        """
+        self.token = token or config.worker_auth_token
+        self._server = socket.create_server((host or config.worker_host, config.worker_port if port is None else port))
+        self.address = self._server.getsockname()[:2]
+        self._connections: Dict[str, socket.socket] = {}
+        self._send_locks: Dict[str, threading.Lock] = {}
+        self._connection_ids = itertools.count()
+        self._local_processes: List[subprocess.Popen] = []
+        super().__init__(**kwargs)
+        threading.Thread(target=self._accept_loop, name="worker-accept", daemon=True).start()
+        print(f"--- ワーカーの接続を {self.address[0]}:{self.address[1]} で待ち受けます ---")
+
+        local_workers = config.actor_worker_processes if local_workers is None else local_workers
+        for _ in range(local_workers):
+            self._local_processes.append(self._start_local_worker(slots or config.actor_worker_slots))
+
+    def _start_local_worker(self, slots: int) -> subprocess.Popen:
+        env = {**os.environ, **({"AIME_WORKER_TOKEN": self.token} if self.token else {})}
+        return subprocess.Popen(
+            [sys.executable, "-m", "aime.worker", "--connect", f"{self.address[0]}:{self.address[1]}", "--slots", str(slots)],
+            env=env,
+        )
+
+    def _accept_loop(self):
+        while not self._closed.is_set():
+            try:
+                conn, peer = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_connection, args=(conn, peer), name="worker-conn", daemon=True).start()
+
+    def _serve_connection(self, conn: socket.socket, peer):
+        worker_id = f"{peer[0]}:{peer[1]}#{next(self._connection_ids)}"
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = conn.makefile("r", encoding="utf-8")
+        try:
+            hello = worker_runtime.decode_message(reader.readline() or "null")
+            if not hello or hello.get("type") != "hello" or (self.token and hello.get("token") != self.token):
+                print(f"[WARN] {peer[0]}:{peer[1]} からの接続を拒否しました（helloがないか、認証トークンが一致しません）。")
+                conn.close()
+                return
+            with self._lock:
+                self._connections[worker_id] = conn
+                self._send_locks[worker_id] = threading.Lock()
+            self._register(worker_id, int(hello.get("slots", 1)), f"{hello.get('host')} pid {hello.get('pid')}")
+            for line in reader:
+                self._handle_message(worker_id, worker_runtime.decode_message(line))
+        except (OSError, ValueError) as e:
+            self._worker_lost(worker_id, f"接続エラー: {e}")
+            return
+        self._worker_lost(worker_id, "接続が切断されました")
+
+    def _send(self, worker_id: str, message: Dict[str, Any]):
+        with self._lock:
+            conn, send_lock = self._connections.get(worker_id), self._send_locks.get(worker_id)
+        if conn is None:
+            raise OSError(f"ワーカー {worker_id} は切断されています。")
+        data = (worker_runtime.encode_message(message) + "\n").encode("utf-8")
+        with send_lock:
+            conn.sendall(data)
+
+    def _disconnect(self, worker_id: str):
+        with self._lock:
+            conn = self._connections.pop(worker_id, None)
+            self._send_locks.pop(worker_id, None)
+        if conn is not None:
+            with contextlib.suppress(OSError):
+                conn.shutdown(socket.SHUT_RDWR)
+            conn.close()
+
+    def _close(self):
+        # 待ち受け中のaccept()を抜けさせてからソケットを閉じる
+        with contextlib.suppress(OSError):
+            self._server.shutdown(socket.SHUT_RDWR)
+        self._server.close()
+        for process in self._local_processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+        with self._lock:
+            worker_ids = list(self._connections)
+        for worker_id in worker_ids:
+            self._disconnect(worker_id)
+
+
+def create_worker_backend(kind: str = None) -> Optional[WorkerBackend]:
+    """
+    設定に応じたワーカーバックエンドを作成する
+
+    Args:
+        kind: "thread"（バックエンドを使わずプランナーのスレッドで実行） / "process" / "socket"（Noneの場合はconfig値）
+    """
+    kind = kind or config.actor_backend
+    if kind == "thread":
+        return None
+    if kind == "process":
+        return ProcessWorkerBackend()
+    if kind == "socket":
+        return SocketWorkerBackend()
+    raise ValueError(f"不明なActorの実行バックエンドです: {kind}")
@@ -0,0 +1,158 @@
+"""
+ワーカー側の処理とメッセージの形式
+コーディネーター（worker_backend）から受け取ったジョブでActorを実行し、進捗ログと結果を送り返す。
+
+メッセージは1件1行のJSON（ソケットでは改行区切り、multiprocessingではキューの1要素）で、次の種類がある。
+    ワーカー → コーディネーター: hello / heartbeat / log / result
+    コーディネーター → ワーカー: config / job / shutdown
+"""
+
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import fields
+from typing import Any, Callable, Dict, Optional
+
+from aime.actor import DynamicActor
+from aime.config import config
+from aime.factory import BASE_TOOLS
+from aime.knowledge_index import KnowledgeIndex
+from aime.tools import make_search_knowledge
+
+
+def _is_secret_field(name: str) -> bool:
+    """設定のスナップショットに含めない項目か（APIキーなどの秘密情報は各ワーカーの環境変数から読む）"""
+    return name.endswith(("_key", "_auth_token")) or "secret" in name
+
+
+def encode_message(message: Dict[str, Any]) -> str:
+    return json.dumps(message, ensure_ascii=False)
+
+
+def decode_message(line: str) -> Dict[str, Any]:
+    return json.loads(line)
+
+
+def config_snapshot() -> Dict[str, Any]:
+    """ワーカーに送る設定（秘密情報を除く）"""
+    return {
+        f.name: getattr(config, f.name)
+        for f in fields(config)
+        if not _is_secret_field(f.name)
+    }
+
+
+def apply_config(values: Dict[str, Any]):
+    """コーディネーターから受け取った設定を反映する"""
+    known = {f.name for f in fields(config)}
+    for name, value in values.items():
+        if name in known:
+            setattr(config, name, value)
+
+
+class _LogForwarder:
+    """Actorの update_progress をコーディネーターの進捗管理モジュールに転送する（add_task_logだけを持つ代替）"""
+
+    def __init__(self, job_id: str, send: Callable[[Dict[str, Any]], None]):
+        self.job_id = job_id
+        self.send = send
+
+    def add_task_log(self, task_id: int, message: str):
+        self.send({"type": "log", "job_id": self.job_id, "task_id": task_id, "message": message})
+
+
+def execute_job(job: Dict[str, Any], send: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """
+    ジョブ1件分のActorを実行し、結果のメッセージを返す
+
+    Args:
+        job: コーディネーターから受け取った job メッセージ（task, persona, knowledge, knowledge_hits を含む）
+        send: 進捗ログをコーディネーターに送る関数
+    """
+    try:
+        # コーディネーターの知識インデックスから送られた段落と、このジョブの観察結果だけを検索対象にする
+        index = KnowledgeIndex(run_label=job.get("run_label"))
+        for source, text in job.get("knowledge_hits", []):
+            index.add(source, text, persist=False)
+        actor = DynamicActor(
+            subtask=job["task"],
+            persona=job["persona"],
+            knowledge=job["knowledge"],
+            tools={**BASE_TOOLS, "search_knowledge": make_search_knowledge(index)},
+            progress_manager=_LogForwarder(job["job_id"], send),
+            knowledge_index=index,
+        )
+        return {"type": "result", "job_id": job["job_id"], "result": actor.run()}
+    except Exception as e:
+        return {"type": "result", "job_id": job["job_id"], "error": f"{type(e).__name__}: {e}"}
+
+
+def serve(receive: Callable[[], Optional[Dict[str, Any]]], send: Callable[[Dict[str, Any]], None], slots: int, token: str = None):
+    """
+    ワーカーのメインループ。ジョブを最大 slots 件まで並行に実行する
+
+    Args:
+        receive: 次のメッセージを受け取る関数（接続が切れた場合はNone）
+        send: メッセージを送る関数（複数のスレッドから呼ばれる）
+        slots: 同時に実行するジョブ数
+        token: コーディネーターの認証トークン
+    """
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(config.worker_heartbeat_interval):
+            try:
+                send({"type": "heartbeat"})
+            except OSError:
+                return
+
+    def run_job(job: Dict[str, Any]):
+        result = execute_job(job, send)
+        try:
+            send(result)
+        except OSError as e:
+            print(f"[WARN] ジョブ {job['job_id']} の結果を送信できませんでした: {e}")
+
+    send({"type": "hello", "slots": slots, "pid": os.getpid(), "host": socket.gethostname(), "token": token})
+    threading.Thread(target=heartbeat, name="worker-heartbeat", daemon=True).start()
+    with ThreadPoolExecutor(max_workers=slots, thread_name_prefix="worker-job") as executor:
+        try:
+            while (message := receive()) is not None:
+                if message["type"] == "config":
+                    apply_config(message["values"])
+                elif message["type"] == "job":
+                    executor.submit(run_job, message)
+                elif message["type"] == "shutdown":
+                    break
+        finally:
+            stopped.set()
+
+
+def process_main(worker_id: str, inbox, events, slots: int, initializer: Callable[[], None] = None):
+    """
+    ProcessWorkerBackend が起動するワーカープロセスの入口
+
+    Args:
+        worker_id: コーディネーターが割り当てたワーカーID
+        inbox: このワーカー宛てのメッセージのキュー
+        events: コーディネーター宛てのメッセージを送るパイプの書き込み側（このワーカー専用）
+        slots: 同時に実行するジョブ数
+        initializer: ジョブを受け付ける前に呼ぶ関数（ProcessPoolExecutor の initializer と同じく、pickle可能な関数）
+    """
+    if initializer is not None:
+        initializer()
+
+    def receive() -> Optional[Dict[str, Any]]:
+        line = inbox.get()
+        return decode_message(line) if line is not None else None
+
+    send_lock = threading.Lock()
+
+    def send(message: Dict[str, Any]):
+        data = encode_message(message).encode("utf-8")
+        with send_lock:
+            events.send_bytes(data)
+
+    serve(receive, send, slots)
@@ -0,0 +1,3 @@
+"""
+Aimeフレームワークのオフラインベンチマーク（ネットワーク不要）
+"""
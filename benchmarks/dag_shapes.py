@@ -0,0 +1,99 @@
+"""
+ベンチマーク用のタスクDAGの生成
+"""
+
+import random
+from typing import Dict, List, Set, Tuple
+
+
+def _task(task_id: int, dependencies: List[int]) -> Dict:
+    return {"id": task_id, "description": f"ベンチマークタスク #{task_id}", "dependencies": dependencies}
+
+
+def wide(size: int) -> List[Dict]:
+    """依存関係のない size 個のタスク（並列度が最大）"""
+    return [_task(i, []) for i in range(size)]
+
+
+def deep(size: int) -> List[Dict]:
+    """size 個のタスクが一直線に依存する鎖（並列度1）"""
+    return [_task(i, [i - 1] if i else []) for i in range(size)]
+
+
+def diamond(size: int, width: int = 4) -> List[Dict]:
+    """
+    幅 width の層を、合流用の1タスクを挟んで繰り返すダイヤモンド型（分岐と合流の繰り返し）
+    """
+    tasks, previous_join = [], None
+    while len(tasks) < size:
+        layer = []
+        for _ in range(min(width, size - len(tasks))):
+            task_id = len(tasks)
+            tasks.append(_task(task_id, [previous_join] if previous_join is not None else []))
+            layer.append(task_id)
+        if len(tasks) >= size:
+            break
+        previous_join = len(tasks)
+        tasks.append(_task(previous_join, layer))
+    return tasks
+
+
+def skewed(size: int, chain_fraction: float = 0.25) -> List[Dict]:
+    """
+    独立したタスクが計画の先頭に並び、その後に長い依存の鎖が続く形状
+    （計画順に実行すると鎖の開始が遅れ、全体の完了時間が延びる）
+    """
+    chain = max(1, int(size * chain_fraction))
+    leaves = size - chain
+    return [_task(i, []) for i in range(leaves)] + [_task(leaves + i, [leaves + i - 1] if i else []) for i in range(chain)]
+
+
+def random_dag(size: int, max_deps: int = 3, seed: int = 0) -> List[Dict]:
+    """各タスクが前のタスクから最大 max_deps 個を依存先に選ぶランダムなDAG"""
+    rng = random.Random(seed)
+    return [_task(i, sorted(rng.sample(range(i), min(i, rng.randint(0, max_deps))))) for i in range(size)]
+
+
+def failure_heavy(size: int, failure_rate: float = 0.2, seed: int = 0) -> Tuple[List[Dict], Set[int]]:
+    """ランダムなDAGのうち failure_rate の割合のタスクが初回に失敗し、再計画が発生する"""
+    tasks = random_dag(size, seed=seed)
+    rng = random.Random(seed + 1)
+    fail_ids = {task["id"] for task in tasks if rng.random() < failure_rate}
+    return tasks, fail_ids
+
+
+def build(shape: str, size: int, seed: int = 0) -> Tuple[List[Dict], Set[int]]:
+    """
+    指定した形状のDAGと、初回に失敗させるタスクIDの集合を返す
+
+    Args:
+        shape: "wide" / "deep" / "diamond" / "skewed" / "random" / "failure_heavy"
+        size: タスク数
+        seed: 乱数シード
+    """
+    if shape == "failure_heavy":
+        return failure_heavy(size, seed=seed)
+    builders = {
+        "wide": wide,
+        "deep": deep,
+        "diamond": diamond,
+        "skewed": skewed,
+        "random": lambda n: random_dag(n, seed=seed),
+    }
+    if shape not in builders:
+        raise ValueError(f"不明なDAGの形状です: {shape}")
+    return builders[shape](size), set()
+
+
+def critical_path(tasks: List[Dict], durations: Dict[int, float]) -> float:
+    """各タスクの実行時間から、DAGのクリティカルパスの長さ（並列度無制限での最短完了時間）を求める"""
+    finish: Dict[int, float] = {}
+    task_map = {task["id"]: task for task in tasks}
+
+    def finish_time(task_id: int) -> float:
+        if task_id not in finish:
+            deps = [dep for dep in task_map[task_id]["dependencies"] if dep in task_map]
+            finish[task_id] = max((finish_time(dep) for dep in deps), default=0.0) + durations.get(task_id, 0.0)
+        return finish[task_id]
+
+    return max((finish_time(task_id) for task_id in task_map), default=0.0)
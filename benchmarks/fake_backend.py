@@ -0,0 +1,167 @@
+"""
+ベンチマーク用のLLM・検索ツールの代替実装
+ネットワークに接続せず、指定した遅延分布で決定的な応答を返す
+"""
+
+import asyncio
+import contextlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+import litellm
+
+_TASK_PATTERN = re.compile(r"# タスク\n「(.*?)」", re.DOTALL)
+_FAILED_TASK_PATTERN = re.compile(r"タスク (\d+) が失敗しました")
+_PERSONA_INDEX_PATTERN = re.compile(r"^(\d+): 「", re.MULTILINE)
+
+
+class LatencyModel:
+    """
+    遅延の分布。"constant:0.05"、"uniform:0.02:0.08"、"lognormal:0.05:0.5"（平均, シグマ）の形式で指定する。
+    乱数はシードで固定し、同じ指定なら同じ遅延列を返す。
+    """
+
+    def __init__(self, spec: str, seed: int = 0):
+        kind, *params = spec.split(":")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        if kind not in ("constant", "uniform", "lognormal") or not self.params:
+            raise ValueError(f"不正な遅延分布の指定です: {spec}")
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "constant":
+                return self.params[0]
+            if self.kind == "uniform":
+                low, high = self.params[0], self.params[1] if len(self.params) > 1 else self.params[0] * 2
+                return self._rng.uniform(low, high)
+            mean, sigma = self.params[0], self.params[1] if len(self.params) > 1 else 0.5
+            # 平均が mean になるように対数正規分布の位置パラメータを決める
+            return self._rng.lognormvariate(math.log(mean) - sigma**2 / 2, sigma)
+
+
+def _response(content: str) -> litellm.ModelResponse:
+    return litellm.ModelResponse(
+        choices=[{"message": {"role": "assistant", "content": content}}],
+        usage={"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    )
+
+
+@dataclass
+class FakeBackend:
+    """
+    スクリプト化されたReAct応答を返す偽のLLMと検索ツール。
+
+    各タスクの Actor は search_turns 回検索した後に finish を呼ぶ。fail_ids のタスクは初回の実行で失敗を報告し、
+    再計画では同じIDのタスクを「(再試行)」付きの説明に置き換える差分を返す（再試行は成功する）。
+    """
+
+    tasks: List[Dict]
+    llm_latency: LatencyModel
+    tool_latency: LatencyModel
+    search_turns: int = 1
+    fail_ids: Set[int] = field(default_factory=set)
+    llm_calls: int = 0
+    tool_calls: int = 0
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+        self._turns: Dict[str, int] = {}
+
+    def _count(self, attr: str):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def _reply(self, kwargs) -> str:
+        """リクエストの内容から、対応する呼び出し元の応答を組み立てる"""
+        text = "\n".join(str(m.get("content") or "") for m in kwargs["messages"])
+        response_format = getattr(kwargs.get("response_format"), "__name__", "")
+
+        if response_format == "PersonaList":
+            indexes = _PERSONA_INDEX_PATTERN.findall(text)
+            return json.dumps({"personas": [{"index": int(i), "persona": "ベンチマーク用の専門家。"} for i in indexes]})
+        if response_format == "PlanDelta":
+            failed_id = int(_FAILED_TASK_PATTERN.search(text).group(1))
+            original = next(task for task in self.tasks if task["id"] == failed_id)
+            retry = {**original, "description": f"{original['description']} (再試行)"}
+            return json.dumps({"remove_ids": [], "upsert": [retry]}, ensure_ascii=False)
+        if response_format == "TasksList":
+            # タスク分解と計画全体の再生成には、失敗するタスクを再試行に置き換えた計画を返す
+            is_refine = "再計画の理由" in text
+            tasks = [
+                {**task, "description": f"{task['description']} (再試行)"}
+                if is_refine and task["id"] in self.fail_ids
+                else task
+                for task in self.tasks
+            ]
+            return json.dumps({"tasks": tasks}, ensure_ascii=False)
+        if "最終報告書" in text:
+            return "# ベンチマーク最終報告書"
+
+        match = _TASK_PATTERN.search(text)
+        description = match.group(1) if match else ""
+        with self._lock:
+            turn = self._turns.get(description, 0)
+            self._turns[description] = turn + 1
+        if turn < self.search_turns:
+            return f"思考: 情報を集める\n行動: web_search[{description} {turn}]"
+        task_id = int(re.search(r"#(\d+)", description).group(1)) if "#" in description else -1
+        if task_id in self.fail_ids and "(再試行)" not in description:
+            return '思考: 見つからない\n行動: finish[{"status": "failure", "message": "ベンチマーク用の失敗"}]'
+        return '思考: 完了\n行動: finish[{"status": "success", "message": "ベンチマーク用の成果物"}]'
+
+    def completion(self, **kwargs):
+        self._count("llm_calls")
+        time.sleep(self.llm_latency.sample())
+        return _response(self._reply(kwargs))
+
+    async def acompletion(self, **kwargs):
+        self._count("llm_calls")
+        await asyncio.sleep(self.llm_latency.sample())
+        return _response(self._reply(kwargs))
+
+    def search(self, query: str) -> str:
+        """
+        偽のWeb検索ツール。
+
+        Args:
+            query: 検索クエリ
+        """
+        self._count("tool_calls")
+        time.sleep(self.tool_latency.sample())
+        return f"「{query}」の検索結果（ベンチマーク用）"
+
+    async def asearch(self, query: str) -> str:
+        """
+        偽のWeb検索ツール。
+
+        Args:
+            query: 検索クエリ
+        """
+        self._count("tool_calls")
+        await asyncio.sleep(self.tool_latency.sample())
+        return f"「{query}」の検索結果（ベンチマーク用）"
+
+    @contextlib.contextmanager
+    def installed(self):
+        """litellmの呼び出しをこの偽実装に差し替える"""
+        original = litellm.completion, litellm.acompletion
+        litellm.completion, litellm.acompletion = self.completion, self.acompletion
+        try:
+            yield self
+        finally:
+            litellm.completion, litellm.acompletion = original
+
+    def install_tools(self, factory):
+        """ActorFactoryの検索ツールをこの偽実装に差し替える"""
+        factory.base_tools["web_search"] = self.search
+        factory.async_base_tools["web_search"] = self.asearch
@@ -0,0 +1,136 @@
+"""
+ベンチマーク用の計測器
+ロックの保持時間、スケジューラの待機時間、ワーカーの稼働時間を計測する
+"""
+
+import threading
+import time
+from typing import Dict, List, Tuple
+
+
+class InstrumentedRLock:
+    """
+    保持時間と取得待ち時間を記録するRLock。
+    再入した場合は、最も外側の取得から解放までを1回の保持として数える。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.total_hold = 0.0
+        self.max_hold = 0.0
+        self.total_wait = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        started = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            depth = getattr(self._local, "depth", 0)
+            if depth == 0:
+                now = time.perf_counter()
+                self._local.acquired_at = now
+                with self._stats_lock:
+                    self.total_wait += now - started
+            self._local.depth = depth + 1
+        return acquired
+
+    def release(self):
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            held = time.perf_counter() - self._local.acquired_at
+            with self._stats_lock:
+                self.acquisitions += 1
+                self.total_hold += held
+                self.max_hold = max(self.max_hold, held)
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            return {
+                "acquisitions": self.acquisitions,
+                "total_hold_ms": self.total_hold * 1000,
+                "max_hold_ms": self.max_hold * 1000,
+                "avg_hold_us": self.total_hold / self.acquisitions * 1e6 if self.acquisitions else 0.0,
+                "total_wait_ms": self.total_wait * 1000,
+            }
+
+
+class Timer:
+    """区間の所要時間を積算する（スケジューラがwaitでブロックしていた時間の計測などに使う）"""
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(time.perf_counter() - started)
+
+        return timed
+
+    def wrap_async(self, func):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add(time.perf_counter() - started)
+
+        return timed
+
+    def add(self, elapsed: float):
+        with self._lock:
+            self.total += elapsed
+            self.count += 1
+
+
+class BusyTracker:
+    """タスクごとのActor実行区間を記録し、稼働率とタスクの実行時間を求める"""
+
+    def __init__(self):
+        self.intervals: List[Tuple[int, float, float]] = []
+        self._lock = threading.Lock()
+
+    def record(self, task_id: int, started: float, finished: float):
+        with self._lock:
+            self.intervals.append((task_id, started, finished))
+
+    def wrap(self, func):
+        def tracked(task, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(task, *args, **kwargs)
+            finally:
+                self.record(task["id"], started, time.perf_counter())
+
+        return tracked
+
+    def wrap_async(self, func):
+        async def tracked(task, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(task, *args, **kwargs)
+            finally:
+                self.record(task["id"], started, time.perf_counter())
+
+        return tracked
+
+    @property
+    def busy_time(self) -> float:
+        return sum(finished - started for _, started, finished in self.intervals)
+
+    def durations(self) -> Dict[int, float]:
+        """タスクIDごとの（最後の実行の）所要時間"""
+        return {task_id: finished - started for task_id, started, finished in self.intervals}
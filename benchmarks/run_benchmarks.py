@@ -0,0 +1,230 @@
+"""
+オフラインベンチマーク
+偽のLLMと検索ツールで DynamicPlanner を実行し、フレームワーク自体のオーバーヘッドを計測する
+
+実行例:
+    python -m benchmarks.run_benchmarks --shapes wide,deep,diamond,failure_heavy --size 50 --workers 8
+    python -m benchmarks.run_benchmarks --mode async --llm-latency lognormal:0.05:0.5 --memory --json result.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from aime import planner as planner_module
+from aime.config import config
+from aime.planner import DynamicPlanner
+from benchmarks import dag_shapes
+from benchmarks.fake_backend import FakeBackend, LatencyModel
+from benchmarks.instrumentation import BusyTracker, InstrumentedRLock, Timer
+
+
+@contextlib.contextmanager
+def _isolated_run(overrides: Dict[str, Any]):
+    """一時ディレクトリで実行し（進捗・結果・ジャーナルのファイルを残さない）、設定の上書きを元に戻す"""
+    previous_cwd = os.getcwd()
+    previous = {key: getattr(config, key) for key in overrides}
+    with tempfile.TemporaryDirectory(prefix="aime-bench-") as workdir:
+        os.chdir(workdir)
+        for key, value in overrides.items():
+            setattr(config, key, value)
+        try:
+            yield workdir
+        finally:
+            for key, value in previous.items():
+                setattr(config, key, value)
+            os.chdir(previous_cwd)
+
+
+@contextlib.contextmanager
+def _patched(target, name: str, value):
+    original = getattr(target, name)
+    setattr(target, name, value)
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
+
+
+def run_scenario(
+    shape: str,
+    size: int,
+    mode: str = "thread",
+    workers: int = 8,
+    llm_latency: str = "constant:0.02",
+    tool_latency: str = "constant:0.01",
+    search_turns: int = 1,
+    seed: int = 0,
+    trace_memory: bool = False,
+    overrides: Dict[str, Any] = None,
+) -> Dict[str, Any]:
+    """
+    1つのシナリオを実行して計測値を返す
+
+    Args:
+        shape: DAGの形状（dag_shapes.build を参照）
+        size: タスク数
+        mode: "thread" または "async"
+        workers: 最大並列Actor数
+        llm_latency: LLM呼び出しの遅延分布（LatencyModel の形式）
+        tool_latency: 検索ツールの遅延分布
+        search_turns: 各Actorが finish までに行う検索の回数
+        seed: 乱数シード
+        trace_memory: tracemallocでピークメモリを計測するか（計測自体が遅いため、時間の計測とは分けて使う）
+        overrides: configの上書き（例: {"actor_prompt_mode": "multi_turn"}）
+    """
+    tasks, fail_ids = dag_shapes.build(shape, size, seed)
+    backend = FakeBackend(
+        tasks,
+        LatencyModel(llm_latency, seed),
+        LatencyModel(tool_latency, seed + 1),
+        search_turns=search_turns,
+        fail_ids=fail_ids,
+    )
+    settings = {"actor_history_compaction": "off", "llm_cache_enabled": False, **(overrides or {})}
+
+    with _isolated_run(settings), backend.installed():
+        planner = DynamicPlanner(max_parallel_actors=workers)
+        backend.install_tools(planner.factory)
+        lock = InstrumentedRLock()
+        planner.progress_manager._lock = lock
+
+        wait_timer, phase2_timer, busy = Timer(), Timer(), BusyTracker()
+        planner._execute_task_wrapper = busy.wrap(planner._execute_task_wrapper)
+        planner._aexecute_task_wrapper = busy.wrap_async(planner._aexecute_task_wrapper)
+        planner._dispatch_tasks = phase2_timer.wrap(planner._dispatch_tasks)
+        planner._adispatch_tasks = phase2_timer.wrap_async(planner._adispatch_tasks)
+
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with (
+            _patched(planner_module, "wait", wait_timer.wrap(planner_module.wait)),
+            _patched(asyncio, "wait", wait_timer.wrap_async(asyncio.wait)),
+            open(os.devnull, "w") as devnull,
+            contextlib.redirect_stdout(devnull),
+        ):
+            if mode == "async":
+                asyncio.run(planner.arun("ベンチマーク", max_concurrency=workers))
+            else:
+                planner.run("ベンチマーク")
+        makespan = time.perf_counter() - started
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        planner.factory.shutdown()
+
+        final_tasks = planner.progress_manager.tasks
+        policy = planner.progress_manager.priority_policy
+        phase2 = phase2_timer.total
+        busy_time = busy.busy_time
+        critical_path = dag_shapes.critical_path(final_tasks, busy.durations())
+        lower_bound = max(critical_path, busy_time / workers)
+
+    return {
+        "shape": shape,
+        "size": size,
+        "mode": mode,
+        "policy": policy,
+        "workers": workers,
+        "makespan_s": makespan,
+        "phase2_s": phase2,
+        # 実行ループがタスク完了を待たずに動いていた時間（ディスパッチ・結果処理・進捗更新のコスト）
+        "scheduler_overhead_ms": (phase2 - wait_timer.total) * 1000,
+        "overhead_per_task_us": (phase2 - wait_timer.total) / max(1, len(busy.intervals)) * 1e6,
+        "worker_utilization": busy_time / (workers * phase2) if phase2 else 0.0,
+        "critical_path_s": critical_path,
+        # 並列度とクリティカルパスから見た下限に対する実行ループの効率
+        "schedule_efficiency": lower_bound / phase2 if phase2 else 0.0,
+        "lock": lock.stats(),
+        "peak_memory_mb": peak_memory / 2**20 if peak_memory is not None else None,
+        "tasks_completed": sum(task["status"] == "completed" for task in final_tasks),
+        "actor_runs": len(busy.intervals),
+        "replans": len(planner.progress_manager.replan_history),
+        "llm_calls": backend.llm_calls,
+        "tool_calls": backend.tool_calls,
+    }
+
+
+def _print_table(results: List[Dict[str, Any]]):
+    header = (
+        f"{'shape':<14}{'mode':<7}{'policy':<14}{'tasks':>6}{'makespan':>10}{'sched.ovh':>11}{'ovh/task':>10}"
+        f"{'util':>7}{'effic':>7}{'lock hold':>11}{'lock max':>10}{'replans':>8}{'peak MB':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        memory = f"{r['peak_memory_mb']:.1f}" if r["peak_memory_mb"] is not None else "-"
+        print(
+            f"{r['shape']:<14}{r['mode']:<7}{r['policy']:<14}{r['size']:>6}{r['makespan_s']:>9.2f}s{r['scheduler_overhead_ms']:>9.1f}ms"
+            f"{r['overhead_per_task_us']:>8.0f}us{r['worker_utilization']:>7.0%}{r['schedule_efficiency']:>7.0%}"
+            f"{r['lock']['total_hold_ms']:>9.1f}ms{r['lock']['max_hold_ms']:>8.2f}ms{r['replans']:>8}{memory:>9}"
+        )
+
+
+def _parse_overrides(items: List[str]) -> Dict[str, Any]:
+    overrides = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        if not hasattr(config, key):
+            raise SystemExit(f"不明な設定項目です: {key}")
+        try:
+            overrides[key] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[key] = value
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="偽のLLMとツールでAimeのスケジューラのオーバーヘッドを計測する")
+    parser.add_argument("--shapes", default="wide,deep,diamond,failure_heavy", help="DAGの形状（カンマ区切り）")
+    parser.add_argument("--size", type=int, default=50, help="タスク数")
+    parser.add_argument("--workers", type=int, default=8, help="最大並列Actor数")
+    parser.add_argument("--mode", default="thread", choices=["thread", "async", "both"], help="実行モード")
+    parser.add_argument("--llm-latency", default="lognormal:0.02:0.5", help="LLMの遅延分布")
+    parser.add_argument("--tool-latency", default="uniform:0.005:0.02", help="検索ツールの遅延分布")
+    parser.add_argument("--search-turns", type=int, default=1, help="各Actorが finish までに行う検索の回数")
+    parser.add_argument("--repeat", type=int, default=1, help="各シナリオの繰り返し回数（シードを変えて実行）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="別の実行でtracemallocによるピークメモリも計測する")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="configの上書き（複数指定可）")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    overrides = _parse_overrides(args.set)
+    modes = ["thread", "async"] if args.mode == "both" else [args.mode]
+    results = []
+    for shape in args.shapes.split(","):
+        for mode in modes:
+            for i in range(args.repeat):
+                params = dict(
+                    shape=shape,
+                    size=args.size,
+                    mode=mode,
+                    workers=args.workers,
+                    llm_latency=args.llm_latency,
+                    tool_latency=args.tool_latency,
+                    search_turns=args.search_turns,
+                    seed=args.seed + i,
+                    overrides=overrides,
+                )
+                result = run_scenario(**params)
+                if args.memory:
+                    result["peak_memory_mb"] = run_scenario(**params, trace_memory=True)["peak_memory_mb"]
+                results.append(result)
+
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を {args.json} に保存しました。")
+
+
+if __name__ == "__main__":
+    main()
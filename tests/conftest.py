@@ -0,0 +1,35 @@
+"""
+テスト共通の設定
+LLMとWeb検索は呼び出さず、各テストで必要な部分だけをスタブに置き換える
+"""
+
+import os
+
+# litellmがimport時にモデルの価格表をネットワークから取得しないようにする
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+import pytest  # noqa: E402
+
+from aime.config import config  # noqa: E402
+from aime.metrics import metrics  # noqa: E402
+
+
+@pytest.fixture
+def aime_config(tmp_path, monkeypatch):
+    """出力先を一時ディレクトリに向け、LLMを呼び出す付随処理を止めた設定を返す（テスト終了時に元に戻る）"""
+    monkeypatch.chdir(tmp_path)
+    overrides = {
+        "runs_dir": str(tmp_path / "runs"),
+        "journal_enabled": False,
+        "metrics_enabled": False,
+        "progress_file_enabled": False,
+        "result_summary_enabled": False,
+        "prewarm_enabled": False,
+        "knowledge_index_path": None,
+        "llm_cache_enabled": False,
+        "actor_backend": "thread",
+    }
+    for name, value in overrides.items():
+        monkeypatch.setattr(config, name, value)
+    metrics.reset()
+    return config
@@ -0,0 +1,355 @@
+"""
+DynamicActor のテスト（LLMの応答はスタブに置き換える）
+"""
+
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from aime import actor as actor_module
+from aime.actor import NO_TOOL_CALL_OBSERVATION, DynamicActor, ReActStreamParser, ToolAction
+from aime.config import config
+from aime.llm_client import StreamResult, llm_client
+from aime.metrics import metrics
+from aime.progress_manager import ProgressManagementModule
+from aime.tools import finish
+
+
+def lookup(query: str) -> str:
+    """キーワードで情報を調べる"""
+    return f"{query} の調査結果"
+
+
+def tool_call(call_id: str, name: str, arguments: dict):
+    return SimpleNamespace(
+        id=call_id, type="function", function=SimpleNamespace(name=name, arguments=json.dumps(arguments))
+    )
+
+
+def response(content: str = None, tool_calls: list = None):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+
+class ScriptedLLM:
+    """あらかじめ決めた応答を順に返し、受け取ったメッセージを記録する"""
+
+    def __init__(self, responses: list):
+        self.responses = list(responses)
+        self.calls = []
+
+    def completion(self, messages, **kwargs):
+        self.calls.append({"messages": messages, **kwargs})
+        return self.responses.pop(0)
+
+    async def acompletion(self, messages, **kwargs):
+        return self.completion(messages, **kwargs)
+
+
+@pytest.fixture
+def function_actor(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "actor_tool_mode", "function")
+    monkeypatch.setattr(aime_config, "actor_max_turns", 3)
+
+    def build(responses: list):
+        llm = ScriptedLLM(responses)
+        monkeypatch.setattr(llm_client, "completion", llm.completion)
+        monkeypatch.setattr(llm_client, "acompletion", llm.acompletion)
+        progress_manager = ProgressManagementModule(write_to_file=False)
+        progress_manager.initialize_tasks([{"id": 0, "description": "東京のホテルを調べる", "dependencies": []}])
+        actor = DynamicActor(
+            subtask=progress_manager.tasks[0],
+            persona="旅行の専門家",
+            knowledge="",
+            tools={"finish": finish, "lookup": lookup},
+            progress_manager=progress_manager,
+        )
+        return actor, llm
+
+    return build
+
+
+FINISH_ARGS = {"status": "success", "message": "ホテルAが最安です。"}
+
+
+def test_text_reply_without_tool_call_is_not_treated_as_finish(function_actor):
+    actor, llm = function_actor(
+        [
+            response("ホテルAが最安だと思います。"),
+            response(tool_calls=[tool_call("call_1", "finish", FINISH_ARGS)]),
+        ]
+    )
+
+    result = actor.run()
+
+    assert json.loads(result) == FINISH_ARGS
+    assert actor.turns_used == 2
+    assert actor.history[0]["observation"] == NO_TOOL_CALL_OBSERVATION
+    assert actor.text_fallback_turns == 0
+    # 2回目の呼び出しには、ツールを呼び出すよう求める観察が含まれる
+    assert NO_TOOL_CALL_OBSERVATION in json.dumps(llm.calls[1]["messages"], ensure_ascii=False)
+
+
+@pytest.mark.asyncio
+async def test_async_text_reply_without_tool_call_is_not_treated_as_finish(function_actor):
+    actor, _ = function_actor(
+        [
+            response("まだ調べていません。"),
+            response(tool_calls=[tool_call("call_1", "lookup", {"query": "東京 ホテル"})]),
+            response(tool_calls=[tool_call("call_2", "finish", FINISH_ARGS)]),
+        ]
+    )
+
+    result = await actor.arun()
+
+    assert json.loads(result) == FINISH_ARGS
+    assert [turn["observation"] for turn in actor.history] == [NO_TOOL_CALL_OBSERVATION, "東京 ホテル の調査結果"]
+
+
+def test_text_reply_on_every_turn_reaches_max_turns(function_actor):
+    actor, _ = function_actor([response("わかりません。")] * 3)
+
+    result = actor.run()
+
+    assert result.startswith("最大ターン数に達したため")
+    assert len(actor.history) == 3
+
+
+def test_react_style_text_is_still_parsed_in_function_mode(function_actor):
+    actor, _ = function_actor([response(f"思考: 完了\n行動: finish[{json.dumps(FINISH_ARGS, ensure_ascii=False)}]")])
+
+    result = actor.run()
+
+    assert json.loads(result) == FINISH_ARGS
+    assert actor.text_fallback_turns == 1
+
+
+@pytest.fixture
+def react_actor(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "actor_tool_mode", "react")
+    monkeypatch.setattr(aime_config, "metrics_enabled", True)
+    monkeypatch.setattr(actor_module, "_turn_lengths", actor_module._TurnLengthEstimator())
+    progress_manager = ProgressManagementModule(write_to_file=False)
+    progress_manager.initialize_tasks([{"id": 0, "description": "東京のホテルを調べる", "dependencies": []}])
+    return DynamicActor(
+        subtask=progress_manager.tasks[0],
+        persona="旅行の専門家",
+        knowledge="",
+        tools={"finish": finish, "lookup": lookup},
+        progress_manager=progress_manager,
+    )
+
+
+def generation_tokens() -> dict:
+    return {
+        entry["labels"]["kind"]: entry["value"]
+        for entry in metrics.to_dict().get("aime_actor_generation_tokens_total", [])
+    }
+
+
+def test_full_response_counts_tail_as_wasted(react_actor):
+    parser = ReActStreamParser()
+    text = "思考: 調べる\n行動: lookup[東京 ホテル]\n観察: 架空の観察結果をモデルが書き続けた部分"
+    parser.feed(text)
+
+    react_actor._record_tail(parser)
+
+    tail_tokens = react_actor.context_budget.count_tokens(parser.tail().strip())
+    assert tail_tokens > 0
+    assert react_actor.wasted_tokens == tail_tokens
+    assert react_actor.avoided_tokens == 0
+    assert generation_tokens() == {"wasted": tail_tokens}
+    assert actor_module._turn_lengths.estimate() == react_actor.context_budget.count_tokens(text)
+
+
+def test_early_stop_counts_estimated_skipped_generation_as_avoided(react_actor, monkeypatch):
+    monkeypatch.setattr(config, "actor_typical_turn_tokens", 200)
+    parser = ReActStreamParser()
+    text = "思考: 調べる\n行動: lookup[東京 ホテル]"
+    parser.feed(text)
+    result = StreamResult(text, ttft=0.1, elapsed=0.2, early_stopped=True)
+
+    react_actor._record_stream(result, parser)
+
+    expected = 200 - react_actor.context_budget.count_tokens(text)
+    assert react_actor.avoided_tokens == expected
+    assert react_actor.wasted_tokens == 0
+    assert react_actor.stream_early_stops == 1
+    assert generation_tokens() == {"avoided": expected}
+
+    # 最後まで生成されたターンを計測した後は、その長さを目安にする
+    actor_module._turn_lengths.record(40)
+    react_actor._record_stream(result, parser)
+    assert react_actor.avoided_tokens == expected + max(0, 40 - react_actor.context_budget.count_tokens(text))
+
+
+class ParallelTools:
+    """1ターン内の複数ツールの同時実行を確かめるツール群（呼び出しの開始・終了を記録する）"""
+
+    def __init__(self, parties: int):
+        # 全ての呼び出しが同時に実行中にならない限り、待ち合わせがタイムアウトする
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.finished = []
+        self._lock = threading.Lock()
+
+    def _done(self, name: str, query: str) -> str:
+        with self._lock:
+            self.finished.append(query)
+        return f"{name}: {query} の結果"
+
+    def slow(self, query: str) -> str:
+        self.barrier.wait()
+        time.sleep(0.1)
+        return self._done("slow", query)
+
+    def fast(self, query: str) -> str:
+        self.barrier.wait()
+        return self._done("fast", query)
+
+    def broken(self, query: str) -> str:
+        self.barrier.wait()
+        raise RuntimeError(f"{query} の取得に失敗")
+
+    async def aslow(self, query: str) -> str:
+        await asyncio.to_thread(self.barrier.wait)
+        await asyncio.sleep(0.1)
+        return self._done("slow", query)
+
+
+@pytest.fixture
+def parallel_actor(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "actor_max_tools_per_turn", 4)
+
+    def build(tools: ParallelTools, async_slow: bool = False) -> DynamicActor:
+        progress_manager = ProgressManagementModule(write_to_file=False)
+        progress_manager.initialize_tasks([{"id": 0, "description": "東京のホテルを調べる", "dependencies": []}])
+        return DynamicActor(
+            subtask=progress_manager.tasks[0],
+            persona="旅行の専門家",
+            knowledge="",
+            tools={
+                "finish": finish,
+                "slow": tools.aslow if async_slow else tools.slow,
+                "fast": tools.fast,
+                "broken": tools.broken,
+            },
+            progress_manager=progress_manager,
+        )
+
+    return build
+
+
+PARALLEL_ACTIONS = [ToolAction("slow", "ホテルA"), ToolAction("broken", "ホテルB"), ToolAction("fast", "ホテルC")]
+EXPECTED_OBSERVATIONS = ["slow: ホテルA の結果", "ツール実行中にエラーが発生しました: ホテルB の取得に失敗", "fast: ホテルC の結果"]
+
+
+def test_parallel_actions_run_concurrently_and_keep_action_order(parallel_actor):
+    tools = ParallelTools(parties=3)
+    actor = parallel_actor(tools)
+
+    observations = actor._run_actions(PARALLEL_ACTIONS)
+
+    # 3つのツールが同時に実行中になり（待ち合わせが成立し）、遅いツールが後に終わっても観察は行動の順に並ぶ
+    assert observations == EXPECTED_OBSERVATIONS
+    assert tools.finished == ["ホテルC", "ホテルA"]
+
+
+@pytest.mark.asyncio
+async def test_async_parallel_actions_run_concurrently_and_keep_action_order(parallel_actor):
+    tools = ParallelTools(parties=3)
+    actor = parallel_actor(tools, async_slow=True)
+
+    observations = await actor._arun_actions(PARALLEL_ACTIONS)
+
+    assert observations == EXPECTED_OBSERVATIONS
+    assert tools.finished == ["ホテルC", "ホテルA"]
+
+
+def test_skipped_actions_do_not_drop_siblings(parallel_actor, monkeypatch):
+    monkeypatch.setattr(config, "actor_max_tools_per_turn", 2)
+    tools = ParallelTools(parties=1)
+    actor = parallel_actor(tools)
+
+    observations = actor._run_actions(
+        [ToolAction("fast", "ホテルA"), ToolAction("finish", "完了"), ToolAction("slow", "ホテルB"), ToolAction("fast", "ホテルC")]
+    )
+
+    # finishと上限を超えた行動は実行せず、その理由を同じ位置の観察として返す
+    assert observations[0] == "fast: ホテルA の結果"
+    assert "finishは他のツールと同時には実行できません" in observations[1]
+    assert "最大2個" in observations[2] and "最大2個" in observations[3]
+    assert tools.finished == ["ホテルA"]
+
+
+def test_multi_tool_turn_records_observations_per_call(function_actor):
+    actor, llm = function_actor(
+        [
+            response(
+                tool_calls=[
+                    tool_call("call_a", "lookup", {"query": "ホテルA"}),
+                    tool_call("call_b", "lookup", {"query": "ホテルB"}),
+                ]
+            ),
+            response(tool_calls=[tool_call("call_c", "finish", FINISH_ARGS)]),
+        ]
+    )
+
+    assert json.loads(actor.run()) == FINISH_ARGS
+
+    # ツールの結果は呼び出しと同じ順に、それぞれの呼び出しIDに対応付けてLLMに返す
+    tool_messages = [message for message in llm.calls[1]["messages"] if message.get("role") == "tool"]
+    assert [(message["tool_call_id"], message["content"]) for message in tool_messages] == [
+        ("call_a", "ホテルA の調査結果"),
+        ("call_b", "ホテルB の調査結果"),
+    ]
+
+
+def assert_stable_prefix(calls: list):
+    """各ターンのメッセージが、前のターンのメッセージ（末尾のターン指示を除く）をそのまま先頭に含むことを確かめる"""
+    for previous, current in zip(calls, calls[1:]):
+        prefix = previous["messages"][:-1]
+        assert current["messages"][: len(prefix)] == prefix
+        assert len(current["messages"]) > len(previous["messages"])
+    assert len({call["messages"][0]["content"] for call in calls}) == 1
+
+
+@pytest.mark.parametrize("tool_mode", ["react", "function"])
+def test_multi_turn_messages_keep_stable_prefix(aime_config, monkeypatch, tool_mode):
+    monkeypatch.setattr(aime_config, "actor_prompt_mode", "multi_turn")
+    monkeypatch.setattr(aime_config, "actor_tool_mode", tool_mode)
+    monkeypatch.setattr(aime_config, "actor_max_turns", 5)
+    if tool_mode == "react":
+        responses = [
+            response("思考: ホテルAを調べる\n行動: lookup[ホテルA]"),
+            response("思考: ホテルBを調べる\n行動: lookup[ホテルB]"),
+            response(f"思考: 完了\n行動: finish[{json.dumps(FINISH_ARGS, ensure_ascii=False)}]"),
+        ]
+    else:
+        responses = [
+            response("ホテルAを調べる", [tool_call("call_a", "lookup", {"query": "ホテルA"})]),
+            response("ホテルBを調べる", [tool_call("call_b", "lookup", {"query": "ホテルB"})]),
+            response(tool_calls=[tool_call("call_c", "finish", FINISH_ARGS)]),
+        ]
+    llm = ScriptedLLM(responses)
+    monkeypatch.setattr(llm_client, "completion", llm.completion)
+    progress_manager = ProgressManagementModule(write_to_file=False)
+    progress_manager.initialize_tasks([{"id": 0, "description": "東京のホテルを調べる", "dependencies": []}])
+    actor = DynamicActor(
+        subtask=progress_manager.tasks[0],
+        persona="旅行の専門家",
+        knowledge="",
+        tools={"finish": finish, "lookup": lookup},
+        progress_manager=progress_manager,
+    )
+
+    assert json.loads(actor.run()) == FINISH_ARGS
+
+    # システムプロンプトと過去のターンは毎ターン同じ内容で先頭に並び、変わるのは末尾のターン指示だけ
+    assert len(llm.calls) == 3
+    assert_stable_prefix(llm.calls)
+    assert len({call["messages"][-1]["content"] for call in llm.calls}) == 3
+    assert all("ターン目" in call["messages"][-1]["content"] for call in llm.calls)
+    assert "ターン目" not in llm.calls[0]["messages"][0]["content"]
@@ -0,0 +1,175 @@
+"""
+バッチ実行（BatchRunner / python -m aime.main --batch）のテスト
+タスク分解・Actor・最終報告書の作成はスタブに置き換え、同時に実行中のゴール数とActor数を記録する
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from aime import main as main_module
+from aime.batch import SUMMARY_FILENAME, BatchGoal, BatchRunner, load_goals
+from aime.factory import ActorFactory
+from aime.planner import DynamicPlanner
+
+TASKS_PER_GOAL = 3
+
+
+class ConcurrencyTracker:
+    """同時に実行中の数と、その最大値を記録する（上限まで揃うのを少し待ち、上限を超えないことを確かめやすくする）"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.max_active = 0
+        self._cond = threading.Condition()
+
+    def enter(self):
+        with self._cond:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self.active >= self.limit, timeout=0.2)
+
+    def exit(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+
+class StubRuns:
+    """DynamicPlanner のLLM呼び出しを置き換え、ゴールとActorの同時実行数を記録する"""
+
+    def __init__(self, max_runs: int, max_workers: int):
+        self.runs = ConcurrencyTracker(max_runs)
+        self.actors = ConcurrencyTracker(max_workers)
+
+    def decompose(self, planner: DynamicPlanner, goal: str) -> list:
+        self.runs.enter()
+        if "失敗" in goal:
+            self.runs.exit()
+            raise RuntimeError("分解できないゴールです")
+        if "空" in goal:
+            self.runs.exit()
+            return []
+        return [{"id": i, "description": f"{goal} の調査{i}", "dependencies": []} for i in range(TASKS_PER_GOAL)]
+
+    def report(self, planner: DynamicPlanner, goal: str) -> str:
+        self.runs.exit()
+        return f"# {goal} の最終報告書"
+
+    def execute(self, planner: DynamicPlanner, task: dict) -> tuple:
+        self.actors.enter()
+        try:
+            time.sleep(0.01)
+        finally:
+            self.actors.exit()
+        return task["id"], json.dumps({"status": "success", "message": f"{planner.run_id} の結果 {task['id']}"})
+
+    async def aexecute(self, planner: DynamicPlanner, task: dict) -> tuple:
+        return await asyncio.to_thread(self.execute, planner, task)
+
+    def install(self, monkeypatch):
+        """全プランナーのメソッドを置き換える（クラスの属性にするため、インスタンスを受け取る関数で包む）"""
+        monkeypatch.setattr(DynamicPlanner, "_decompose_task", lambda planner, goal: self.decompose(planner, goal))
+        monkeypatch.setattr(DynamicPlanner, "_generate_final_report", lambda planner, goal: self.report(planner, goal))
+        monkeypatch.setattr(DynamicPlanner, "_execute_task_wrapper", lambda planner, task: self.execute(planner, task))
+        monkeypatch.setattr(DynamicPlanner, "_aexecute_task_wrapper", lambda planner, task: self.aexecute(planner, task))
+        monkeypatch.setattr(ActorFactory, "prepare_personas", lambda factory, subtasks: None)
+
+
+def install_stubs(monkeypatch, max_runs: int, max_workers: int) -> StubRuns:
+    stubs = StubRuns(max_runs, max_workers)
+    stubs.install(monkeypatch)
+    return stubs
+
+
+def goals(count: int) -> list:
+    return [BatchGoal(f"goal-{i}", f"都市{i}の観光プラン") for i in range(count)]
+
+
+def run_batch(runner: BatchRunner, batch_goals: list, mode: str) -> list:
+    if mode == "async":
+        return asyncio.run(runner.arun(batch_goals))
+    return runner.run(batch_goals)
+
+
+def read_summary(output_dir) -> list:
+    with open(os.path.join(output_dir, SUMMARY_FILENAME), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_each_goal_gets_its_own_output_dir_and_run_id(aime_config, monkeypatch, tmp_path, mode):
+    install_stubs(monkeypatch, max_runs=3, max_workers=4)
+    runner = BatchRunner(str(tmp_path / "batch"), max_workers=4, max_runs=3)
+
+    summaries = run_batch(runner, goals(3), mode)
+
+    assert [summary.goal_id for summary in summaries] == ["goal-0", "goal-1", "goal-2"]
+    assert len({summary.run_id for summary in summaries}) == 3
+    for summary in summaries:
+        assert summary.status == "completed"
+        assert summary.tasks_completed == summary.tasks_total == TASKS_PER_GOAL
+        assert summary.run_id == f"{runner.batch_id}-{summary.goal_id}"
+        assert summary.output_dir == os.path.join(str(tmp_path / "batch"), summary.goal_id)
+        with open(summary.final_report, encoding="utf-8") as f:
+            assert summary.goal in f.read()
+        assert os.path.dirname(summary.final_report) == summary.output_dir
+    assert [row["goal_id"] for row in read_summary(tmp_path / "batch")] == ["goal-0", "goal-1", "goal-2"]
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_shared_actor_limit_caps_total_concurrency(aime_config, monkeypatch, tmp_path, mode):
+    # 各プランナーの上限（4）より小さい共有の上限が、全ゴール合計の同時実行数を制限する
+    stubs = install_stubs(monkeypatch, max_runs=4, max_workers=2)
+    runner = BatchRunner(str(tmp_path / "batch"), max_workers=2, max_runs=4)
+
+    summaries = run_batch(runner, goals(4), mode)
+
+    assert all(summary.status == "completed" for summary in summaries)
+    assert stubs.actors.max_active == 2
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_failing_goal_still_gets_summary_row(aime_config, monkeypatch, tmp_path, mode):
+    install_stubs(monkeypatch, max_runs=3, max_workers=4)
+    runner = BatchRunner(str(tmp_path / "batch"), max_workers=4, max_runs=3)
+    batch_goals = [BatchGoal("ok", "東京の観光プラン"), BatchGoal("broken", "失敗する計画"), BatchGoal("empty", "空の計画")]
+
+    run_batch(runner, batch_goals, mode)
+
+    rows = {row["goal_id"]: row for row in read_summary(tmp_path / "batch")}
+    assert rows["ok"]["status"] == "completed"
+    assert rows["broken"]["status"] == "error"
+    assert rows["broken"]["error"] == "RuntimeError: 分解できないゴールです"
+    assert rows["broken"]["final_report"] is None
+    assert rows["empty"]["status"] == "error"
+    assert rows["empty"]["error"] == "タスクの分解に失敗しました。"
+
+
+@pytest.mark.parametrize("max_runs", [1, 2])
+def test_cli_max_runs_limits_concurrent_goals(aime_config, monkeypatch, tmp_path, max_runs):
+    stubs = install_stubs(monkeypatch, max_runs=max_runs, max_workers=4)
+    goals_path = tmp_path / "goals.jsonl"
+    goals_path.write_text(
+        "\n".join(json.dumps({"id": f"city{i}", "goal": f"都市{i}の観光プラン"}, ensure_ascii=False) for i in range(4)),
+        encoding="utf-8",
+    )
+    output_dir = tmp_path / "batch"
+    monkeypatch.setattr(main_module, "CallbackHandler", lambda: None)
+    monkeypatch.setattr(main_module, "success_callback", [])
+    monkeypatch.setattr(
+        sys, "argv", ["aime", "--batch", str(goals_path), "--output-dir", str(output_dir), "--max-runs", str(max_runs), "--workers", "4"]
+    )
+
+    main_module.main()
+
+    assert stubs.runs.max_active == max_runs
+    assert [row["goal_id"] for row in read_summary(output_dir)] == [goal.goal_id for goal in load_goals(str(goals_path))]
+    assert all(row["status"] == "completed" for row in read_summary(output_dir))
@@ -0,0 +1,193 @@
+"""
+履歴のトークン予算管理（ContextBudgetManager）と DynamicActor._compact_history のテスト
+トークン数は1文字1トークンで数え、要約のLLM呼び出しはスタブに置き換える
+"""
+
+import copy
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from aime import context_budget as context_budget_module
+from aime.actor import DynamicActor, ToolAction
+from aime.context_budget import ContextBudgetManager
+from aime.llm_client import llm_client
+from aime.progress_manager import ProgressManagementModule
+from aime.tools import finish
+
+TASK_DESCRIPTION = "東京のホテルを調べる"
+OBSERVATION_CHARS = 200
+
+
+def make_history(turns: int) -> list:
+    return [
+        {
+            "thought": f"ホテル{i}を調べる",
+            "action_str": f"lookup[ホテル{i}]",
+            "observation": f"ホテル{i}の調査結果。" + "詳細" * (OBSERVATION_CHARS // 2),
+        }
+        for i in range(turns)
+    ]
+
+
+def history_tokens(history: list) -> int:
+    return sum(len(f"{turn['thought']}\n{turn['action_str']}\n{turn['observation']}") for turn in history)
+
+
+class MiniLLM:
+    """観察結果の要約を返す completion_mini のスタブ（失敗させることもできる）"""
+
+    def __init__(self, fail: bool = False):
+        self.prompts = []
+        self.fail = fail
+
+    def __call__(self, messages, **kwargs):
+        self.prompts.append(messages[0]["content"])
+        if self.fail:
+            raise RuntimeError("要約モデルが応答しません")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"要約{len(self.prompts)}"))])
+
+
+@pytest.fixture
+def budget_config(aime_config, monkeypatch):
+    monkeypatch.setattr(context_budget_module, "count_tokens", lambda text, model=None: len(text))
+    monkeypatch.setattr(aime_config, "actor_history_token_budget", 800)
+    monkeypatch.setattr(aime_config, "actor_history_keep_recent_turns", 2)
+    monkeypatch.setattr(aime_config, "actor_compacted_observation_chars", 20)
+    return aime_config
+
+
+@pytest.mark.parametrize("mode", ["summarize", "truncate"])
+def test_compact_respects_budget_and_keeps_recent_turns_verbatim(budget_config, monkeypatch, mode):
+    monkeypatch.setattr(budget_config, "actor_history_compaction", mode)
+    mini = MiniLLM()
+    monkeypatch.setattr(llm_client, "completion_mini", mini)
+    manager = ContextBudgetManager(TASK_DESCRIPTION)
+    history = make_history(5)
+    original = copy.deepcopy(history)
+    before = history_tokens(history)
+
+    assert manager.compact(history)
+
+    after = history_tokens(history)
+    assert after <= manager.budget < before
+    # 直近のターンは原文のまま残す
+    assert [turn["observation"] for turn in history[-2:]] == [turn["observation"] for turn in original[-2:]]
+    compacted = [turn for turn in history if turn.get("compacted")]
+    # 予算に収まった時点で止め、それより新しいターンは圧縮しない
+    assert len(compacted) == manager.compacted_observations == 2
+    assert history[2]["observation"] == original[2]["observation"]
+    assert manager.tokens_saved == before - after
+    if mode == "summarize":
+        assert [turn["observation"] for turn in compacted] == ["（要約）要約1", "（要約）要約2"]
+        assert TASK_DESCRIPTION in mini.prompts[0]
+        assert original[0]["observation"] in mini.prompts[0]
+    else:
+        assert mini.prompts == []
+        assert compacted[0]["observation"] == original[0]["observation"][:20] + "...（以下省略）"
+
+
+def test_summarize_failure_falls_back_to_truncation(budget_config, monkeypatch):
+    monkeypatch.setattr(budget_config, "actor_history_compaction", "summarize")
+    monkeypatch.setattr(llm_client, "completion_mini", MiniLLM(fail=True))
+    manager = ContextBudgetManager(TASK_DESCRIPTION)
+    history = make_history(5)
+    first_observation = history[0]["observation"]
+
+    manager.compact(history)
+
+    assert history[0]["observation"] == first_observation[:20] + "...（以下省略）"
+    assert history_tokens(history) <= manager.budget
+
+
+def test_compact_is_noop_within_budget_or_when_disabled(budget_config, monkeypatch):
+    monkeypatch.setattr(budget_config, "actor_history_compaction", "truncate")
+    history = make_history(3)
+    assert history_tokens(history) <= 800
+    manager = ContextBudgetManager(TASK_DESCRIPTION)
+    assert not manager.compact(history)
+    assert manager.tokens_saved == 0
+
+    monkeypatch.setattr(budget_config, "actor_history_compaction", "off")
+    history = make_history(10)
+    original = copy.deepcopy(history)
+    assert not ContextBudgetManager(TASK_DESCRIPTION).compact(history)
+    assert history == original
+
+
+def test_each_observation_is_compacted_once_and_recent_turns_are_never_compacted(budget_config, monkeypatch):
+    monkeypatch.setattr(budget_config, "actor_history_compaction", "summarize")
+    monkeypatch.setattr(budget_config, "actor_history_token_budget", 10)
+    mini = MiniLLM()
+    monkeypatch.setattr(llm_client, "completion_mini", mini)
+    manager = ContextBudgetManager(TASK_DESCRIPTION)
+    history = make_history(4)
+    recent = copy.deepcopy(history[-2:])
+
+    manager.compact(history)
+    saved = manager.tokens_saved
+    # 予算に収まらなくても、直近のターンと圧縮済みの観察はそれ以上圧縮しない
+    assert not manager.compact(history)
+    assert len(mini.prompts) == 2
+    assert manager.tokens_saved == saved
+    assert history[-2:] == [{**turn, "tokens": history_tokens([turn])} for turn in recent]
+
+
+def lookup(query: str) -> str:
+    """キーワードで情報を調べる"""
+    return f"{query}の調査結果。" + "詳細" * (OBSERVATION_CHARS // 2)
+
+
+def build_actor(budget_config, monkeypatch, tool_mode: str) -> DynamicActor:
+    monkeypatch.setattr(budget_config, "actor_tool_mode", tool_mode)
+    monkeypatch.setattr(budget_config, "actor_prompt_mode", "multi_turn")
+    progress_manager = ProgressManagementModule(write_to_file=False)
+    progress_manager.initialize_tasks([{"id": 0, "description": TASK_DESCRIPTION, "dependencies": []}])
+    return DynamicActor(
+        subtask=progress_manager.tasks[0],
+        persona="旅行の専門家",
+        knowledge="",
+        tools={"finish": finish, "lookup": lookup},
+        progress_manager=progress_manager,
+    )
+
+
+def test_actor_compaction_rebuilds_history_messages(budget_config, monkeypatch):
+    monkeypatch.setattr(budget_config, "actor_history_compaction", "truncate")
+    actor = build_actor(budget_config, monkeypatch, "react")
+    for i in range(5):
+        action = ToolAction("lookup", f"ホテル{i}")
+        actor._record_turn(f"ホテル{i}を調べる", [action], actor._run_actions([action]))
+    before = [message["content"] for message in actor._history_messages]
+
+    actor._compact_history()
+
+    after = [message["content"] for message in actor._history_messages]
+    assert after == [message["content"] for turn in actor.history for message in actor._turn_messages(turn)]
+    # 圧縮した観察はメッセージにも反映し、直近のターンのメッセージは変えない
+    assert after[1] == "観察: " + actor.history[0]["observation"]
+    assert after[1].endswith("...（以下省略）")
+    assert after[-4:] == before[-4:]
+    assert actor.context_budget.tokens_saved > 0
+
+
+def test_compacted_function_call_turn_keeps_one_response_per_call(budget_config, monkeypatch):
+    monkeypatch.setattr(budget_config, "actor_history_compaction", "truncate")
+    actor = build_actor(budget_config, monkeypatch, "function")
+    for i in range(4):
+        actions = [
+            ToolAction("lookup", {"query": query}, {"id": f"call_{i}{suffix}", "name": "lookup", "arguments": json.dumps({"query": query})})
+            for suffix, query in (("A", f"ホテル{i}A"), ("B", f"ホテル{i}B"))
+        ]
+        actor._record_turn(f"ホテル{i}を調べる", actions, actor._run_actions(actions))
+
+    actor._compact_history()
+
+    messages = actor._turn_messages(actor.history[0])
+    tool_messages = [message for message in messages if message["role"] == "tool"]
+    # 全ての呼び出しに応答を残し、まとめた観察は最初の応答に載せる
+    assert [message["tool_call_id"] for message in tool_messages] == ["call_0A", "call_0B"]
+    assert tool_messages[0]["content"] == actor.history[0]["observation"]
+    assert tool_messages[0]["content"].endswith("...（以下省略）")
+    assert "最初の応答にまとめて記載" in tool_messages[1]["content"]
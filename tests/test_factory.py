@@ -0,0 +1,93 @@
+"""
+ActorFactory の事前準備（prewarm）のテスト（ペルソナの生成はスタブに置き換える）
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from aime.factory import ActorFactory
+from aime.metrics import metrics
+from aime.progress_manager import ProgressManagementModule
+
+TASK = {"id": 1, "description": "東京のホテルを調べる", "dependencies": [0]}
+
+
+@pytest.fixture
+def factory(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "metrics_enabled", True)
+    factory = ActorFactory(ProgressManagementModule(write_to_file=False))
+    factory.generated = []
+    factory.release = threading.Event()
+
+    def generate_persona(description: str) -> str:
+        factory.generated.append(description)
+        factory.release.wait(5)
+        return "ホテル業界に詳しい旅行コンサルタント。"
+
+    async def agenerate_persona(description: str) -> str:
+        return await asyncio.to_thread(generate_persona, description)
+
+    monkeypatch.setattr(factory, "_generate_persona", generate_persona)
+    monkeypatch.setattr(factory, "_agenerate_persona", agenerate_persona)
+    yield factory
+    factory.release.set()
+    factory.shutdown()
+
+
+def prewarm_outcomes() -> dict:
+    return {entry["labels"]["outcome"]: entry["value"] for entry in metrics.to_dict().get("aime_prewarm_total", [])}
+
+
+def wait_until_started(factory: ActorFactory):
+    deadline = time.monotonic() + 5
+    while not factory.generated and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert factory.generated
+
+
+def test_worker_persona_waits_for_prepared_persona(factory):
+    factory.prewarm([TASK], build_actor=False)
+    wait_until_started(factory)
+    threading.Timer(0.1, factory.release.set).start()
+
+    persona = factory.get_prepared_persona(TASK)
+
+    assert persona == "ホテル業界に詳しい旅行コンサルタント。"
+    assert factory.generated == [TASK["description"]]
+    assert prewarm_outcomes() == {"used": 1}
+
+
+@pytest.mark.asyncio
+async def test_async_worker_persona_waits_for_prepared_persona(factory):
+    factory.prewarm([TASK], build_actor=False)
+    wait_until_started(factory)
+    asyncio.get_running_loop().call_later(0.1, factory.release.set)
+
+    persona = await factory.aget_prepared_persona(TASK)
+
+    assert persona == "ホテル業界に詳しい旅行コンサルタント。"
+    assert factory.generated == [TASK["description"]]
+    assert prewarm_outcomes() == {"used": 1}
+
+
+def test_worker_persona_without_prewarm_is_generated_once(factory):
+    factory.release.set()
+
+    assert factory.get_prepared_persona(TASK) == "ホテル業界に詳しい旅行コンサルタント。"
+    assert factory.get_prepared_persona(TASK) == "ホテル業界に詳しい旅行コンサルタント。"
+
+    assert factory.generated == [TASK["description"]]
+    assert prewarm_outcomes() == {}
+
+
+def test_prepared_actor_is_discarded_when_task_changes(factory):
+    factory.release.set()
+    factory.prewarm([TASK], build_actor=False)
+
+    factory.discard_prepared([{**TASK, "description": "大阪のホテルを調べる"}])
+
+    assert prewarm_outcomes() == {"discarded": 1}
+    assert factory.take_prepared(TASK) is None
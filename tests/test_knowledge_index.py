@@ -0,0 +1,146 @@
+"""
+知識インデックス（KnowledgeIndex）のテスト
+BM25の検索・段落数の上限による削除・実行ごとの分離・永続化とワーカーへの受け渡しを確かめる
+"""
+
+import json
+
+import litellm
+
+from aime import worker_runtime
+from aime.knowledge_index import KnowledgeIndex
+from aime.planner import DynamicPlanner
+
+HOTEL = "東京のホテルの料金は1泊1万円です。"
+TEMPLE = "京都の観光地は清水寺です。"
+
+
+def sources(hits) -> list:
+    return [source for source, _, _ in hits]
+
+
+def test_added_paragraphs_are_searchable_immediately(aime_config):
+    index = KnowledgeIndex()
+    assert index.search("ホテル") == []
+
+    assert index.add("検索1", HOTEL) == 1
+    assert sources(index.search("ホテルの料金")) == ["検索1"]
+
+    # 後から追加した段落も、インデックスを作り直さずに検索できる
+    assert index.add("検索2", TEMPLE) == 1
+    assert sources(index.search("清水寺")) == ["検索2"]
+    assert sources(index.search("ホテルの料金")) == ["検索1"]
+
+    # 同じ内容の段落は1回だけ登録する
+    assert index.add("検索3", HOTEL) == 0
+    assert index.stats()["documents"] == 2
+
+
+def test_search_ranks_by_bm25_score(aime_config):
+    index = KnowledgeIndex()
+    index.add("一致が少ない", "東京の天気は晴れです。大阪の天気は雨です。名古屋の天気は曇りです。")
+    index.add("一致が多い", "東京のホテルは東京駅の近くにあります。")
+    index.add("無関係", TEMPLE)
+
+    hits = index.search("東京のホテル")
+
+    assert sources(hits) == ["一致が多い", "一致が少ない"]
+    assert hits[0][2] > hits[1][2]
+    assert sources(index.search("東京のホテル", top_k=1)) == ["一致が多い"]
+
+
+def test_oldest_paragraphs_are_evicted_at_max_documents(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "knowledge_index_max_documents", 2)
+    index = KnowledgeIndex()
+    index.add("古い", HOTEL)
+    index.add("中間", TEMPLE)
+    index.add("新しい", "大阪の名物はたこ焼きです。")
+
+    assert index.stats()["documents"] == 2
+    assert index.search("ホテルの料金") == []
+    assert sources(index.search("清水寺")) == ["中間"]
+    assert sources(index.search("たこ焼き")) == ["新しい"]
+    # 削除した段落の語は転置インデックスからも消える
+    remaining_terms = set().union(*(document.term_counts for document in index._documents.values()))
+    assert set(index._postings) == remaining_terms
+
+    # 削除した段落は重複とみなさず、再び登録できる
+    assert index.add("再登録", HOTEL) == 1
+    assert sources(index.search("ホテルの料金")) == ["再登録"]
+
+
+def test_planners_do_not_share_index_without_persist_path(aime_config):
+    first = DynamicPlanner(run_id="run-a", export_metrics=False)
+    second = DynamicPlanner(run_id="run-b", export_metrics=False)
+    first.progress_manager.initialize_tasks([{"id": 0, "description": "東京のホテルを調べる", "dependencies": []}])
+
+    # 進捗報告は、その実行の search_knowledge からだけ検索できる
+    first.progress_manager.add_task_log(0, HOTEL)
+    search_first = first.factory.base_tools["search_knowledge"]
+    search_second = second.factory.base_tools["search_knowledge"]
+
+    assert "1泊1万円" in search_first("ホテルの料金")
+    assert "見つかりませんでした" in search_second("ホテルの料金")
+    assert first.knowledge_index is not second.knowledge_index
+    for planner in (first, second):
+        planner.progress_manager.close()
+
+
+def test_persisted_paragraphs_are_labeled_with_their_run(aime_config, monkeypatch, tmp_path):
+    path = tmp_path / "knowledge.jsonl"
+    monkeypatch.setattr(aime_config, "knowledge_index_path", str(path))
+    first = DynamicPlanner(run_id="run-a", export_metrics=False)
+    first.knowledge_index.add("タスク0の結果", HOTEL)
+
+    assert [json.loads(line)["run"] for line in path.read_text(encoding="utf-8").splitlines()] == ["run-a"]
+
+    # knowledge_index_path を指定した場合は、次の実行でも出所の実行が分かる形で検索できる
+    second = DynamicPlanner(run_id="run-b", export_metrics=False)
+    second.knowledge_index.add("タスク0の結果", TEMPLE)
+    assert sources(second.knowledge_index.search("ホテルの料金")) == ["タスク0の結果（実行 run-a）"]
+    assert sources(second.knowledge_index.search("清水寺")) == ["タスク0の結果"]
+    for planner in (first, second):
+        planner.progress_manager.close()
+
+
+class RecordingBackend:
+    """投入されたジョブを記録するだけのワーカーバックエンド"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, job: dict, on_log=None):
+        self.jobs.append(job)
+
+
+def test_worker_job_carries_relevant_hits(aime_config, monkeypatch):
+    backend = RecordingBackend()
+    planner = DynamicPlanner(run_id="run-a", export_metrics=False, worker_backend=backend)
+    planner.knowledge_index.add("タスク0の結果", HOTEL)
+    planner.knowledge_index.add("タスク1の結果", TEMPLE)
+    task = {"id": 2, "description": "ホテルの料金を比較する", "dependencies": [0]}
+
+    planner._submit_to_worker(task, "旅行の専門家", "")
+
+    job = backend.jobs[0]
+    assert job["knowledge_hits"] == [["タスク0の結果", HOTEL]]
+    assert job["run_label"] == "run-a"
+
+    # ワーカーの search_knowledge は、ジョブとともに送られた段落を検索できる
+    def completion(**params):
+        prompt = " ".join(str(message.get("content")) for message in params["messages"])
+        if "1泊1万円" not in prompt:
+            content = "思考: 既存の情報を確認します\n行動: search_knowledge[ホテルの料金]"
+        else:
+            report = json.dumps({"status": "success", "message": "1泊1万円でした"}, ensure_ascii=False)
+            content = f"思考: 完了しました\n行動: finish[{report}]"
+        return litellm.ModelResponse(
+            choices=[{"message": {"role": "assistant", "content": content}}],
+            usage={"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        )
+
+    monkeypatch.setattr(litellm, "completion", completion)
+    result = worker_runtime.execute_job({**job, "job_id": "job-1"}, send=lambda message: None)
+
+    assert "1泊1万円でした" in result["result"]
+    planner.progress_manager.close()
@@ -0,0 +1,179 @@
+"""
+LLMClient のストリーミング呼び出しとレスポンスキャッシュのテスト（litellmの呼び出しはスタブに置き換える）
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from litellm import RateLimitError
+
+from aime import llm_client as llm_client_module
+from aime.llm_client import llm_client
+from aime.metrics import metrics
+
+MODEL = "openai/test-model"
+
+
+def chunk(content: str = None, finish_reason: str = None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)])
+
+
+def rate_limit_error():
+    return RateLimitError("rate limited", llm_provider="openai", model=MODEL)
+
+
+class FakeStream:
+    """差分を順に返し、fail_after 件を返した時点で error を送出するストリーム"""
+
+    def __init__(self, deltas: list, error: Exception = None, fail_after: int = 0):
+        self.deltas = deltas
+        self.error = error
+        self.fail_after = fail_after
+        self.in_flight_seen = []
+
+    def _chunks(self):
+        for index, delta in enumerate(self.deltas):
+            if self.error is not None and index == self.fail_after:
+                raise self.error
+            self.in_flight_seen.append(llm_client._in_flight)
+            yield chunk(delta)
+        if self.error is not None and self.fail_after >= len(self.deltas):
+            raise self.error
+        yield chunk(finish_reason="stop")
+
+    def __iter__(self):
+        return self._chunks()
+
+    async def _achunks(self):
+        for item in self._chunks():
+            yield item
+
+    def __aiter__(self):
+        return self._achunks()
+
+
+@pytest.fixture
+def streams(aime_config, monkeypatch):
+    """litellmの呼び出しごとに、渡したストリームを順に返す"""
+    monkeypatch.setattr(aime_config, "metrics_enabled", True)
+    monkeypatch.setattr(aime_config, "llm_retry_base_delay", 0.01)
+    monkeypatch.setattr(aime_config, "llm_retry_max_delay", 0.01)
+    monkeypatch.setattr(aime_config, "llm_adaptive_concurrency", False)
+    queue = []
+
+    def fake_completion(**params):
+        return queue.pop(0)
+
+    async def fake_acompletion(**params):
+        return queue.pop(0)
+
+    monkeypatch.setattr(llm_client_module.litellm, "completion", fake_completion)
+    monkeypatch.setattr(llm_client_module.litellm, "acompletion", fake_acompletion)
+    return queue
+
+
+def outcomes() -> dict:
+    return {
+        entry["labels"]["outcome"]: entry["value"]
+        for entry in metrics.to_dict().get("aime_llm_requests_total", [])
+        if entry["labels"]["call_site"] == "test"
+    }
+
+
+def stream(mode: str, **kwargs):
+    if mode == "sync":
+        return llm_client.stream_completion(messages=[{"role": "user", "content": "hi"}], model=MODEL, **kwargs)
+    return asyncio.run(
+        llm_client.astream_completion(messages=[{"role": "user", "content": "hi"}], model=MODEL, **kwargs)
+    )
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_rate_limit_before_first_delta_is_retried(streams, mode):
+    retried = FakeStream(["a", "b"])
+    streams.extend([FakeStream(["x"], error=rate_limit_error(), fail_after=0), retried])
+
+    result = stream(mode, call_site="test")
+
+    assert result.text == "ab"
+    assert outcomes() == {"rate_limited": 1, "success": 1}
+    # 受信中も同時実行中の呼び出しとして数えられている
+    assert retried.in_flight_seen and all(count >= 1 for count in retried.in_flight_seen)
+    assert llm_client._in_flight == 0
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_rate_limit_after_delivered_delta_is_not_retried(streams, mode):
+    received = []
+    streams.extend([FakeStream(["a", "b"], error=rate_limit_error(), fail_after=1), FakeStream(["c"])])
+
+    with pytest.raises(RateLimitError):
+        stream(mode, call_site="test", stop_when=lambda delta: received.append(delta) or False)
+
+    # stop_whenに渡した差分が重複しないよう、途中からは再試行しない
+    assert received == ["a"]
+    assert outcomes() == {"rate_limited": 1}
+    assert llm_client._in_flight == 0
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_error_while_streaming_is_recorded(streams, mode):
+    streams.append(FakeStream(["a"], error=ConnectionError("reset"), fail_after=1))
+
+    with pytest.raises(ConnectionError):
+        stream(mode, call_site="test")
+
+    assert outcomes() == {"error": 1}
+    assert llm_client._in_flight == 0
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_stop_when_ends_stream_early(streams, mode):
+    streams.append(FakeStream(["a", "b", "c"]))
+
+    result = stream(mode, call_site="test", stop_when=lambda delta: delta == "b")
+
+    assert result.text == "ab"
+    assert result.early_stopped
+    assert outcomes() == {"success": 1}
+
+
+@pytest.fixture
+def cached_completions(aime_config, monkeypatch, tmp_path):
+    """レスポンスキャッシュを一時ディレクトリで有効にし、litellmの呼び出し回数を数える"""
+    monkeypatch.setattr(aime_config, "llm_cache_enabled", True)
+    monkeypatch.setattr(aime_config, "llm_cache_path", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(aime_config, "llm_cache_max_temperature", 0.2)
+    monkeypatch.setattr(llm_client, "_cache", None)
+    calls = []
+
+    def fake_completion(**params):
+        calls.append(params)
+        return llm_client_module.litellm.ModelResponse(
+            choices=[{"message": {"role": "assistant", "content": f"reply {len(calls)}"}}],
+            usage={"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        )
+
+    monkeypatch.setattr(llm_client_module.litellm, "completion", fake_completion)
+    return calls
+
+
+def complete(**kwargs) -> str:
+    response = llm_client.completion(messages=[{"role": "user", "content": "hi"}], model=MODEL, **kwargs)
+    return response.choices[0].message.content
+
+
+@pytest.mark.parametrize(
+    "temperature, cache, expected_calls",
+    [(0.0, None, 1), (0.5, None, 2), (0.5, True, 1), (0.0, False, 2)],
+    ids=["low-temperature", "high-temperature", "opt-in", "opt-out"],
+)
+def test_cache_opt_in_overrides_temperature_threshold(cached_completions, temperature, cache, expected_calls):
+    first = complete(temperature=temperature, cache=cache)
+    second = complete(temperature=temperature, cache=cache)
+
+    assert len(cached_completions) == expected_calls
+    assert (first == second) == (expected_calls == 1)
+    # cache引数はlitellmに渡さない
+    assert all("cache" not in params for params in cached_completions)
@@ -0,0 +1,132 @@
+"""
+実行メトリクス（MetricsRegistry）のテスト
+ヒストグラムの分位点の推定と、JSON・Prometheusのテキスト形式への出力を確かめる
+"""
+
+import json
+
+import pytest
+
+from aime.metrics import LATENCY_BUCKETS, MetricsRegistry
+
+
+@pytest.fixture
+def registry(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "metrics_enabled", True)
+    return MetricsRegistry()
+
+
+def histogram(registry: MetricsRegistry, name: str) -> dict:
+    (entry,) = registry.to_dict()[name]
+    return entry
+
+
+def test_quantiles_interpolate_within_bucket(registry):
+    # 0.3〜0.5秒の一様な100件は、全て (0.25, 0.5] のバケットに入る
+    for i in range(100):
+        registry.observe("aime_tool_duration_seconds", 0.3 + 0.2 * (i + 1) / 100, tool="google_search")
+
+    entry = histogram(registry, "aime_tool_duration_seconds")
+
+    assert entry["count"] == 100
+    assert entry["mean"] == pytest.approx(0.401)
+    # バケットの下限・上限ではなく、実際の最小値・最大値の間で補間する
+    assert entry["p50"] == pytest.approx(0.302 + 0.198 * 0.5)
+    assert entry["p95"] == pytest.approx(0.302 + 0.198 * 0.95)
+    assert entry["min"] == pytest.approx(0.302)
+    assert entry["max"] == pytest.approx(0.5)
+
+
+def test_quantiles_across_buckets_stay_within_observed_range(registry):
+    values = [0.02] * 90 + [3.0] * 9 + [400.0]
+    for value in values:
+        registry.observe("aime_task_execution_seconds", value, status="completed")
+
+    entry = histogram(registry, "aime_task_execution_seconds")
+
+    # 9割を占める小さい値が中央値を決め、p95は (2.5, 5.0] のバケットの中で補間する
+    assert entry["p50"] == pytest.approx(0.02 + 0.005 * 50 / 90)
+    assert entry["p95"] == pytest.approx(2.5 + 2.5 * 5 / 9)
+    # 最後のバケット（+Inf）に入った値も最大値として残る
+    assert entry["max"] == 400.0
+    assert entry["min"] <= entry["p50"] <= entry["p95"] <= entry["max"]
+    assert entry["sum"] == pytest.approx(sum(values))
+
+
+def test_single_observation_quantile_is_the_value(registry):
+    registry.observe("aime_actor_turns", 7)
+
+    entry = histogram(registry, "aime_actor_turns")
+
+    assert entry["p50"] == entry["p95"] == 7
+
+
+def test_disabled_registry_records_nothing(registry, aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "metrics_enabled", False)
+
+    registry.inc("aime_tool_calls_total", tool="google_search", outcome="success")
+    registry.observe("aime_tool_duration_seconds", 0.1, tool="google_search")
+
+    assert registry.to_dict() == {}
+
+
+def test_prometheus_output_has_cumulative_buckets_and_metadata(registry):
+    registry.inc("aime_llm_requests_total", call_site="actor", model="gpt-4o", outcome="success")
+    registry.inc("aime_llm_requests_total", 2, call_site="actor", model="gpt-4o", outcome="success")
+    registry.inc("aime_llm_cost_usd_total", 0.125, call_site="actor", model="gpt-4o")
+    for value in (0.004, 0.3, 0.4, 42.0, 999.0):
+        registry.observe("aime_llm_request_duration_seconds", value, call_site="actor", model="gpt-4o")
+
+    lines = registry.to_prometheus().splitlines()
+
+    assert "# TYPE aime_llm_requests_total counter" in lines
+    assert "# TYPE aime_llm_request_duration_seconds histogram" in lines
+    assert any(line.startswith("# HELP aime_llm_request_duration_seconds ") for line in lines)
+    # ラベルはキーの順に並び、整数の値は小数点なしで出力する
+    assert 'aime_llm_requests_total{call_site="actor",model="gpt-4o",outcome="success"} 3' in lines
+    assert 'aime_llm_cost_usd_total{call_site="actor",model="gpt-4o"} 0.125' in lines
+
+    buckets = {}
+    for line in lines:
+        if line.startswith("aime_llm_request_duration_seconds_bucket"):
+            series, value = line.rsplit(" ", 1)
+            buckets[series.split('le="')[1].rstrip('"}')] = int(value)
+    # バケットは累積の件数で、境界ごとに1行と +Inf の1行を出力する
+    assert len(buckets) == len(LATENCY_BUCKETS) + 1
+    assert buckets["0.005"] == 1
+    assert buckets["0.25"] == 1
+    assert buckets["0.5"] == 3
+    assert buckets["60"] == 4
+    assert buckets["300"] == 4
+    assert buckets["+Inf"] == 5
+    assert list(buckets.values()) == sorted(buckets.values())
+    assert 'aime_llm_request_duration_seconds_count{call_site="actor",model="gpt-4o"} 5' in lines
+    assert 'aime_llm_request_duration_seconds_sum{call_site="actor",model="gpt-4o"} 1041.704' in lines
+
+
+def test_prometheus_escapes_label_values(registry):
+    registry.inc("aime_tool_calls_total", tool='fetch "page"\\\n', outcome="error")
+
+    assert 'aime_tool_calls_total{outcome="error",tool="fetch \\"page\\"\\\\\\n"} 1' in registry.to_prometheus().splitlines()
+
+
+@pytest.mark.parametrize("fmt", ["json", "prometheus"])
+def test_export_writes_file_in_requested_format(registry, tmp_path, fmt):
+    registry.inc("aime_replans_total", scope="subgraph")
+    registry.observe("aime_task_queue_wait_seconds", 1.5)
+    path = tmp_path / "metrics" / f"metrics.{fmt}"
+
+    registry.export(str(path), fmt)
+
+    content = path.read_text(encoding="utf-8")
+    if fmt == "json":
+        assert json.loads(content) == registry.to_dict()
+        assert json.loads(content)["aime_replans_total"] == [{"labels": {"scope": "subgraph"}, "value": 1.0}]
+    else:
+        assert content == registry.to_prometheus()
+
+
+def test_export_rejects_unknown_format(registry, tmp_path):
+    with pytest.raises(ValueError, match="出力形式"):
+        registry.export(str(tmp_path / "metrics.csv"), "csv")
+    assert not (tmp_path / "metrics.csv").exists()
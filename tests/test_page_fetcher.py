@@ -0,0 +1,241 @@
+"""
+PageFetcher のテスト（localhostのhttp.serverに対して取得する）
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from aime import search_cache
+from aime.page_fetcher import PageFetcher
+
+PAGE = """<html><head><title> テストページ </title><style>.x{color:red}</style><script>var a = "<p>no</p>";</script>
+</head><body><h1>見出し</h1><p>本文&amp;テキスト。<b>太字</b>です。</p><noscript>JS</noscript></body></html>"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            server.ports.add(self.client_address[1])
+        try:
+            path, _, query = self.path.partition("?")
+            handler = getattr(self, f"_{path.strip('/').replace('-', '_')}", self._page)
+            handler(query)
+        except OSError:
+            pass  # 取得側が打ち切って接続を閉じた場合
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _send(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, query):
+        self._send(PAGE.encode(), "text/html; charset=utf-8")
+
+    def _slow(self, query):
+        time.sleep(0.3)
+        self._page(query)
+
+    def _big(self, query):
+        # 本文の文字数の上限に達しないよう、タグだけの行を大量に返す
+        body = b"<html><body>" + b"<br>" * 1_000_000 + b"</body></html>"
+        self._send(body, "text/html; charset=utf-8")
+
+    def _long(self, query):
+        self._send(("<p>" + "あ" * 100 + "</p>").encode() * 1000, "text/html; charset=utf-8")
+
+    def _sjis_meta(self, query):
+        body = '<html><head><meta charset="shift_jis"><title>日本語</title></head><body><p>東京タワーは333m</p></body></html>'
+        self._send(body.encode("shift_jis"), "text/html")
+
+    def _eucjp_header(self, query):
+        self._send("<p>大阪城の天守閣</p>".encode("euc_jp"), "text/html; charset=EUC-JP")
+
+    def _missing(self, query):
+        self._send(b"not found", "text/plain", status=404)
+
+    def _binary(self, query):
+        self._send(b"\x89PNG" + b"\x00" * 100, "image/png")
+
+    def _stall(self, query):
+        # ヘッダーと本文の一部だけを送り、その後は応答が止まる
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", "100000")
+        self.end_headers()
+        self.wfile.write(b"<p>first part</p>")
+        self.wfile.flush()
+        self.server.release.wait(10)
+
+    def _trickle(self, query):
+        # 少しずつ送り続けるため、1回の読み込みのタイムアウトでは打ち切れない
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(100):
+            if self.server.release.is_set():
+                break
+            data = f"<p>chunk {i}</p>".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+            time.sleep(0.05)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.release = threading.Event()
+    httpd.hits = {}
+    httpd.active = 0
+    httpd.max_active = 0
+    httpd.ports = set()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.release.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_fetcher(**overrides) -> PageFetcher:
+    options = {
+        "timeout": 5.0,
+        "max_bytes": 2 * 1024 * 1024,
+        "max_chars": 3000,
+        "per_host": 2,
+        "max_workers": 8,
+        "cache_ttl_seconds": 3600,
+        "cache_max_entries": 100,
+    }
+    options.update(overrides)
+    return PageFetcher(**options)
+
+
+def test_extracts_title_and_body_text(server):
+    text = make_fetcher().fetch(f"{server.base}/page")
+
+    assert "タイトル: テストページ" in text
+    assert "見出し" in text
+    assert "本文&テキスト。太字です。" in text
+    for hidden in ("color:red", "no", "JS"):
+        assert hidden not in text.split("\n", 2)[-1]
+
+
+def test_per_host_limit_and_connection_reuse(server):
+    fetcher = make_fetcher(per_host=2)
+    urls = [f"{server.base}/slow?{i}" for i in range(6)]
+
+    started = time.monotonic()
+    pages = fetcher.fetch_many(urls)
+    elapsed = time.monotonic() - started
+
+    assert all("見出し" in page for page in pages)
+    assert server.max_active == 2
+    # 6件を2並列で3段分（0.3秒 x 3）
+    assert elapsed >= 0.85
+    # keep-aliveの接続を使い回すため、新しい接続は同時接続数の分だけ
+    assert len(server.ports) == 2
+
+
+def test_byte_cap_stops_download(server):
+    text = make_fetcher(max_bytes=64 * 1024).fetch(f"{server.base}/big")
+
+    assert "64KBで打ち切りました" in text
+
+
+def test_char_cap_truncates_text(server):
+    text = make_fetcher(max_chars=500).fetch(f"{server.base}/long")
+
+    body = "\n".join(text.split("\n")[1:-1])
+    assert len(body) == 500
+    assert "500文字で打ち切りました" in text
+
+
+def test_stalled_response_stops_at_overall_deadline(server):
+    fetcher = make_fetcher(timeout=0.5)
+
+    started = time.monotonic()
+    text = fetcher.fetch(f"{server.base}/stall")
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 1.5
+    assert "first part" in text
+    assert "時間の上限に達したため途中までです" in text
+    # 時間切れで途中までの結果はキャッシュしない
+    assert fetcher.cache.stats()["entries"] == 0
+
+
+def test_trickling_response_stops_at_overall_deadline(server):
+    started = time.monotonic()
+    text = make_fetcher(timeout=0.5).fetch(f"{server.base}/trickle")
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 1.5
+    assert "chunk 0" in text
+    assert "時間の上限に達したため途中までです" in text
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [("/sjis-meta", "東京タワーは333m"), ("/eucjp-header", "大阪城の天守閣")],
+    ids=["meta", "header"],
+)
+def test_charset_detection(server, path, expected):
+    text = make_fetcher().fetch(f"{server.base}{path}")
+
+    assert expected in text
+
+
+def test_errors_and_non_text_content(server):
+    fetcher = make_fetcher()
+
+    assert "HTTP 404" in fetcher.fetch(f"{server.base}/missing")
+    assert "テキストではないコンテンツ" in fetcher.fetch(f"{server.base}/binary")
+    assert "http(s)のURLを指定してください" in fetcher.fetch("ftp://example.com/file")
+
+
+def test_cache_serves_repeated_fetches_until_ttl_expires(server, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(search_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    fetcher = make_fetcher(cache_ttl_seconds=60)
+    url = f"{server.base}/page?cached"
+
+    first = fetcher.fetch(url)
+    assert fetcher.fetch(url) == first
+    assert server.hits["/page?cached"] == 1
+
+    now[0] += 61
+    fetcher.fetch(url)
+    assert server.hits["/page?cached"] == 2
+
+
+def test_concurrent_fetches_of_same_url_are_coalesced(server):
+    fetcher = make_fetcher(per_host=4)
+    url = f"{server.base}/slow?same"
+
+    pages = fetcher.fetch_many([url] * 4)
+
+    assert len(set(pages)) == 1
+    assert server.hits["/slow?same"] == 1
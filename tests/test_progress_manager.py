@@ -0,0 +1,172 @@
+"""
+ProgressManagementModule のテスト（進捗ファイルの書き込みと、依存関係インデックスの差分更新）
+"""
+
+import copy
+import random
+import threading
+
+import pytest
+
+from aime.planner import DynamicPlanner
+from aime.progress_manager import ProgressManagementModule
+
+
+def progress_writer_threads() -> list:
+    return [thread for thread in threading.enumerate() if thread.name == "progress-writer"]
+
+
+def test_close_flushes_pending_progress_and_stops_writer(aime_config, monkeypatch, tmp_path):
+    # 書き込みの最小間隔を長くし、closeしない限り変更がファイルに反映されない状態にする
+    monkeypatch.setattr(aime_config, "progress_flush_interval_ms", 60_000)
+    path = tmp_path / "progress.md"
+    threads_before = len(progress_writer_threads())
+    progress_manager = ProgressManagementModule(filepath=str(path), write_to_file=True)
+    progress_manager.initialize_tasks([{"id": 0, "description": "調査", "dependencies": []}])
+    progress_manager.update_task_status(0, "completed", "done")
+    assert len(progress_writer_threads()) == threads_before + 1
+
+    progress_manager.close()
+
+    assert "✅ 調査" in path.read_text(encoding="utf-8")
+    assert len(progress_writer_threads()) == threads_before
+    # close後の変更はファイルに反映せず、エラーにもならない
+    progress_manager.update_task_status(0, "failed", "late")
+    progress_manager.flush()
+    progress_manager.close()
+    assert "✅ 調査" in path.read_text(encoding="utf-8")
+
+
+def test_planner_closes_progress_writer_when_run_ends(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "progress_file_enabled", True)
+    threads_before = len(progress_writer_threads())
+    planner = DynamicPlanner()
+    monkeypatch.setattr(planner, "_decompose_task", lambda goal: [])
+
+    planner.run("目標")
+
+    assert planner.progress_manager._writer is None
+    assert len(progress_writer_threads()) == threads_before
+
+
+def test_finish_run_closes_progress_writer(aime_config, monkeypatch, tmp_path):
+    monkeypatch.setattr(aime_config, "progress_file_enabled", True)
+    monkeypatch.setattr(aime_config, "progress_flush_interval_ms", 60_000)
+    planner = DynamicPlanner(output_dir=str(tmp_path / "out"), export_metrics=False)
+    planner.progress_manager.initialize_tasks([{"id": 0, "description": "調査", "dependencies": []}])
+    planner.progress_manager.update_task_status(0, "completed", "done")
+    monkeypatch.setattr(planner, "_generate_final_report", lambda goal: "# report")
+
+    planner._finish_run()
+
+    assert planner.progress_manager._writer is None
+    assert "✅ 調査" in (tmp_path / "out" / aime_config.progress_file).read_text(encoding="utf-8")
+
+
+def expected_index(tasks: list, durations: dict, default_duration: float) -> dict:
+    """インデックスを使わずに、タスクリストから実行可能なタスク・プリウォームの対象・優先度を計算し直す"""
+    by_id = {task["id"]: task for task in tasks}
+    dependents = {task_id: [] for task_id in by_id}
+    for task in tasks:
+        for dep_id in task["dependencies"]:
+            dependents.setdefault(dep_id, []).append(task["id"])
+
+    def deps_in(task: dict, statuses: tuple) -> bool:
+        return all(dep_id in by_id and by_id[dep_id]["status"] in statuses for dep_id in task["dependencies"])
+
+    ready = {task["id"] for task in tasks if task["status"] == "pending" and deps_in(task, ("completed",))}
+    prewarm = {
+        task["id"]
+        for task in tasks
+        if task["status"] == "pending" and task["id"] not in ready and deps_in(task, ("completed", "in_progress"))
+    }
+
+    path_length, descendants = {}, {}
+
+    def visit(task_id: int):
+        if task_id not in path_length:
+            reachable = set()
+            longest = 0.0
+            for dependent_id in dependents[task_id]:
+                visit(dependent_id)
+                longest = max(longest, path_length[dependent_id])
+                reachable |= descendants[dependent_id] | {dependent_id}
+            path_length[task_id] = durations.get(task_id, default_duration) + longest
+            descendants[task_id] = reachable
+
+    for task_id in by_id:
+        visit(task_id)
+    return {
+        "ready": ready,
+        "prewarm": prewarm,
+        "all_done": all(task["status"] in ("completed", "failed") for task in tasks),
+        "priority": {task_id: (path_length[task_id], len(descendants[task_id])) for task_id in by_id},
+    }
+
+
+def assert_index_matches(progress_manager: ProgressManagementModule, durations: dict, default_duration: float):
+    expected = expected_index(progress_manager.tasks, durations, default_duration)
+    executable = progress_manager.get_executable_tasks()
+
+    assert {task["id"] for task in executable} == expected["ready"]
+    assert {task["id"] for task in progress_manager.get_prewarm_candidates()} == expected["prewarm"]
+    assert progress_manager.are_all_tasks_done() == expected["all_done"]
+    for task_id, priority in expected["priority"].items():
+        assert progress_manager.get_task_priority(task_id) == pytest.approx(priority)
+    # 実行可能なタスクは下流の最長経路が長い順
+    path_lengths = [expected["priority"][task["id"]][0] for task in executable]
+    assert all(first >= second - 1e-9 for first, second in zip(path_lengths, path_lengths[1:]))
+
+
+def random_plan_delta(rng: random.Random, progress_manager: ProgressManagementModule) -> tuple:
+    """未着手のタスクの削除・依存関係の置き換えと、新しいタスクの追加を無作為に作る（不正な計画になる場合もある）"""
+    pending = [task["id"] for task in progress_manager.tasks if task["status"] == "pending"]
+    depended_on = {dep_id for task in progress_manager.tasks for dep_id in task["dependencies"]}
+    removable = [task_id for task_id in pending if task_id not in depended_on]
+    remove_ids = rng.sample(removable, min(len(removable), rng.randint(0, 2)))
+    kept_ids = [task["id"] for task in progress_manager.tasks if task["id"] not in remove_ids and task["status"] != "failed"]
+    upsert = [
+        {"id": task_id, "description": f"置き換えたタスク {task_id}", "dependencies": rng.sample(kept_ids, rng.randint(0, 2))}
+        for task_id in rng.sample(pending, min(len(pending), rng.randint(0, 2)))
+        if task_id not in remove_ids
+    ]
+    new_id = progress_manager.next_task_id()
+    for offset in range(rng.randint(0, 2)):
+        upsert.append({"id": new_id + offset, "description": f"追加したタスク {new_id + offset}", "dependencies": rng.sample(kept_ids, rng.randint(0, 3))})
+    return remove_ids, upsert
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_index_matches_full_recomputation(aime_config, seed):
+    rng = random.Random(seed)
+    progress_manager = ProgressManagementModule(write_to_file=False)
+    progress_manager.initialize_tasks(
+        [
+            {"id": i, "description": f"タスク {i}", "dependencies": rng.sample(range(i), min(i, rng.randint(0, 3)))}
+            for i in range(25)
+        ]
+    )
+    durations, default_duration = {}, 1.0
+    assert_index_matches(progress_manager, durations, default_duration)
+
+    for _ in range(80):
+        operation = rng.choices(["status", "delta", "durations"], weights=[6, 3, 1])[0]
+        if operation == "status":
+            task = rng.choice(progress_manager.tasks)
+            status = rng.choices(["pending", "in_progress", "completed", "failed"], weights=[2, 3, 4, 1])[0]
+            progress_manager.update_task_status(task["id"], status, f"{status} result")
+        elif operation == "delta":
+            remove_ids, upsert = random_plan_delta(rng, progress_manager)
+            before = copy.deepcopy(progress_manager.tasks)
+            try:
+                progress_manager.apply_plan_delta(remove_ids, upsert)
+            except ValueError:
+                # 不正な計画は適用されず、インデックスも変わらない
+                assert progress_manager.tasks == before
+        else:
+            estimates = {task["id"]: rng.uniform(0.5, 3.0) for task in rng.sample(progress_manager.tasks, 3)}
+            default = rng.choice([None, rng.uniform(0.5, 2.0)])
+            progress_manager.set_duration_estimates(estimates, default)
+            durations.update(estimates)
+            default_duration = default if default is not None else default_duration
+        assert_index_matches(progress_manager, durations, default_duration)
@@ -0,0 +1,63 @@
+"""
+レート制限（TokenBucket / ModelRateLimiter）のテスト
+"""
+
+import pytest
+
+from aime.rate_limiter import ModelRateLimiter, TokenBucket, backoff_delay, parse_retry_after
+
+
+def test_bucket_capacity_is_a_few_seconds_of_the_rate(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "llm_rate_limit_burst_seconds", 5.0)
+    limiter = ModelRateLimiter()
+    limiter.configure("m", requests_per_minute=600, tokens_per_minute=60_000)
+    limits = limiter._get("m")
+
+    assert limits.requests.capacity == pytest.approx(50)
+    assert limits.tokens.capacity == pytest.approx(5_000)
+    # 開始直後に送れるのは容量分だけで、1分間の上限をまとめて送ることはできない
+    assert all(limits.requests._reserve(1) == 0 for _ in range(50))
+    assert limits.requests._reserve(1) == pytest.approx(0.1, abs=0.01)
+
+
+def test_small_limits_keep_at_least_one_request(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "llm_rate_limit_burst_seconds", 5.0)
+    limiter = ModelRateLimiter()
+    limiter.configure("m", requests_per_minute=3, tokens_per_minute=None)
+
+    assert limiter._get("m").requests.capacity == 1
+    assert limiter._get("m").tokens is None
+
+
+def test_request_larger_than_capacity_is_charged_in_full():
+    bucket = TokenBucket(rate=10, capacity=5)
+
+    # 満杯なら容量を超える要求も通すが、不足分は後続の取得を待たせる
+    assert bucket._reserve(20) == 0
+    assert bucket._reserve(1) == pytest.approx((1 + 15) / 10, abs=0.01)
+
+
+def test_adjust_returns_overestimated_tokens():
+    bucket = TokenBucket(rate=10, capacity=10)
+    assert bucket._reserve(10) == 0
+
+    bucket.adjust(-4)
+
+    assert bucket._reserve(4) == 0
+    assert bucket._reserve(1) > 0
+
+
+def test_block_drains_bucket():
+    bucket = TokenBucket(rate=100, capacity=100)
+
+    bucket.block_for(0.05, drain=True)
+
+    assert bucket._reserve(1) == pytest.approx(0.05, abs=0.01)
+
+
+def test_retry_after_and_backoff():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("invalid") is None
+    assert backoff_delay(0, base=2.0, maximum=60.0, retry_after=7.0) == 7.0
+    assert 1.0 <= backoff_delay(0, base=2.0, maximum=60.0) <= 3.0
+    assert backoff_delay(10, base=2.0, maximum=60.0) <= 90.0
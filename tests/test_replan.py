@@ -0,0 +1,223 @@
+"""
+失敗したタスクの下流だけを修正する再計画（_refine_subgraph / apply_plan_delta / _replan）のテスト
+再計画のLLM呼び出しは、応答形式（差分か計画全体か）ごとに用意した応答を返すスタブに置き換える
+"""
+
+import asyncio
+import copy
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from aime.llm_client import llm_client
+from aime.planner import DynamicPlanner, PlanDelta, TasksList
+from aime.progress_manager import ProgressManagementModule
+
+# タスク0の失敗はタスク1だけに影響し、タスク2→3→4の枝とは独立している
+PLAN = [
+    {"id": 0, "description": "東京のホテルを調べる", "dependencies": []},
+    {"id": 1, "description": "ホテルの料金を比較する", "dependencies": [0]},
+    {"id": 2, "description": "東京の観光地を調べる", "dependencies": []},
+    {"id": 3, "description": "観光地の営業時間を調べる", "dependencies": [2]},
+    {"id": 4, "description": "観光ルートをまとめる", "dependencies": [3]},
+]
+# タスク0を別の調べ方のタスク5に置き換え、タスク1の依存先を付け替える差分
+REPLACEMENT_DELTA = {
+    "remove_ids": [0],
+    "upsert": [
+        {"id": 5, "description": "旅行サイトで東京のホテルを調べる", "dependencies": []},
+        {"id": 1, "description": "ホテルの料金を比較する", "dependencies": [5]},
+    ],
+}
+
+
+def response(content: dict):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content, ensure_ascii=False)))])
+
+
+class ScriptedLLM:
+    """差分（PlanDelta）と計画全体（TasksList）の再計画に、それぞれ決まった応答を返すスタブ"""
+
+    def __init__(self, delta: dict = None, full_plan: list = None, before_delta=None):
+        self.delta = delta
+        self.full_plan = full_plan
+        self.before_delta = before_delta
+        self.calls = []
+
+    def __call__(self, messages, response_format=None, **kwargs):
+        if response_format is PlanDelta:
+            self.calls.append("subgraph")
+            if self.before_delta is not None:
+                self.before_delta()
+            return response(self.delta)
+        assert response_format is TasksList
+        self.calls.append("full")
+        return response({"tasks": self.full_plan})
+
+
+def make_planner(monkeypatch, llm: ScriptedLLM, tasks: list = PLAN) -> DynamicPlanner:
+    monkeypatch.setattr(llm_client, "completion", llm)
+    planner = DynamicPlanner(max_parallel_actors=4, export_metrics=False)
+    planner.main_goal = "東京旅行の計画"
+    planner.progress_manager.initialize_tasks(copy.deepcopy(tasks))
+    monkeypatch.setattr(planner.factory, "prepare_personas", lambda subtasks: None)
+    return planner
+
+
+def snapshot(progress_manager: ProgressManagementModule) -> list:
+    return copy.deepcopy(progress_manager.tasks)
+
+
+@pytest.mark.parametrize(
+    "delta",
+    [
+        {"remove_ids": [2], "upsert": []},
+        {"remove_ids": [], "upsert": [{"id": 3, "description": "別の調査", "dependencies": []}]},
+    ],
+    ids=["remove", "overwrite"],
+)
+def test_refine_subgraph_rejects_changes_outside_scope(aime_config, monkeypatch, delta):
+    planner = make_planner(monkeypatch, ScriptedLLM(delta=delta))
+    planner.progress_manager.update_task_status(0, "failed", "見つかりませんでした")
+    before = snapshot(planner.progress_manager)
+
+    with pytest.raises(ValueError, match="修正対象外"):
+        planner._refine_subgraph(0, "タスク0が失敗しました")
+
+    assert planner.progress_manager.tasks == before
+    assert planner.progress_manager.replan_history == []
+
+
+@pytest.mark.parametrize(
+    "remove_ids, upsert, message",
+    [
+        ([2], [], "in_progress"),
+        ([], [{"id": 3, "description": "別の調査", "dependencies": []}], "completed"),
+        ([], [{"id": 5, "description": "追加の調査", "dependencies": [9]}], "存在しません"),
+        ([], [{"id": 5, "description": "追加の調査", "dependencies": [4]}], "失敗したタスク"),
+        ([], [{"id": 1, "description": "料金を比較する", "dependencies": [5]}, {"id": 5, "description": "追加の調査", "dependencies": [1]}], "循環依存"),
+    ],
+    ids=["in-progress", "completed", "missing-dependency", "failed-dependency", "cycle"],
+)
+def test_apply_plan_delta_rejects_invalid_delta_without_changes(aime_config, remove_ids, upsert, message):
+    progress_manager = ProgressManagementModule(write_to_file=False)
+    progress_manager.initialize_tasks(copy.deepcopy(PLAN))
+    progress_manager.update_task_status(2, "in_progress")
+    progress_manager.update_task_status(3, "completed", "9時から17時")
+    progress_manager.update_task_status(4, "failed", "まとめられませんでした")
+    before = snapshot(progress_manager)
+    executable_before = [task["id"] for task in progress_manager.get_executable_tasks()]
+
+    with pytest.raises(ValueError, match=message):
+        progress_manager.apply_plan_delta(remove_ids, upsert)
+
+    # 検証に失敗した差分は一部も適用しない
+    assert progress_manager.tasks == before
+    assert [task["id"] for task in progress_manager.get_executable_tasks()] == executable_before
+    progress_manager.close()
+
+
+def test_replan_falls_back_to_full_plan_when_subgraph_fails(aime_config, monkeypatch):
+    full_plan = [
+        {"id": 5, "description": "旅行サイトで東京のホテルを調べる", "dependencies": []},
+        {"id": 1, "description": "ホテルの料金を比較する", "dependencies": [5]},
+        *PLAN[2:],
+    ]
+    # 差分がタスク1と新しいタスク5の循環依存を作るため、計画全体の再生成に切り替える
+    cyclic = {
+        "remove_ids": [0],
+        "upsert": [
+            {"id": 1, "description": "ホテルの料金を比較する", "dependencies": [5]},
+            {"id": 5, "description": "旅行サイトで東京のホテルを調べる", "dependencies": [1]},
+        ],
+    }
+    llm = ScriptedLLM(delta=cyclic, full_plan=full_plan)
+    planner = make_planner(monkeypatch, llm)
+    planner.progress_manager.update_task_status(0, "failed", "見つかりませんでした")
+
+    planner._replan(0, "タスク0が失敗しました")
+
+    assert llm.calls == ["subgraph", "full"]
+    assert [history["scope"] for history in planner.progress_manager.replan_history] == ["full"]
+    assert planner.progress_manager.get_task(0) is None
+    assert planner.progress_manager.get_task(1)["dependencies"] == [5]
+    assert sorted(task["id"] for task in planner.progress_manager.get_executable_tasks()) == [2, 5]
+
+
+class BranchActor:
+    """タスク0だけ失敗し、それ以外は成功するスタブ（タスクごとの終了時刻を記録する）"""
+
+    def __init__(self):
+        self.finished = {}
+
+    def _report(self, task: dict) -> tuple:
+        self.finished[task["id"]] = time.monotonic()
+        status = "failure" if task["id"] == 0 else "success"
+        return task["id"], json.dumps({"status": status, "message": f"result {task['id']}"})
+
+    def run(self, task: dict) -> tuple:
+        time.sleep(0.02)
+        return self._report(task)
+
+    async def arun(self, task: dict) -> tuple:
+        await asyncio.sleep(0.02)
+        return self._report(task)
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_independent_branch_keeps_running_during_replan(aime_config, monkeypatch, mode):
+    actor = BranchActor()
+    replan_started = threading.Event()
+    planner = None
+
+    def wait_for_independent_branch():
+        # 再計画のLLM呼び出しが終わらない間も、独立した枝のタスク2→3→4は最後まで実行される
+        replan_started.set()
+        deadline = time.monotonic() + 5
+        while planner.progress_manager.get_task(4)["status"] != "completed":
+            assert time.monotonic() < deadline, "再計画中に独立した枝が実行されませんでした"
+            time.sleep(0.01)
+
+    planner = make_planner(monkeypatch, ScriptedLLM(delta=REPLACEMENT_DELTA, before_delta=wait_for_independent_branch))
+    planner._execute_task_wrapper = actor.run
+    planner._aexecute_task_wrapper = actor.arun
+
+    if mode == "sync":
+        planner._dispatch_tasks()
+    else:
+        asyncio.run(planner._adispatch_tasks(max_concurrency=4))
+
+    assert replan_started.is_set()
+    assert actor.finished[4] < actor.finished[5]
+    assert planner.progress_manager.get_task(0) is None
+    assert all(task["status"] == "completed" for task in planner.progress_manager.tasks)
+
+
+def test_claim_executable_tasks_marks_claimed_tasks_in_progress(aime_config):
+    progress_manager = ProgressManagementModule(write_to_file=False)
+    progress_manager.initialize_tasks(copy.deepcopy(PLAN))
+
+    # 下流の鎖が長いタスク2を先に選ぶ
+    claimed = progress_manager.claim_executable_tasks(1)
+
+    assert [task["id"] for task in claimed] == [2]
+    assert progress_manager.get_task(2)["status"] == "in_progress"
+    # 取得済みのタスクは再び返さない
+    assert [task["id"] for task in progress_manager.claim_executable_tasks(5)] == [0]
+    assert progress_manager.claim_executable_tasks(5) == []
+    assert progress_manager.claim_executable_tasks(0) == []
+    progress_manager.close()
+
+
+def test_report_for_task_removed_by_replan_is_ignored(aime_config, monkeypatch):
+    planner = make_planner(monkeypatch, ScriptedLLM())
+    planner.progress_manager.update_tasks(copy.deepcopy(PLAN[2:]))
+
+    report = json.dumps({"status": "success", "message": "1泊1万円"}, ensure_ascii=False)
+
+    assert planner._process_task_report(0, report) is None
+    assert planner.progress_manager.get_task(0) is None
+    assert planner.knowledge_index.search("1泊1万円") == []
@@ -0,0 +1,57 @@
+"""
+ResultStore（依存タスクへの結果の受け渡し）のテスト
+"""
+
+import threading
+
+from aime.result_store import ResultStore
+
+
+def test_add_defers_indexing_to_background(aime_config, monkeypatch):
+    release = threading.Event()
+    store = ResultStore()
+    original = ResultStore._ensure_indexed
+
+    def slow_index(entry):
+        release.wait(5)
+        original(entry)
+
+    monkeypatch.setattr(ResultStore, "_ensure_indexed", staticmethod(slow_index))
+    store.add(0, "調査", "東京のホテルの料金は1泊1万円です。")
+
+    # 呼び出し側は分割の完了を待たずに戻り、依存先は上限の秒数まで待つ
+    assert store._pending_futures([0])
+    store.wait([0], timeout=0.05)
+    assert store._pending_futures([0])
+
+    release.set()
+    store.wait([0], timeout=5)
+    assert not store._pending_futures([0])
+    assert "1泊1万円" in store.build_context([0], "ホテルの料金")
+    store.close()
+
+
+def test_build_context_indexes_results_added_after_close(aime_config):
+    store = ResultStore()
+    store.close()
+    store.add(0, "調査", "京都の観光地は清水寺です。")
+
+    context = store.build_context([0], "京都の観光地")
+
+    assert "## タスク0の結果概要:" in context
+    assert "清水寺" in context
+
+
+def test_long_result_gets_excerpts_relevant_to_query(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "result_summary_min_tokens", 10)
+    store = ResultStore()
+    result = "\n\n".join(
+        ["東京のホテルの料金は1泊1万円です。", "大阪の天気は晴れです。", "京都の観光地は清水寺です。"] * 3
+    )
+    store.add(0, "調査", result)
+    store.wait([0], timeout=5)
+
+    context = store.build_context([0], "京都の観光地", token_budget=60)
+
+    assert "清水寺" in context
+    store.close()
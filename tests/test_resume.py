@@ -0,0 +1,109 @@
+"""
+ジャーナルからの再開（resume / aresume）のテスト
+実行ループの途中で中断した実行を再開し、完了済みのタスクを飛ばして、実行中だったタスクを再実行することを確かめる
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from aime.planner import DynamicPlanner
+from aime.run_journal import RunJournal
+
+RUN_ID = "interrupted-run"
+SUBTASKS = [
+    {"id": 0, "description": "東京のホテルを調べる", "dependencies": []},
+    {"id": 1, "description": "東京の観光地を調べる", "dependencies": []},
+    {"id": 2, "description": "ホテルの周辺情報を調べる", "dependencies": [0]},
+    {"id": 3, "description": "旅行プランをまとめる", "dependencies": [1, 2]},
+]
+
+
+class Interrupted(BaseException):
+    """プロセスの中断（Ctrl+Cなど）の代わりに、実行ループの外まで伝わる例外"""
+
+
+def report(task: dict) -> tuple:
+    return task["id"], json.dumps({"status": "success", "message": f"result {task['id']}"}, ensure_ascii=False)
+
+
+def wait_for_status(planner: DynamicPlanner, task_id: int, status: str):
+    deadline = time.monotonic() + 5
+    while planner.progress_manager.get_task(task_id)["status"] != status:
+        assert time.monotonic() < deadline, f"タスク {task_id} が {status} になりませんでした"
+        time.sleep(0.01)
+
+
+def make_planner(monkeypatch) -> DynamicPlanner:
+    planner = DynamicPlanner(max_parallel_actors=2, run_id=RUN_ID, export_metrics=False)
+    monkeypatch.setattr(planner.factory, "prepare_personas", lambda subtasks: None)
+    monkeypatch.setattr(planner, "_generate_final_report", lambda goal: "# 最終報告書")
+    return planner
+
+
+def interrupt_run(monkeypatch):
+    """タスク0が完了し、タスク1と2が実行中の時点で実行を中断する"""
+    planner = make_planner(monkeypatch)
+    monkeypatch.setattr(planner, "_decompose_task", lambda goal: [dict(task) for task in SUBTASKS])
+    release = threading.Event()
+
+    def execute(task: dict) -> tuple:
+        if task["id"] == 1:
+            # タスク0の完了が記録され、タスク2が開始されてから中断する
+            wait_for_status(planner, 2, "in_progress")
+            raise Interrupted()
+        if task["id"] == 2:
+            release.wait(5)
+        return report(task)
+
+    monkeypatch.setattr(planner, "_execute_task_wrapper", execute)
+    with pytest.raises(Interrupted):
+        # 中断時に実行中だったタスク2の終了を待つため、別スレッドで解放する
+        threading.Timer(0.2, release.set).start()
+        planner.run("東京旅行の計画")
+    planner._close_journal()
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_resume_skips_completed_tasks_and_reruns_in_progress(aime_config, monkeypatch, mode):
+    monkeypatch.setattr(aime_config, "journal_enabled", True)
+    interrupt_run(monkeypatch)
+    statuses = {}
+    for event in RunJournal.load(f"{aime_config.runs_dir}/{RUN_ID}"):
+        if event["type"] == "status":
+            statuses[event["task_id"]] = event["status"]
+    assert statuses == {0: "completed", 1: "in_progress", 2: "in_progress"}
+
+    planner = make_planner(monkeypatch)
+    executed = []
+
+    def execute(task: dict) -> tuple:
+        executed.append(task["id"])
+        return report(task)
+
+    async def aexecute(task: dict) -> tuple:
+        return execute(task)
+
+    monkeypatch.setattr(planner, "_execute_task_wrapper", execute)
+    monkeypatch.setattr(planner, "_aexecute_task_wrapper", aexecute)
+    if mode == "sync":
+        planner.resume(RUN_ID)
+    else:
+        asyncio.run(planner.aresume(RUN_ID, max_concurrency=2))
+
+    # 完了済みのタスク0は実行せず、実行中だったタスク1, 2と未着手のタスク3だけを実行する
+    assert sorted(executed) == [1, 2, 3]
+    assert executed[-1] == 3
+    assert all(task["status"] == "completed" for task in planner.progress_manager.tasks)
+    assert planner.progress_manager.tasks[0]["result"] == "result 0"
+    events = RunJournal.load(f"{aime_config.runs_dir}/{RUN_ID}")
+    assert [event["reset_task_ids"] for event in events if event["type"] == "resumed"] == [[1, 2]]
+    assert events[-1]["type"] == "final"
+
+    # 最終報告書まで完了した実行は、再開してもタスクを実行しない
+    executed.clear()
+    make_planner(monkeypatch).resume(RUN_ID)
+    assert executed == []
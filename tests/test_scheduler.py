@@ -0,0 +1,196 @@
+"""
+実行ループ（_dispatch_tasks / _adispatch_tasks）のテスト
+Actorを一定時間で完了するスタブに置き換え、依存タスクの完了から下流のタスクの開始までの遅れを測る
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from aime.planner import DynamicPlanner
+
+TASK_SECONDS = 0.02
+# 依存タスクの完了から下流のタスクの開始までに許容する遅れ（ポーリングの間隔よりも十分短い）
+MAX_START_DELAY = 0.1
+
+
+def wide_dag(width: int) -> list:
+    return [{"id": i, "description": f"task {i}", "dependencies": []} for i in range(width)]
+
+
+def deep_dag(depth: int) -> list:
+    return [{"id": i, "description": f"task {i}", "dependencies": [i - 1] if i else []} for i in range(depth)]
+
+
+def diamond_dag(width: int) -> list:
+    middle = [{"id": i, "description": f"task {i}", "dependencies": [0]} for i in range(1, width + 1)]
+    return [
+        {"id": 0, "description": "task 0", "dependencies": []},
+        *middle,
+        {"id": width + 1, "description": f"task {width + 1}", "dependencies": [task["id"] for task in middle]},
+    ]
+
+
+class StubActor:
+    """タスクごとの開始・終了時刻を記録し、成功の報告を返すスタブ"""
+
+    def __init__(self, durations: dict = None, failures: set = ()):
+        self.durations = durations or {}
+        self.failures = set(failures)
+        self.started = {}
+        self.finished = {}
+        self._lock = threading.Lock()
+
+    def _report(self, task: dict) -> tuple:
+        status = "failure" if task["id"] in self.failures else "success"
+        return task["id"], json.dumps({"status": status, "message": f"result {task['id']}"})
+
+    def run(self, task: dict) -> tuple:
+        with self._lock:
+            self.started[task["id"]] = time.monotonic()
+        time.sleep(self.durations.get(task["id"], TASK_SECONDS))
+        with self._lock:
+            self.finished[task["id"]] = time.monotonic()
+        return self._report(task)
+
+    async def arun(self, task: dict) -> tuple:
+        self.started[task["id"]] = time.monotonic()
+        await asyncio.sleep(self.durations.get(task["id"], TASK_SECONDS))
+        self.finished[task["id"]] = time.monotonic()
+        return self._report(task)
+
+
+def make_planner(tasks: list, stub: StubActor, max_parallel_actors: int = 4) -> DynamicPlanner:
+    planner = DynamicPlanner(max_parallel_actors=max_parallel_actors, export_metrics=False)
+    planner.main_goal = "test"
+    planner.progress_manager.initialize_tasks(tasks)
+    planner._execute_task_wrapper = stub.run
+    planner._aexecute_task_wrapper = stub.arun
+    return planner
+
+
+def assert_dependents_start_promptly(tasks: list, stub: StubActor):
+    for task in tasks:
+        if not task["dependencies"]:
+            continue
+        last_dependency_end = max(stub.finished[dep_id] for dep_id in task["dependencies"])
+        delay = stub.started[task["id"]] - last_dependency_end
+        assert 0 <= delay < MAX_START_DELAY, f"タスク {task['id']} の開始が {delay:.3f}秒 遅れました"
+
+
+def assert_all_completed(planner: DynamicPlanner):
+    assert planner.progress_manager.are_all_tasks_done()
+    assert all(task["status"] == "completed" for task in planner.progress_manager.tasks)
+
+
+@pytest.mark.parametrize("tasks", [deep_dag(20), diamond_dag(6)], ids=["deep", "diamond"])
+def test_dependents_start_when_last_dependency_finishes(aime_config, tasks):
+    stub = StubActor()
+    planner = make_planner(tasks, stub)
+
+    planner._dispatch_tasks()
+
+    assert_all_completed(planner)
+    assert_dependents_start_promptly(tasks, stub)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tasks", [deep_dag(20), diamond_dag(6)], ids=["deep", "diamond"])
+async def test_async_dependents_start_when_last_dependency_finishes(aime_config, tasks):
+    stub = StubActor()
+    planner = make_planner(tasks, stub)
+
+    await planner._adispatch_tasks(max_concurrency=4)
+
+    assert_all_completed(planner)
+    assert_dependents_start_promptly(tasks, stub)
+
+
+def test_slow_sibling_does_not_delay_independent_branch(aime_config):
+    # 0 -> 1 は短く、2 は長い。1 は 2 の完了を待たずに開始する
+    tasks = [
+        {"id": 0, "description": "fast", "dependencies": []},
+        {"id": 1, "description": "after fast", "dependencies": [0]},
+        {"id": 2, "description": "slow", "dependencies": []},
+    ]
+    stub = StubActor(durations={2: 0.5})
+    planner = make_planner(tasks, stub)
+
+    planner._dispatch_tasks()
+
+    assert_all_completed(planner)
+    assert stub.started[1] < stub.finished[2]
+    assert_dependents_start_promptly(tasks, stub)
+
+
+def test_wide_dag_uses_all_workers(aime_config):
+    tasks = wide_dag(40)
+    stub = StubActor()
+    planner = make_planner(tasks, stub, max_parallel_actors=8)
+
+    started = time.monotonic()
+    planner._dispatch_tasks()
+    elapsed = time.monotonic() - started
+
+    assert_all_completed(planner)
+    # 40件を8並列で実行すると5段分。ループのオーバーヘッドは1段あたり MAX_START_DELAY 未満に収まる
+    waves = len(tasks) // 8
+    assert elapsed < waves * (TASK_SECONDS + MAX_START_DELAY)
+
+
+@pytest.mark.parametrize("mode", ["thread", "async"])
+def test_loop_overhead_is_bounded_on_deep_dag(aime_config, mode):
+    tasks = deep_dag(30)
+    stub = StubActor()
+    planner = make_planner(tasks, stub)
+
+    started = time.monotonic()
+    if mode == "thread":
+        planner._dispatch_tasks()
+    else:
+        asyncio.run(planner._adispatch_tasks(max_concurrency=4))
+    elapsed = time.monotonic() - started
+
+    assert_all_completed(planner)
+    busy = sum(stub.finished[task_id] - stub.started[task_id] for task_id in stub.started)
+    overhead_per_task = (elapsed - busy) / len(tasks)
+    assert overhead_per_task < 0.05, f"1タスクあたりのオーバーヘッドが {overhead_per_task:.3f}秒 です"
+
+
+@pytest.mark.parametrize("mode", ["thread", "async"])
+def test_deadlock_replans_are_capped(aime_config, monkeypatch, mode):
+    monkeypatch.setattr(aime_config, "deadlock_max_replans", 2)
+    monkeypatch.setattr(aime_config, "deadlock_backoff_seconds", 0.05)
+    # タスク0が失敗し、再計画でも依存関係が解消されないため、タスク1は実行できないまま残る
+    tasks = [
+        {"id": 0, "description": "fails", "dependencies": []},
+        {"id": 1, "description": "blocked", "dependencies": [0]},
+        {"id": 2, "description": "also blocked", "dependencies": [1]},
+    ]
+    stub = StubActor(failures={0})
+    planner = make_planner(tasks, stub)
+    replans = []
+    replan_times = []
+
+    def stub_replan(failed_task_id, trigger_reason):
+        replans.append(failed_task_id)
+        replan_times.append(time.monotonic())
+
+    planner._replan = stub_replan
+
+    if mode == "thread":
+        planner._dispatch_tasks()
+    else:
+        asyncio.run(planner._adispatch_tasks(max_concurrency=4))
+
+    # 失敗による再計画1回と、デッドロックによる再計画が上限の2回
+    assert replans == [0, None, None]
+    # 2回目のデッドロックの再計画は、間隔を空けてから行う
+    assert replan_times[2] - replan_times[1] >= 0.05
+    assert planner.progress_manager.are_all_tasks_done()
+    statuses = {task["id"]: task["status"] for task in planner.progress_manager.tasks}
+    assert statuses == {0: "failed", 1: "failed", 2: "failed"}
+    assert stub.started.keys() == {0}
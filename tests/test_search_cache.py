@@ -0,0 +1,185 @@
+"""
+検索結果キャッシュ（SearchCache）のテスト
+クエリの正規化・TTL・同時実行の集約・永続化ファイルの読み書きを確かめる（実際の検索はスタブに置き換える）
+"""
+
+import json
+import threading
+
+import pytest
+
+from aime import progress_writer, tools
+from aime import search_cache as search_cache_module
+from aime.search_cache import SearchCache, normalize_query
+
+
+class Clock:
+    """time.time() の代わりに、テストから進める時計"""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(search_cache_module.time, "time", clock)
+    return clock
+
+
+class CountingFetch:
+    """呼ばれた回数を数え、release されるまで結果を返さない検索のスタブ"""
+
+    def __init__(self, blocking: bool = False):
+        self.calls = 0
+        self.release = threading.Event()
+        if not blocking:
+            self.release.set()
+
+    def __call__(self, query: str, *args) -> tuple:
+        self.calls += 1
+        self.release.wait(5)
+        return f"{query} の検索結果", True
+
+
+@pytest.mark.parametrize(
+    "variant", ['"東京 ホテル"', "東京 ホテル", "「東京　ホテル」", "  東京   ホテル ", "ＴＯＫＹＯ ホテル"]
+)
+def test_normalize_query_absorbs_quotes_and_spacing(variant):
+    expected = "tokyo ホテル" if "ＴＯＫＹＯ" in variant else "東京 ホテル"
+    assert normalize_query(variant) == expected
+
+
+@pytest.fixture
+def cached_tools(aime_config, monkeypatch):
+    """ツールの共有キャッシュを新しいものに置き換え、実際の検索をスタブにする"""
+    cache = SearchCache(persist_path="")
+    fetch = CountingFetch()
+    monkeypatch.setattr(tools, "search_cache", cache)
+    monkeypatch.setattr(tools, "_google_search_uncached", fetch)
+    monkeypatch.setattr(tools, "_web_search_uncached", fetch)
+    monkeypatch.setattr(aime_config, "google_api_key", "test-key")
+    monkeypatch.setattr(aime_config, "google_cse_id", "test-cse")
+    return cache, fetch
+
+
+@pytest.mark.parametrize("tool", ["google_search", "web_search"])
+def test_quoted_and_unquoted_queries_share_cache_entry(cached_tools, tool):
+    cache, fetch = cached_tools
+    search = getattr(tools, tool)
+
+    first = search('"東京 ホテル"')
+    second = search("東京　ホテル")
+
+    assert first == second
+    assert fetch.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_entries_expire_after_ttl(aime_config, clock):
+    cache = SearchCache(ttl_seconds=60, persist_path="")
+    fetch = CountingFetch()
+
+    cache.get_or_fetch("google", "東京 ホテル", lambda: fetch("東京 ホテル"))
+    clock.now += 60
+    cache.get_or_fetch("google", "東京 ホテル", lambda: fetch("東京 ホテル"))
+    assert fetch.calls == 1
+
+    clock.now += 1
+    cache.get_or_fetch("google", "東京 ホテル", lambda: fetch("東京 ホテル"))
+    assert fetch.calls == 2
+
+
+@pytest.mark.parametrize("tool", ["google_search", "web_search"])
+def test_concurrent_identical_queries_are_collapsed(cached_tools, tool, monkeypatch):
+    cache, _ = cached_tools
+    fetch = CountingFetch(blocking=True)
+    monkeypatch.setattr(tools, "_google_search_uncached", fetch)
+    monkeypatch.setattr(tools, "_web_search_uncached", fetch)
+    search = getattr(tools, tool)
+    results = []
+    threads = [
+        threading.Thread(target=lambda query=query: results.append(search(query)))
+        for query in ["東京 ホテル", '"東京 ホテル"', "東京　ホテル", "東京 ホテル"]
+    ]
+    for thread in threads:
+        thread.start()
+
+    # 全てのスレッドが最初の1件の検索を待つまで、検索を完了させない
+    for _ in range(500):
+        if cache.stats()["collapsed"] == len(threads) - 1:
+            break
+        threading.Event().wait(0.01)
+    fetch.release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert fetch.calls == 1
+    assert cache.stats()["collapsed"] == len(threads) - 1
+    assert len(results) == len(threads)
+    assert len(set(results)) == 1
+
+
+def test_persisted_entries_round_trip(aime_config, tmp_path):
+    path = tmp_path / "cache" / "search.json"
+    cache = SearchCache(persist_path=str(path))
+    cache.get_or_fetch("google", "東京 ホテル", lambda: ("ホテルの検索結果", True))
+    cache.get_or_fetch("google", "検索エラー", lambda: ("検索中にエラーが発生しました", False))
+    cache.close()
+
+    # キャッシュしてよい結果だけが保存され、次の実行では検索せずに返す
+    assert list(json.loads(path.read_text(encoding="utf-8"))) == ["google:東京 ホテル"]
+    restored = SearchCache(persist_path=str(path))
+    fetch = CountingFetch()
+    assert restored.get_or_fetch("google", '"東京 ホテル"', lambda: fetch("東京 ホテル")) == "ホテルの検索結果"
+    assert fetch.calls == 0
+
+
+def test_load_drops_expired_entries_and_trims_to_max_entries(aime_config, tmp_path, clock):
+    path = tmp_path / "search.json"
+    stored = {
+        "google:期限切れ": [clock.now - 120, "古い結果"],
+        "google:クエリ1": [clock.now - 10, "結果1"],
+        "google:クエリ2": [clock.now - 5, "結果2"],
+        "google:クエリ3": [clock.now - 1, "結果3"],
+    }
+    path.write_text(json.dumps(stored, ensure_ascii=False), encoding="utf-8")
+
+    cache = SearchCache(ttl_seconds=60, max_entries=2, persist_path=str(path))
+
+    fetch = CountingFetch()
+    assert cache.get_or_fetch("google", "クエリ3", lambda: fetch("クエリ3")) == "結果3"
+    assert cache.stats()["entries"] == 2
+    assert cache.get_or_fetch("google", "クエリ2", lambda: fetch("クエリ2")) == "結果2"
+    assert fetch.calls == 0
+    # 最大件数を超えた古いエントリと期限切れのエントリは読み込まない
+    cache.get_or_fetch("google", "クエリ1", lambda: fetch("クエリ1"))
+    cache.get_or_fetch("google", "期限切れ", lambda: fetch("期限切れ"))
+    assert fetch.calls == 2
+    cache.close()
+
+
+def test_saves_are_coalesced_in_background(aime_config, monkeypatch, tmp_path):
+    monkeypatch.setattr(aime_config, "search_cache_flush_interval_ms", 60_000)
+    writes = []
+    original = progress_writer.atomic_write_text
+
+    def counting_write(filepath: str, content: str):
+        writes.append(filepath)
+        original(filepath, content)
+
+    monkeypatch.setattr(progress_writer, "atomic_write_text", counting_write)
+    path = tmp_path / "search.json"
+    cache = SearchCache(persist_path=str(path))
+
+    for i in range(20):
+        cache.get_or_fetch("google", f"クエリ{i}", lambda i=i: (f"結果{i}", True))
+
+    # 検索のたびにファイル全体を書き直さず、最小間隔の間の追加は終了時の1回にまとめる
+    assert len(writes) <= 1
+    cache.close()
+    assert len(writes) <= 2
+    assert len(json.loads(path.read_text(encoding="utf-8"))) == 20
@@ -0,0 +1,147 @@
+"""
+Google検索クライアント（GoogleSearchClient / get_google_search_client）のテスト
+APIのサービスオブジェクトはスタブに置き換え、応答（成功・HTTPエラー・接続エラー）をテストから指定する
+"""
+
+import threading
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from aime import search_client, tools
+from aime.search_client import GoogleSearchClient
+
+ITEMS = {"items": [{"title": "ホテルA", "snippet": "1泊1万円", "link": "https://example.com/a"}]}
+
+
+def http_error(status: int, retry_after: str = None) -> HttpError:
+    headers = {"status": status}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    return HttpError(httplib2.Response(headers), b"error")
+
+
+class FakeService:
+    """cse().list(...).execute(http=...) の呼び出しを記録し、指定した応答を順に返すサービスオブジェクト"""
+
+    def __init__(self):
+        self.outcomes = []
+        self.https = []
+        self._lock = threading.Lock()
+
+    def cse(self):
+        return self
+
+    def list(self, q: str, cx: str, num: int):
+        return self
+
+    def execute(self, http):
+        with self._lock:
+            self.https.append(http)
+            outcome = self.outcomes.pop(0) if self.outcomes else ITEMS
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def service(aime_config, monkeypatch):
+    service = FakeService()
+    builds = []
+
+    def build(*args, **kwargs):
+        builds.append(kwargs.get("developerKey"))
+        return service
+
+    monkeypatch.setattr(search_client, "build", build)
+    monkeypatch.setattr(tools, "_google_client", None)
+    monkeypatch.setattr(aime_config, "google_api_key", "key-1")
+    monkeypatch.setattr(aime_config, "google_cse_id", "cse-1")
+    service.builds = builds
+    return service
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    # 待機はモジュールの time.sleep だけを置き換えて記録する（リミッタなど他の待機には影響させない）
+    monkeypatch.setattr(search_client, "time", SimpleNamespace(sleep=delays.append))
+    return delays
+
+
+def test_shared_client_is_built_once_and_rebuilt_when_key_changes(service, aime_config, monkeypatch):
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(tools.get_google_search_client())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 全スレッドが同じクライアントを使い、サービスオブジェクトの構築は1回だけ
+    assert len({id(client) for client in clients}) == 1
+    assert service.builds == ["key-1"]
+
+    monkeypatch.setattr(aime_config, "google_api_key", "key-2")
+    assert tools.get_google_search_client() is not clients[0]
+    assert service.builds == ["key-1", "key-2"]
+
+
+def test_http_connection_is_reused_per_thread(service):
+    client = GoogleSearchClient("key", "cse", requests_per_minute=6000)
+    client.search("東京 ホテル")
+    client.search("京都 観光")
+    other = threading.Thread(target=client.search, args=("大阪 名物",))
+    other.start()
+    other.join()
+
+    # 同じスレッドでは接続を使い回し、別のスレッドは自分の接続を使う
+    assert service.https[0] is service.https[1]
+    assert service.https[2] is not service.https[0]
+
+
+def test_broken_connection_is_replaced(service, sleeps):
+    client = GoogleSearchClient("key", "cse", requests_per_minute=6000)
+    client.search("東京 ホテル")
+    service.outcomes = [ConnectionResetError("切断されました")]
+
+    assert client.search("京都 観光") == ITEMS
+
+    assert service.https[0] is service.https[1]
+    assert service.https[2] is not service.https[1]
+
+
+def test_rate_limit_honors_retry_after_and_blocks_shared_limiter(service, sleeps, monkeypatch):
+    client = GoogleSearchClient("key", "cse", requests_per_minute=6000)
+    blocked = []
+    monkeypatch.setattr(client.rate_limiter, "block_for", lambda seconds, drain=False: blocked.append(seconds))
+    service.outcomes = [http_error(429, retry_after="7"), http_error(503, retry_after="2")]
+
+    assert client.search("東京 ホテル", max_retries=3) == ITEMS
+
+    # Retry-Afterの秒数だけ待ち、429のときだけ全Actor共通のリミッタも止める
+    assert sleeps == [7.0, 2.0]
+    assert blocked == [7.0]
+
+
+def test_non_retryable_error_and_exhausted_retries_are_reported(service, sleeps):
+    client = GoogleSearchClient("key", "cse", requests_per_minute=6000)
+    service.outcomes = [http_error(403)]
+    with pytest.raises(HttpError):
+        client.search("東京 ホテル")
+    assert sleeps == []
+
+    service.outcomes = [http_error(500, retry_after="1")] * 2
+    with pytest.raises(HttpError):
+        client.search("東京 ホテル", max_retries=2)
+    assert sleeps == [1.0]
+
+
+def test_google_search_tool_does_not_cache_failures(service, sleeps, monkeypatch):
+    monkeypatch.setattr(tools, "search_cache", tools.SearchCache(persist_path=""))
+    service.outcomes = [http_error(503, retry_after="1")] * 2
+
+    assert "最大リトライ回数(2回)" in tools.google_search("東京 ホテル", max_retries=2)
+    # 失敗はキャッシュせず、次の呼び出しで改めて検索する
+    assert "ホテルA" in tools.google_search("東京 ホテル", max_retries=2)
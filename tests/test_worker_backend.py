@@ -0,0 +1,222 @@
+"""
+ワーカーバックエンド（ProcessWorkerBackend / SocketWorkerBackend）のテスト
+ワーカー内のActorが呼ぶLLMはスタブに置き換え、ソケットのワーカーはプロトコルを直接話す偽のワーカーでも確認する
+"""
+
+import json
+import os
+import signal
+import socket
+import threading
+import time
+
+import litellm
+import pytest
+
+from aime import worker
+from aime.worker_backend import ProcessWorkerBackend, SocketWorkerBackend, WorkerLostError
+from aime.worker_runtime import decode_message, encode_message
+
+TASK = {"id": 2, "description": "東京のホテルを調べる", "dependencies": [], "status": "pending"}
+JOB = {"task": TASK, "persona": "旅行の専門家", "knowledge": ""}
+TIMEOUT = 60
+
+
+def fake_completion(**params):
+    """1回目は途中経過を報告し、2回目で完了するActorの応答を返す"""
+    prompt = " ".join(str(message.get("content")) for message in params["messages"])
+    if "進捗が正常に報告されました" not in prompt:
+        content = f"思考: 途中経過を報告します\n行動: update_progress[pid {os.getpid()} で途中経過]"
+    else:
+        # 途中経過の報告からワーカーを停止させるまでの猶予
+        time.sleep(0.3)
+        report = json.dumps({"status": "success", "message": f"pid {os.getpid()} で完了"}, ensure_ascii=False)
+        content = f"思考: 完了しました\n行動: finish[{report}]"
+    return litellm.ModelResponse(
+        choices=[{"message": {"role": "assistant", "content": content}}],
+        usage={"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    )
+
+
+def install_fake_llm():
+    """ワーカープロセスの initializer（spawnされたプロセスでLLMをスタブに置き換える）"""
+    litellm.completion = fake_completion
+
+
+class LogRecorder:
+    """on_log に渡し、届いた進捗ログを記録する"""
+
+    def __init__(self, on_first=None):
+        self.logs = []
+        self.on_first = on_first
+
+    def __call__(self, task_id: int, message: str):
+        self.logs.append((task_id, message))
+        if len(self.logs) == 1 and self.on_first is not None:
+            self.on_first(message)
+
+
+class FakeWorker:
+    """helloだけを送って接続し、受け取ったメッセージへの応答をテストから操作するワーカー"""
+
+    def __init__(self, address, token: str = None, slots: int = 1, heartbeat: float = None):
+        """
+        Args:
+            heartbeat: heartbeatを送る間隔（秒。Noneの場合は送らない）
+        """
+        self.sock = socket.create_connection(address, timeout=10)
+        self.reader = self.sock.makefile("r", encoding="utf-8")
+        self.send_lock = threading.Lock()
+        self.closed = threading.Event()
+        self.send({"type": "hello", "slots": slots, "pid": 0, "host": "fake", "token": token})
+        if heartbeat is not None:
+            threading.Thread(target=self._heartbeat, args=(heartbeat,), daemon=True).start()
+
+    def _heartbeat(self, interval: float):
+        while not self.closed.wait(interval):
+            try:
+                self.send({"type": "heartbeat"})
+            except OSError:
+                return
+
+    def send(self, message: dict):
+        with self.send_lock:
+            self.sock.sendall((encode_message(message) + "\n").encode("utf-8"))
+
+    def receive(self, message_type: str):
+        """指定した種類のメッセージを受け取る（接続が閉じられた場合はNone）"""
+        for line in self.reader:
+            message = decode_message(line)
+            if message["type"] == message_type:
+                return message
+        return None
+
+    def close(self):
+        self.closed.set()
+        self.reader.close()
+        self.sock.close()
+
+
+@pytest.fixture
+def socket_backend(aime_config):
+    backends = []
+
+    def build(**kwargs) -> SocketWorkerBackend:
+        backend = SocketWorkerBackend(host="127.0.0.1", port=0, local_workers=0, **kwargs)
+        backends.append(backend)
+        return backend
+
+    yield build
+    for backend in backends:
+        backend.shutdown()
+
+
+def test_process_backend_requeues_job_of_killed_worker(aime_config, monkeypatch):
+    monkeypatch.setattr(aime_config, "worker_heartbeat_interval", 0.2)
+    # 1回目の進捗ログが届いた時点で、ジョブを実行中のワーカープロセスを強制終了する
+    killed = []
+
+    def kill_worker(message: str):
+        pid = int(message.split("pid ")[1].split()[0])
+        killed.append(pid)
+        os.kill(pid, signal.SIGKILL)
+
+    recorder = LogRecorder(on_first=kill_worker)
+    backend = ProcessWorkerBackend(processes=1, slots=1, initializer=install_fake_llm, heartbeat_timeout=5, max_attempts=2)
+    try:
+        result = backend.submit(JOB, on_log=recorder).result(timeout=TIMEOUT)
+    finally:
+        backend.shutdown()
+
+    # 補充されたワーカープロセスで最初から実行し直し、進捗ログも改めて届く
+    assert '"status": "success"' in result
+    assert len(killed) == 1
+    assert f"pid {killed[0]}" not in result
+    assert len(recorder.logs) == 2
+    assert all(task_id == TASK["id"] and "途中経過" in message for task_id, message in recorder.logs)
+
+
+def test_socket_worker_runs_job_and_relays_progress(socket_backend, monkeypatch):
+    monkeypatch.setattr(litellm, "completion", fake_completion)
+    backend = socket_backend()
+    recorder = LogRecorder()
+    thread = threading.Thread(target=worker.connect, args=(*backend.address, 1), daemon=True)
+    thread.start()
+
+    result = backend.submit(JOB, on_log=recorder).result(timeout=TIMEOUT)
+
+    assert '"status": "success"' in result
+    assert recorder.logs == [(TASK["id"], recorder.logs[0][1])]
+    assert "途中経過" in recorder.logs[0][1]
+    backend.shutdown()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+
+
+def test_disconnected_worker_job_is_requeued(socket_backend):
+    backend = socket_backend(max_attempts=2)
+    first = FakeWorker(backend.address)
+    future = backend.submit(JOB)
+    job = first.receive("job")
+    assert job["task"] == TASK
+
+    first.close()
+    second = FakeWorker(backend.address)
+
+    # 切断されたワーカーが実行中だったジョブを、別のワーカーが同じジョブIDで受け取る
+    requeued = second.receive("job")
+    assert requeued["job_id"] == job["job_id"]
+    second.send({"type": "result", "job_id": job["job_id"], "result": "done"})
+    assert future.result(timeout=TIMEOUT) == "done"
+    second.close()
+
+
+def test_job_fails_when_workers_are_lost_up_to_max_attempts(socket_backend):
+    backend = socket_backend(max_attempts=1)
+    fake = FakeWorker(backend.address)
+    future = backend.submit(JOB)
+    assert fake.receive("job") is not None
+
+    fake.close()
+
+    with pytest.raises(WorkerLostError):
+        future.result(timeout=TIMEOUT)
+
+
+def test_silent_worker_is_dropped_after_heartbeat_timeout(socket_backend):
+    backend = socket_backend(heartbeat_timeout=0.5)
+    silent = FakeWorker(backend.address)
+    future = backend.submit(JOB)
+    job = silent.receive("job")
+    healthy = FakeWorker(backend.address, heartbeat=0.1)
+
+    # heartbeatを送らないワーカーは切断され、ジョブは応答するワーカーに再投入される
+    requeued = healthy.receive("job")
+    assert requeued["job_id"] == job["job_id"]
+    assert silent.receive("job") is None
+    healthy.send({"type": "result", "job_id": job["job_id"], "result": "done"})
+    assert future.result(timeout=TIMEOUT) == "done"
+    silent.close()
+    healthy.close()
+
+
+def test_socket_backend_rejects_wrong_token(socket_backend):
+    backend = socket_backend(token="secret")
+    intruder = FakeWorker(backend.address, token="wrong")
+    anonymous = FakeWorker(backend.address)
+
+    # 認証トークンが一致しない接続は、設定もジョブも受け取らずに閉じられる
+    assert intruder.receive("config") is None
+    assert anonymous.receive("config") is None
+
+    trusted = FakeWorker(backend.address, token="secret")
+    config_message = trusted.receive("config")
+    assert config_message is not None
+    # 秘密情報はワーカーに送らない
+    assert "worker_auth_token" not in config_message["values"]
+    future = backend.submit(JOB)
+    job = trusted.receive("job")
+    trusted.send({"type": "result", "job_id": job["job_id"], "result": "done"})
+    assert future.result(timeout=TIMEOUT) == "done"
+    for fake in (intruder, anonymous, trusted):
+        fake.close()